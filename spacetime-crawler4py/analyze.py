@@ -1,21 +1,18 @@
 from urllib.parse import urldefrag, urlparse
-from bs4 import BeautifulSoup
-from index_vars import URL_id_index, url_index_lock, json_index_lock
-from threading import Lock
+from index_vars import URL_id_index, json_index_lock
+from threading import Lock, local
 import os
 from index import BatchIndexer
+from duplicates import DuplicateDetector
 
 import tokenizer
 
 
 
-# globals for analysis
-unique_pages = set()
-word_freq = {}
-word_freq_lock = Lock()
+# globals for analysis; the indexer flushes batches by its memory budget
 indexer = BatchIndexer()
-BATCH_SIZE = 5500
-batch_cnt = 0
+# pages repeating an earlier one are reported instead of indexed
+duplicate_detector = DuplicateDetector()
 
 
 def get_file_size_in_kb(file_path):
@@ -30,61 +27,119 @@ def get_file_size_in_kb(file_path):
         return None
 
 
-def analysis(url, html_content):
+class CorpusStats:
+    """Unique pages and token frequencies for the report, updated in place."""
+
+    def __init__(self):
+        self.unique_pages = set()
+        self.word_freq = {}
+
+    def add_page(self, url, freq):
+        self.unique_pages.add(url)
+        self.add_freq(freq)
+
+    def add_freq(self, freq):
+        word_freq = self.word_freq
+        for token, count in freq.items():
+            word_freq[token] = word_freq.get(token, 0) + count
+
+    def merge(self, other):
+        self.unique_pages |= other.unique_pages
+        self.add_freq(other.word_freq)
+
+
+# one CorpusStats per worker thread, so pages are counted without a lock;
+# corpus_stats() combines them once for the report
+_stats_shards = []
+_stats_shards_lock = Lock()
+_thread_state = local()
+
+
+def stats_shard():
+    """The calling thread's CorpusStats."""
+    shard = getattr(_thread_state, 'stats', None)
+    if shard is None:
+        shard = _thread_state.stats = CorpusStats()
+        with _stats_shards_lock:
+            _stats_shards.append(shard)
+    return shard
+
+
+def corpus_stats():
+    """The CorpusStats of every thread combined."""
+    total = CorpusStats()
+    with _stats_shards_lock:
+        for shard in _stats_shards:
+            total.merge(shard)
+    return total
+
+
+def analysis(url, document):
     """
-    Description: Analyzes a page for the report, updating global values
-    unique_pages, word_freq, and json_index.
+    Description: Analyzes a page for the report, updating the calling
+    thread's CorpusStats and json_index.
 
-    Input: The url of the page that we are analyzing and its content
+    Input: The url of the page that we are analyzing and its ParsedDocument
     Output: None; updates global parameters
     """
-    global word_freq, unique_pages, batch_cnt
-    
-    if (batch_cnt % BATCH_SIZE == 0):
-        batch_cnt = 0
-        indexer.save_batch_to_disk()
-
     # defragment URL
     url, _ = urldefrag(url)
-    unique_pages.add(url)
 
-    # Add url to URL index while protected
-    with url_index_lock:
-        URL_id_index.add_entry(url)
-        doc_id = URL_id_index.get_id(url)
+    # do analysis outside of any lock, it only touches this page
+    freq, positions = tokenize_document(document)
 
-    soup = BeautifulSoup(html_content, 'html.parser')
+    # skip exact and near duplicates of a page already indexed
+    if duplicate_detector.check(url, document.text, freq) is not None:
+        return
 
-    # do analysis
-    text = soup.get_text(separator=' ', strip=True)
-    _ , freq = tokenizer.compute_text_frequencies(text)
+    # Add url to URL index, get_or_add is atomic
+    doc_id = URL_id_index.get_or_add(url)
 
-    # update word frequencies with lock
-    with word_freq_lock:
-        word_freq = tokenizer.union_freq(word_freq, freq)
+    # count the page in this thread's statistics, no lock needed
+    stats_shard().add_page(url, freq)
 
-    # update inverted index with lock
+    # update inverted index with lock; a full batch is swapped out for the
+    # background writer under it too
     with json_index_lock:
-        important_text = set()
-        for tag in soup.find_all(['h1', 'h2', 'h3', 'title', 'strong']):
-            tag_tokens = tokenizer.tokenize_and_stem(tag.get_text())
-            important_text.update(tag_tokens)
+        add_to_index(indexer, doc_id, freq, positions, document.important_tokens)
 
-        for token, count in freq.items():
-            fields = ['important'] if token in important_text else []
-            indexer.add_document(doc_id, token, count, fields)
-    batch_cnt += 1
+
+def tokenize_document(document):
+    """
+    Description: Tokenizes the body text of a parsed page. Does not touch
+    any shared state.
+
+    Input: The ParsedDocument of the page
+    Output: Token frequencies and token positions
+    """
+    _ , freq, positions = tokenizer.compute_text_frequencies(document.text)
+    return freq, positions
 
 
-def write_analysis_to_file(file_name='report.txt'):
+def add_to_index(target, doc_id, freq, positions, important_text):
+    """
+    Description: Adds a tokenized page to a BatchIndexer
+
+    Input: The indexer, the page's doc id, the output of tokenize_document
+    and the page's important tokens
+    Output: None; updates the indexer
+    """
+    for token, count in freq.items():
+        fields = ['important'] if token in important_text else []
+        target.add_document(doc_id, token, count, fields, positions[token])
+
+
+def write_analysis_to_file(file_name='report.txt', duplicates_file='duplicates.txt'):
     """
     Description: Writes the global report parameters into a file for us
     to reference after execution
 
-    Input: The file name to write to, defaulted to report.txt
-    Output: None; prints to file
+    Input: The file name to write to, defaulted to report.txt, and the file
+    listing the duplicate pages, defaulted to duplicates.txt
+    Output: None; prints to files
     """
-    global word_freq, unique_pages
+    duplicate_detector.write_report(duplicates_file)
+    stats = corpus_stats()
 
     with open(file_name, 'w', encoding='utf-8') as report:
         print("INVERTED INDEX RESULTS", file=report)
@@ -92,10 +147,10 @@ def write_analysis_to_file(file_name='report.txt'):
         print(file=report)
 
         # Q1 Number of indexed documents
-        print(f"Number of indexed documents: {URL_id_index.id}", file=report)
+        print(f"Number of indexed documents: {URL_id_index.live_count()}", file=report)
 
         # Q2 Number of unique tokens
-        print(f"Number of unique tokens: {len(word_freq)}", file=report)
+        print(f"Number of unique tokens: {len(stats.word_freq)}", file=report)
 
         # Q3 Size of index on disk
         index_size_kb = get_file_size_in_kb('./main_index/')
@@ -104,5 +159,19 @@ def write_analysis_to_file(file_name='report.txt'):
         else:
             print("Index file not found on disk.", file=report)
 
+        # batches of the in-memory index written out as partial runs
+        flushes = indexer.flush_stats()
+        print(f"Index batches flushed: {flushes['batches']} "
+              f"({flushes['file_bytes'] / 1024 / 1024:.1f} MB of runs from "
+              f"{flushes['estimated_bytes'] / 1024 / 1024:.1f} MB in memory, "
+              f"{flushes['write_seconds']:.2f} s writing, "
+              f"{flushes['wait_seconds']:.2f} s waiting for the writer)", file=report)
+
+        # pages not indexed because they repeat an indexed page
+        duplicates = duplicate_detector.duplicates
+        exact = sum(1 for _, _, distance in duplicates if distance is None)
+        print(f"Duplicate pages skipped: {len(duplicates)} ({exact} exact, "
+              f"{len(duplicates) - exact} near), listed in {duplicates_file}", file=report)
+
         print(file=report)
 
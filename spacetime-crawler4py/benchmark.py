@@ -0,0 +1,1043 @@
+"""
+Benchmarks for the indexing and query pipeline on synthetic data, so they
+can run without the DEV corpus.
+
+Run from spacetime-crawler4py/, e.g.
+    python benchmark.py codec --docs 50000 --terms 20000
+    python benchmark.py parse --json_dir ../DEV --limit 2000
+    python benchmark.py frontier --ops 2000
+    python benchmark.py manifest --json_dir ../DEV
+    python benchmark.py pagerank --pages 100000 --links 2000000
+    python benchmark.py query --docs 50000 --terms 20000
+    python benchmark.py impact --docs 10000 50000 200000
+    python benchmark.py segments --pages 5000 --share 0.01
+"""
+import bisect
+import contextlib
+import gc
+import io
+import json
+import os
+import random
+import shelve
+import string
+import tempfile
+import time
+from argparse import ArgumentParser
+from pathlib import Path
+
+# pip install orjson
+import orjson
+# pip install numpy
+import numpy as np
+
+from postings import decode_postings, encode_postings, from_postings_dict
+from synthetic import synthetic_postings, write_synthetic_index
+import document
+import tokenizer
+
+
+def _timed(fn, payloads):
+    start = time.perf_counter()
+    for payload in payloads:
+        fn(payload)
+    return time.perf_counter() - start
+
+
+def bench_codec(args):
+    index = synthetic_postings(args.docs, args.terms, args.seed)
+    total_postings = sum(len(p) for p in index.values())
+
+    # the previous on-disk format: one JSON object per term keyed by doc ID
+    json_payloads = [orjson.dumps({str(doc_id): {'freq': p.freq, 'fields': p.fields, 'position': None}
+                                   for doc_id, p in sorted(doc_postings.items())})
+                     for doc_postings in index.values()]
+    codec_payloads = [encode_postings(from_postings_dict(doc_postings))
+                      for doc_postings in index.values()]
+
+    json_size = sum(map(len, json_payloads))
+    codec_size = sum(map(len, codec_payloads))
+    json_time = _timed(orjson.loads, json_payloads)
+    codec_time = _timed(decode_postings, codec_payloads)
+
+    print(f"{args.terms} terms, {args.docs} docs, {total_postings} postings")
+    print(f"JSON  : {json_size / 2**20:8.2f} MB  {json_size / total_postings:5.2f} B/posting  "
+          f"decode {total_postings / json_time / 1e6:6.2f} M postings/s")
+    print(f"codec : {codec_size / 2**20:8.2f} MB  {codec_size / total_postings:5.2f} B/posting  "
+          f"decode {total_postings / codec_time / 1e6:6.2f} M postings/s")
+    print(f"size ratio {json_size / codec_size:.1f}x, decode speedup {json_time / codec_time:.1f}x")
+
+
+def synthetic_pages(num_pages, seed=0, paragraphs=8):
+    """Html pages with a title, headings, paragraphs and links."""
+    rng = random.Random(seed)
+    words = [f"w{i}" for i in range(5000)]
+    pages = []
+    for i in range(num_pages):
+        body = ''.join(f"<p>{' '.join(rng.choices(words, k=60))}</p>" for _ in range(paragraphs))
+        links = ''.join(f'<li><a href="/page{rng.randrange(num_pages)}">{rng.choice(words)}</a></li>'
+                        for _ in range(40))
+        pages.append((f"https://www.ics.uci.edu/page{i}",
+                      f"<html><head><title>{' '.join(rng.choices(words, k=5))}</title></head><body>"
+                      f"<h1>{rng.choice(words)}</h1><h2>{rng.choice(words)}</h2>{body}"
+                      f"<strong>{rng.choice(words)}</strong><ul>{links}</ul></body></html>"))
+    return pages
+
+
+def corpus_pages(json_dir, limit):
+    pages = []
+    for path in sorted(Path(json_dir).rglob('*.json'))[:limit]:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('url') and len(data.get('content', '')) >= 500:
+            pages.append((data['url'], data['content']))
+    return pages
+
+
+def _two_parses(url, html_content):
+    """What analysis + extract_next_links did before: two BeautifulSoup parses
+    and a third walk of the tree for the important tags."""
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html_content, 'html.parser')
+    text = soup.get_text(separator=' ', strip=True)
+    important = set()
+    for tag in soup.find_all(document.IMPORTANT_TAGS):
+        important.update(tokenizer.tokenize_and_stem(tag.get_text()))
+    soup = BeautifulSoup(html_content, 'html.parser')
+    hrefs = [a['href'] for a in soup.find_all('a', href=True)]
+    return text, important, hrefs
+
+
+def bench_parse(args):
+    pages = corpus_pages(args.json_dir, args.limit) if args.json_dir else synthetic_pages(args.limit)
+
+    def cpu_per_doc(fn):
+        start = time.process_time()
+        for url, html_content in pages:
+            fn(url, html_content)
+        return (time.process_time() - start) / len(pages) * 1000
+
+    baseline = cpu_per_doc(_two_parses)
+    print(f"{len(pages)} pages")
+    print(f"{'two parses (before)':24} {baseline:7.2f} ms/doc")
+    for name in document.PARSERS:
+        try:
+            document.set_parser(name)
+        except Exception as e:
+            print(f"{name:24} not available ({e})")
+            continue
+        per_doc = cpu_per_doc(document.process_document)
+        print(f"{name:24} {per_doc:7.2f} ms/doc  saves {100 * (1 - per_doc / baseline):4.1f}% CPU")
+
+
+def synthetic_texts(num_pages, seed=0, words_per_page=600):
+    """Page texts over a Zipf-like vocabulary of inflected English-like words."""
+    rng = random.Random(seed)
+    roots = [''.join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 8))) for _ in range(4000)]
+    words = [root + suffix for root in roots for suffix in ('', 's', 'ing', 'ed', 'ation', 'ly', 'ness')]
+    rng.shuffle(words)
+    weights = [1 / (i + 1) for i in range(len(words))]
+    return [' '.join(rng.choices(words, weights, k=words_per_page)) for _ in range(num_pages)]
+
+
+def _per_token_stemming(text):
+    """What compute_text_frequencies did before: the pattern compiled on
+    every call and every token occurrence stemmed through the table."""
+    import re
+    tokens = re.findall(r'\b[a-z0-9]{3,}\b', text.lower())
+    positions = {}
+    for position, token in enumerate(tokens):
+        word = tokenizer.stemmer.stem(token)
+        if word not in positions:
+            positions[word] = []
+        positions[word].append(position)
+    freq = {word: len(word_positions) for word, word_positions in positions.items()}
+    return len(tokens), freq, positions
+
+
+def bench_tokenize(args):
+    from stemmer import Stemmer
+
+    if args.json_dir:
+        texts = [document.process_document(url, html).text for url, html in corpus_pages(args.json_dir, args.limit)]
+    else:
+        texts = synthetic_texts(args.limit)
+    num_tokens = sum(len(tokenizer.tokenize(text)) for text in texts)
+
+    def tokens_per_second(fn, table_file=None):
+        tokenizer.stemmer = Stemmer()
+        # don't let the results slow the garbage collector down
+        gc.disable()
+        start = time.perf_counter()
+        tokenizer.stemmer.load(table_file)
+        results = [fn(text) for text in texts]
+        elapsed = time.perf_counter() - start
+        del results
+        gc.enable()
+        return num_tokens / elapsed
+
+    with tempfile.TemporaryDirectory() as tmp:
+        table_file = os.path.join(tmp, 'stem_table.json')
+        before = tokens_per_second(_per_token_stemming)
+        cold = tokens_per_second(tokenizer.compute_text_frequencies)
+        tokenizer.stemmer.save(table_file)
+        table_size = os.path.getsize(table_file)
+        warm = tokens_per_second(tokenizer.compute_text_frequencies, table_file)
+    tokenizer.stemmer = Stemmer()
+
+    print(f"{len(texts)} pages, {num_tokens} tokens, stem table {table_size / 1024:.0f} KB")
+    print(f"per token (before)     : {before:10,.0f} tokens/s")
+    print(f"distinct tokens, cold  : {cold:10,.0f} tokens/s  ({cold / before:.2f}x)")
+    print(f"distinct tokens, saved : {warm:10,.0f} tokens/s  ({warm / before:.2f}x)")
+
+
+def bench_stats(args):
+    from analyze import CorpusStats
+
+    # a growing vocabulary: every page brings some words no page had before
+    rng = random.Random(args.seed)
+    pages = []
+    for i in range(args.pages):
+        words = [f"w{int(rng.paretovariate(0.6))}" for _ in range(300)] + [f"new{i}_{j}" for j in range(20)]
+        pages.append((f"https://www.ics.uci.edu/page{i}", tokenizer.compute_word_frequencies(words)))
+
+    def per_page(add):
+        timings = []
+        start = time.perf_counter()
+        for i, (url, freq) in enumerate(pages, 1):
+            add(url, freq)
+            if i % (len(pages) // 4) == 0:
+                timings.append((time.perf_counter() - start) / (len(pages) // 4) * 1e6)
+                start = time.perf_counter()
+        return timings
+
+    word_freq = {}
+
+    def union(url, freq):
+        # what analysis did before, under its lock
+        nonlocal word_freq
+        word_freq = tokenizer.union_freq(word_freq, freq)
+
+    stats = CorpusStats()
+    before = per_page(union)
+    after = per_page(stats.add_page)
+    print(f"{args.pages} pages, {len(stats.word_freq)} distinct tokens at the end")
+    print(f"{'quarter':>8} {'union_freq':>12} {'in place':>10}")
+    for quarter, (a, b) in enumerate(zip(before, after), 1):
+        print(f"{quarter:8d} {a:9.1f} us {b:7.1f} us")
+
+
+def bench_frontier(args):
+    from types import SimpleNamespace
+    from crawler.frontier import Frontier
+    from utils import get_urlhash
+
+    paths = [f"/corpus/d{i % 100}/{i}.json" for i in range(args.ops)]
+    with tempfile.TemporaryDirectory() as tmp:
+        # before: every add/complete wrote the shelve and synced it
+        save = shelve.open(os.path.join(tmp, 'before.shelve'))
+        start = time.perf_counter()
+        for completed in (False, True):
+            for path in paths:
+                save[get_urlhash(path)] = (path, completed)
+                save.sync()
+        before = 2 * len(paths) / (time.perf_counter() - start)
+        save.close()
+
+        config = SimpleNamespace(json_dir=tmp, save_file=os.path.join(tmp, 'after.shelve'),
+                                 manifest_file='')
+        frontier = Frontier(config, restart=True)
+        start = time.perf_counter()
+        for path in paths:
+            frontier.add_url(path)
+        for path in paths:
+            frontier.mark_url_complete(path)
+        frontier.close()
+        after = 2 * len(paths) / (time.perf_counter() - start)
+
+    print(f"{2 * len(paths)} frontier operations")
+    print(f"shelve sync per operation : {before:10.0f} ops/s")
+    print(f"logged, batched checkpoint: {after:10.0f} ops/s  ({after / before:.1f}x)")
+
+
+def _load_every_url(json_dir):
+    """What Frontier._build_url_mapping did before: json.load every file."""
+    urls = {}
+    for json_file in Path(json_dir).rglob('*.json'):
+        with open(json_file, 'r', encoding='utf-8') as f:
+            urls[json.load(f).get('url')] = str(json_file)
+    return urls
+
+
+def bench_manifest(args):
+    from corpus_manifest import CorpusManifest
+
+    with tempfile.TemporaryDirectory() as tmp:
+        json_dir = args.json_dir
+        if json_dir is None:
+            json_dir = os.path.join(tmp, 'corpus')
+            # about 40 KB per page, like the DEV corpus
+            for i, (url, html_content) in enumerate(synthetic_pages(args.limit, paragraphs=80)):
+                os.makedirs(os.path.join(json_dir, f"d{i % 50}"), exist_ok=True)
+                with open(os.path.join(json_dir, f"d{i % 50}", f"{i}.json"), 'w', encoding='utf-8') as f:
+                    json.dump({'url': url, 'content': html_content, 'encoding': 'utf-8'}, f)
+
+        def timed(fn):
+            start = time.perf_counter()
+            fn()
+            return time.perf_counter() - start
+
+        before = timed(lambda: _load_every_url(json_dir))
+        manifest_file = os.path.join(tmp, 'manifest.json')
+        cold = timed(lambda: CorpusManifest(json_dir, manifest_file).refresh())
+        warm = timed(lambda: CorpusManifest(json_dir, manifest_file).refresh())
+
+    print(f"json.load every file    : {before:7.2f} s")
+    print(f"manifest, cold (partial): {cold:7.2f} s  ({before / cold:.1f}x)")
+    print(f"manifest, warm          : {warm:7.2f} s  ({before / warm:.1f}x)")
+
+
+def synthetic_links(num_pages, num_links, seed=0):
+    """Link graph with a few popular pages and some links to uncrawled ones."""
+    rng = np.random.default_rng(seed)
+    sources = rng.integers(0, num_pages, num_links)
+    targets = np.minimum(rng.zipf(1.5, num_links) - 1, num_pages * 11 // 10)
+    page_outlinks = {}
+    for src, dst in zip(sources.tolist(), targets.tolist()):
+        page_outlinks.setdefault(f"https://www.ics.uci.edu/page{src}", set()).add(
+            f"https://www.ics.uci.edu/page{dst}")
+    return page_outlinks
+
+
+def _nested_loop_page_rank(page_outlinks, damping=0.85, iter=5):
+    """What PageRanker._calculate_page_rank did before: a scan of every
+    outlink set for every page and iteration."""
+    pages = list(page_outlinks.keys())
+    pr = {p: 1.0 for p in pages}
+    for _ in range(iter):
+        new_pr = {}
+        for p in pages:
+            rank_sum = 0
+            for src, outlinks in page_outlinks.items():
+                if p in outlinks:
+                    rank_sum += pr[src] / len(outlinks)
+            new_pr[p] = (1 - damping) + damping * rank_sum
+        pr = new_pr
+    return pr
+
+
+def bench_pagerank(args):
+    from page_rank import PageRanker
+
+    ranker = PageRanker()
+    for url, outlinks in synthetic_links(args.pages, args.links, args.seed).items():
+        ranker.update_links(url, outlinks)
+
+    start = time.perf_counter()
+    pagerank = ranker._calculate_page_rank()
+    elapsed = time.perf_counter() - start
+    print(f"{args.pages} pages, {args.links} links")
+    print(f"sparse power iteration: {elapsed:7.2f} s for {len(pagerank)} ranked pages")
+
+    if args.pages <= 5000:
+        start = time.perf_counter()
+        _nested_loop_page_rank(ranker.page_outlinks)
+        before = time.perf_counter() - start
+        print(f"nested loops (before) : {before:7.2f} s, 5 iterations  ({before / elapsed:.0f}x)")
+
+
+def _scan_every_term(index_dir):
+    """What Query.__init__ did before: read every dictionary record to
+    compute the idf of every term up front."""
+    from binary_index import BUCKET_KEYS, BucketReader
+    idf = {}
+    for bucket_key in BUCKET_KEYS:
+        bucket = BucketReader(index_dir, bucket_key)
+        for term, entry in bucket.items():
+            idf[term] = entry.doc_freq
+        bucket.close()
+    return idf
+
+
+def bench_query(args):
+    from query import Query
+
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        vocabulary = write_synthetic_index(tmp, args.docs, args.terms, args.seed)
+        # a common word plus one to three rarer ones
+        queries = [' '.join([rng.choice(vocabulary[:50])] + rng.sample(vocabulary[:2000], rng.randint(1, 3)))
+                   for _ in range(args.queries)]
+
+        index_dir = os.path.join(tmp, 'main_index')
+        start = time.perf_counter()
+        _scan_every_term(index_dir)
+        scan_time = time.perf_counter() - start
+        start = time.perf_counter()
+        engine = Query(url_id_filename=os.path.join(tmp, 'url_id_index.bin'), index_dir=index_dir,
+                       cache_size=0)
+        startup_time = time.perf_counter() - start
+
+        results = {}
+        for exhaustive in (True, False):
+            scored = 0
+            start = time.perf_counter()
+            for q in queries:
+                engine.query(q, exhaustive)
+                scored += engine.last_query_stats['postings_scored']
+            results[exhaustive] = (time.perf_counter() - start, scored)
+        engine.lexicon.close()
+        engine.url_mapping.close()
+
+    (all_time, all_scored), (top_time, top_scored) = results[True], results[False]
+    print(f"{len(queries)} queries, {args.docs} docs, {args.terms} terms")
+    print(f"startup   : {startup_time * 1000:7.2f} ms (scanning every term first: {scan_time * 1000:.2f} ms)")
+    print(f"exhaustive: {all_scored:9d} postings scored  {all_time / len(queries) * 1000:7.2f} ms/query")
+    print(f"MaxScore  : {top_scored:9d} postings scored  {top_time / len(queries) * 1000:7.2f} ms/query  "
+          f"({all_scored / max(top_scored, 1):.1f}x fewer postings)")
+
+
+def bench_impact(args):
+    import query
+    from query import Query
+
+    print(f"{'docs':>8} {'words':>5} {'MaxScore':>12} {'impact order':>14}")
+    for num_docs in args.docs:
+        rng = random.Random(args.seed)
+        with tempfile.TemporaryDirectory() as tmp:
+            vocabulary = write_synthetic_index(tmp, num_docs, args.terms, args.seed, impact_ordered=True)
+            engine = Query(url_id_filename=os.path.join(tmp, 'url_id_index.bin'),
+                           index_dir=os.path.join(tmp, 'main_index'), cache_size=0)
+            for words in (1, 2):
+                queries = [' '.join(rng.sample(vocabulary[:100], words)) for _ in range(args.queries)]
+                timings = []
+                for max_terms in (0, query.IMPACT_MAX_TERMS):
+                    saved, query.IMPACT_MAX_TERMS = query.IMPACT_MAX_TERMS, max_terms
+                    start = time.perf_counter()
+                    for q in queries:
+                        engine.query(q)
+                    timings.append((time.perf_counter() - start) / len(queries) * 1000)
+                    query.IMPACT_MAX_TERMS = saved
+                print(f"{num_docs:8d} {words:5d} {timings[0]:9.2f} ms {timings[1]:11.2f} ms")
+            engine.lexicon.close()
+            engine.url_mapping.close()
+
+
+def bench_cache(args):
+    from query import Query
+
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        vocabulary = write_synthetic_index(tmp, args.docs, args.terms, args.seed)
+        index_dir = os.path.join(tmp, 'main_index')
+        # a Zipf-distributed stream over a pool of distinct queries, each
+        # repeat with its words shuffled and in random case
+        pool = [rng.sample(vocabulary[:2000], rng.randint(1, 3)) for _ in range(args.distinct)]
+        weights = [1 / (rank + 1) for rank in range(len(pool))]
+        stream = []
+        for words in rng.choices(pool, weights, k=args.queries):
+            words = rng.sample(words, len(words))
+            stream.append(' '.join(w.upper() if rng.random() < 0.5 else w for w in words))
+
+        timings = []
+        for cache_size in (0, args.cache_size):
+            engine = Query(url_id_filename=os.path.join(tmp, 'url_id_index.bin'), index_dir=index_dir,
+                           cache_size=cache_size)
+            start = time.perf_counter()
+            for q in stream:
+                engine.query(q)
+            timings.append((time.perf_counter() - start) / len(stream) * 1000)
+        stats = engine.result_cache.stats()
+        engine.lexicon.close()
+        engine.url_mapping.close()
+
+    print(f"{len(stream)} queries over {len(pool)} distinct, {args.docs} docs, cache of {args.cache_size}")
+    print(f"uncached: {timings[0]:7.3f} ms/query")
+    print(f"cached  : {timings[1]:7.3f} ms/query  ({timings[0] / timings[1]:.1f}x), "
+          f"hit rate {stats['hit_rate']:.1%}, {stats['evictions']} evictions")
+
+
+def bench_postings_cache(args):
+    from query import Query
+
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        vocabulary = write_synthetic_index(tmp, args.docs, args.terms, args.seed)
+        # Zipf-popular queries over the common terms, interleaved with
+        # one-off scans of rare terms that a recency-only policy lets in
+        popular = vocabulary[:500]
+        weights = [1 / (rank + 1) for rank in range(len(popular))]
+        rare = iter(rng.sample(vocabulary[500:], min(len(vocabulary) - 500, args.queries)))
+        stream = []
+        for i in range(args.queries):
+            if i % 4 == 3:
+                stream.append(next(rare, popular[-1]))
+            else:
+                stream.append(' '.join(rng.choices(popular, weights, k=rng.randint(1, 3))))
+
+        print(f"{len(stream)} queries, {args.docs} docs, postings cache of {args.budget_mb} MB")
+        print(f"{'policy':>8} {'ms/query':>9} {'fetch ms/query':>15} {'hit rate':>9} {'cached MB':>10} "
+              f"{'evictions':>10}")
+        for budget_mb, policy in [(0, 'lru')] + [(args.budget_mb, policy) for policy in ('lru', 'lfu', 'arc')]:
+            engine = Query(url_id_filename=os.path.join(tmp, 'url_id_index.bin'),
+                           index_dir=os.path.join(tmp, 'main_index'), cache_size=0,
+                           postings_cache_mb=budget_mb, postings_cache_policy=policy)
+            # time spent getting decoded postings, the part the cache saves
+            fetch_time = [0.0]
+            get_postings = engine._get_postings
+
+            def timed_get_postings(word):
+                start = time.perf_counter()
+                postings = get_postings(word)
+                fetch_time[0] += time.perf_counter() - start
+                return postings
+
+            engine._get_postings = timed_get_postings
+            start = time.perf_counter()
+            for q in stream:
+                engine.query(q)
+            elapsed = (time.perf_counter() - start) / len(stream) * 1000
+            fetch = fetch_time[0] / len(stream) * 1000
+            stats = engine.cache_stats()['postings']
+            print(f"{policy if budget_mb else 'none':>8} {elapsed:9.3f} {fetch:15.3f} {stats['hit_rate']:9.1%} "
+                  f"{stats['bytes'] / 2 ** 20:10.2f} {stats['evictions']:10d}")
+            engine.lexicon.close()
+            engine.url_mapping.close()
+
+
+def bench_batch(args):
+    from query import Query
+
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        vocabulary = write_synthetic_index(tmp, args.docs, args.terms, args.seed)
+        # an evaluation set: a common word plus one to three rarer ones
+        queries = [' '.join([rng.choice(vocabulary[:50])] + rng.sample(vocabulary[:2000], rng.randint(1, 3)))
+                   for _ in range(args.queries)]
+        engine = Query(url_id_filename=os.path.join(tmp, 'url_id_index.bin'),
+                       index_dir=os.path.join(tmp, 'main_index'), cache_size=0)
+
+        start = time.perf_counter()
+        for q in queries:
+            engine.query(q)
+        loop_time = time.perf_counter() - start
+        engine.postings_cache.clear()
+        start = time.perf_counter()
+        engine.query_batch(queries)
+        batch_time = time.perf_counter() - start
+        engine.lexicon.close()
+        engine.url_mapping.close()
+
+    print(f"{len(queries)} queries, {args.docs} docs")
+    print(f"query loop : {len(queries) / loop_time:8.1f} queries/s")
+    print(f"query_batch: {len(queries) / batch_time:8.1f} queries/s  ({loop_time / batch_time:.1f}x)")
+
+
+def _wait_for_server(url, timeout=30):
+    from urllib.error import URLError
+    from urllib.request import urlopen
+
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            urlopen(url).read()
+            return
+        except (URLError, ConnectionError):
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+def bench_serve(args):
+    """Needs flask and the async extra: pip install "flask[async]"."""
+    import subprocess
+    import sys
+    from concurrent.futures import ThreadPoolExecutor
+    from urllib.parse import quote
+    from urllib.request import urlopen
+
+    serve_script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'interface', 'serve.py')
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        # served from tmp, where the default index paths of Query point
+        vocabulary = write_synthetic_index(tmp, args.docs, args.terms, args.seed)
+        # distinct queries, so every request is ranked rather than cached
+        queries = list({' '.join(rng.sample(vocabulary[:2000], rng.randint(2, 3))) for _ in range(args.requests)})
+
+        print(f"{len(queries)} requests, {args.concurrency} concurrent clients, {os.cpu_count()} cores")
+        for workers in args.workers:
+            server = subprocess.Popen([sys.executable, serve_script, '--port', str(args.port),
+                                       '--workers', str(workers)], cwd=tmp,
+                                      stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            base = f"http://127.0.0.1:{args.port}/api/search?q="
+            try:
+                _wait_for_server(base + 'warmup')
+                start = time.perf_counter()
+                with ThreadPoolExecutor(args.concurrency) as pool:
+                    replies = list(pool.map(lambda q: orjson.loads(urlopen(base + quote(q)).read()), queries))
+                elapsed = time.perf_counter() - start
+            finally:
+                server.terminate()
+                server.wait()
+            answered = sum('results' in reply for reply in replies)
+            print(f"{workers:3d} workers: {len(queries) / elapsed:8.1f} requests/s ({answered} answered)")
+
+
+def bench_static(args):
+    from binary_index import URLFileReader, write_static_scores
+    from query import Query
+
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        vocabulary = write_synthetic_index(tmp, args.docs, args.terms, args.seed)
+        url_file = os.path.join(tmp, 'url_id_index.bin')
+        urls = [f"https://www.ics.uci.edu/page{i}" for i in range(1, args.docs + 1)]
+        ranks = [rng.random() * 3 for _ in urls]
+        page_rank_file = os.path.join(tmp, 'page_rank.json')
+        with open(page_rank_file, 'wb') as f:
+            f.write(orjson.dumps(dict(zip(urls, ranks))))
+        static_file = os.path.join(tmp, 'static_scores.bin')
+        write_static_scores(static_file, ranks)
+
+        # page rank of every candidate, by url as before and by doc ID
+        candidates = list(range(1, args.docs + 1))
+        url_mapping = URLFileReader(url_file)
+        with open(page_rank_file, 'rb') as f:
+            page_rank = orjson.loads(f.read())
+        url_time = _timed(lambda doc: page_rank.get(url_mapping.get(doc), 0), candidates)
+        url_mapping.close()
+
+        start = time.perf_counter()
+        engine = Query(url_id_filename=url_file, index_dir=os.path.join(tmp, 'main_index'),
+                       static_scores_filename=static_file, cache_size=0)
+        open_time = time.perf_counter() - start
+        values = engine.static_scores.values
+        doc_time = _timed(lambda doc: values[doc], candidates)
+
+        queries = [' '.join(rng.sample(vocabulary[:50], 2)) for _ in range(args.queries)]
+        start = time.perf_counter()
+        for q in queries:
+            engine.query(q, exhaustive=True)
+        query_time = (time.perf_counter() - start) / len(queries) * 1000
+        engine.lexicon.close()
+        engine.url_mapping.close()
+        engine.static_scores.close()
+
+    print(f"{args.docs} docs")
+    print(f"by url   : {url_time / len(candidates) * 1e9:7.1f} ns/candidate")
+    print(f"by doc ID: {doc_time / len(candidates) * 1e9:7.1f} ns/candidate  ({url_time / doc_time:.1f}x)")
+    print(f"Query open with static scores: {open_time * 1000:.2f} ms; "
+          f"exhaustive 2-term query: {query_time:.2f} ms")
+
+
+def bench_conjunctive(args):
+    from query import Query
+
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        vocabulary = write_synthetic_index(tmp, args.docs, args.terms, args.seed)
+        # one rare word and one of the most common ones
+        pairs = [(rng.choice(vocabulary[100:2000]), rng.choice(vocabulary[:5])) for _ in range(args.queries)]
+        # no postings cache, so every query reads its lists from the index
+        engine = Query(url_id_filename=os.path.join(tmp, 'url_id_index.bin'),
+                       index_dir=os.path.join(tmp, 'main_index'), cache_size=0, postings_cache_mb=0)
+
+        # the rare word queried on its own, as the cost to aim for
+        rare_postings = 0
+        start = time.perf_counter()
+        for rare, _ in pairs:
+            engine.query(rare, conjunctive=True)
+            rare_postings += engine.last_query_stats['postings_scored']
+        rare_time = time.perf_counter() - start
+        results = {}
+        for conjunctive in (False, True):
+            decoded = fallbacks = 0
+            start = time.perf_counter()
+            for rare, common in pairs:
+                engine.query(f"{rare} {common}", conjunctive=conjunctive)
+                # OR decodes every list in full, AND only the blocks it probes
+                decoded += engine.last_query_stats['postings_scored' if conjunctive else 'postings_total']
+            elapsed = time.perf_counter() - start
+            if conjunctive:
+                fallbacks = sum(len(engine._score_conjunctive([rare, common], [], [], 5)) < 5
+                                for rare, common in pairs)
+            results[conjunctive] = (elapsed, decoded, fallbacks)
+        engine.lexicon.close()
+        engine.url_mapping.close()
+
+    (or_time, or_decoded, _), (and_time, and_decoded, fallbacks) = results[False], results[True]
+    print(f"{len(pairs)} rare + common word queries, {args.docs} docs; "
+          f"{fallbacks} fell back to OR for too few matches")
+    print(f"rare word alone: {rare_postings:9d} postings  {rare_time / len(pairs) * 1000:7.2f} ms/query")
+    print(f"OR (MaxScore)  : {or_decoded:9d} postings  {or_time / len(pairs) * 1000:7.2f} ms/query")
+    print(f"AND            : {and_decoded:9d} postings  {and_time / len(pairs) * 1000:7.2f} ms/query  "
+          f"({or_time / and_time:.1f}x faster than OR)")
+
+
+def bench_flush(args):
+    from analyze import add_to_index, tokenize_document
+    from index import BatchIndexer
+
+    pages = synthetic_pages(args.docs, paragraphs=args.paragraphs)
+
+    def ingest(batch_mb, docs_per_batch=None):
+        with tempfile.TemporaryDirectory() as tmp:
+            indexer = BatchIndexer(output_dir=os.path.join(tmp, 'main_index'), temp_dir=os.path.join(tmp, 'temp'),
+                                   batch_mb=batch_mb)
+            stalls = []
+            start = time.perf_counter()
+            for doc_id, (url, html_content) in enumerate(pages, 1):
+                # parsing and tokenizing is the work the writer runs alongside
+                parsed = document.process_document(url, html_content)
+                freq, positions = tokenize_document(parsed)
+                added = time.perf_counter()
+                add_to_index(indexer, doc_id, freq, positions, parsed.important_tokens)
+                if docs_per_batch and doc_id % docs_per_batch == 0:
+                    indexer.save_batch_to_disk()
+                stalls.append(time.perf_counter() - added)
+            indexer.save_batch_to_disk()
+            elapsed = time.perf_counter() - start
+        stalls.sort()
+        return elapsed, stalls[len(stalls) * 99 // 100], stalls[-1], indexer.flush_stats()
+
+    # as before: a synchronous flush every docs_per_batch documents
+    before = ingest(1 << 20, args.docs_per_batch)
+    batch_mb = before[3]['estimated_bytes'] / before[3]['batches'] / 2 ** 20
+    after = ingest(batch_mb)
+
+    print(f"{args.docs} pages, about {batch_mb:.1f} MB per batch; stalls are add_to_index time per page")
+    print(f"{'flushing':>22} {'total s':>8} {'p99 ms':>7} {'max ms':>7} {'batches':>8} {'write s':>8} "
+          f"{'blocked s':>10}")
+    # a synchronous flush blocks for the whole write, a background one only
+    # while waiting for the writer
+    for label, (elapsed, p99, worst, flushes), blocked in (
+            (f"every {args.docs_per_batch} docs", before, before[3]['write_seconds']),
+            (f"{batch_mb:.1f} MB, background", after, after[3]['wait_seconds'])):
+        print(f"{label:>22} {elapsed:8.2f} {p99 * 1000:7.2f} {worst * 1000:7.1f} {flushes['batches']:8d} "
+              f"{flushes['write_seconds']:8.2f} {blocked:10.2f}")
+
+
+def pages_with_duplicates(num_pages, duplicate_share, seed=0):
+    """synthetic_pages where duplicate_share of the pages copy an earlier
+    page under a new url: half exactly, half with a few words changed.
+    Returns the pages and {url of a copy: 'exact' or 'near'}."""
+    rng = random.Random(seed)
+    pages = synthetic_pages(num_pages, seed)
+    copies = {}
+    replaced = set(rng.sample(range(1, num_pages), int(num_pages * duplicate_share)))
+    kept = [i for i in range(num_pages) if i not in replaced]
+    for i in sorted(replaced):
+        url, html_content = pages[i]
+        # copy a page that stays as it is, from before this one
+        original = pages[rng.choice(kept[:bisect.bisect(kept, i)])][1]
+        if rng.random() < 0.5:
+            pages[i] = (url, original)
+            copies[url] = 'exact'
+        else:
+            # a new timestamp line, as on a calendar or listing page
+            pages[i] = (url, original.replace('<ul>', f"<p>updated {rng.randrange(10 ** 6)} w{rng.randrange(5000)}</p><ul>"))
+            copies[url] = 'near'
+    return pages, copies
+
+
+def bench_duplicates(args):
+    from analyze import add_to_index, tokenize_document
+    from duplicates import DuplicateDetector
+    from index import BatchIndexer
+
+    pages, copies = pages_with_duplicates(args.pages, args.share, args.seed)
+    tokenized = []
+    start = time.perf_counter()
+    for url, html_content in pages:
+        parsed = document.process_document(url, html_content)
+        tokenized.append((url, parsed, *tokenize_document(parsed)))
+    tokenize_time = time.perf_counter() - start
+
+    def ingest(max_distance):
+        detector = DuplicateDetector(max_distance)
+        check_time = 0
+        with tempfile.TemporaryDirectory() as tmp:
+            indexer = BatchIndexer(output_dir=os.path.join(tmp, 'main_index'), temp_dir=os.path.join(tmp, 'temp'))
+            start = time.perf_counter()
+            for doc_id, (url, parsed, freq, positions) in enumerate(tokenized, 1):
+                checked = time.perf_counter()
+                duplicate = detector.check(url, parsed.text, freq) is not None
+                check_time += time.perf_counter() - checked
+                if not duplicate:
+                    add_to_index(indexer, doc_id, freq, positions, parsed.important_tokens)
+            indexer.save_batch_to_disk()
+            with contextlib.redirect_stdout(io.StringIO()):
+                indexer.merge_all_buckets(workers=1)
+            index_time = time.perf_counter() - start
+            index_bytes = sum(path.stat().st_size for path in Path(indexer.output_dir).rglob('*') if path.is_file())
+        return detector.duplicates, check_time, index_time, index_bytes
+
+    print(f"{args.pages} pages, {len(copies)} copies ({sum(kind == 'exact' for kind in copies.values())} exact); "
+          f"parsing and tokenizing {tokenize_time / args.pages * 1e6:.0f} us/page")
+    print(f"{'max bits':>9} {'skipped':>8} {'exact':>6} {'near':>5} {'missed':>7} {'false':>6} "
+          f"{'check us/page':>14} {'overhead':>9} {'index s':>8} {'index MB':>9}")
+    for max_distance in (-1, 0, args.max_distance):
+        duplicates, check_time, index_time, index_bytes = ingest(max_distance)
+        flagged = {url for url, _, _ in duplicates}
+        exact = sum(distance is None for _, _, distance in duplicates)
+        missed = sum(url not in flagged for url in copies)
+        false = sum(url not in copies for url in flagged)
+        # share of the time to parse, tokenize and index a page spent checking it
+        overhead = check_time / (tokenize_time + index_time)
+        print(f"{max_distance:9d} {len(duplicates):8d} {exact:6d} {len(duplicates) - exact:5d} {missed:7d} "
+              f"{false:6d} {check_time / args.pages * 1e6:14.0f} {overhead:9.1%} {index_time:8.2f} "
+              f"{index_bytes / 2 ** 20:9.2f}")
+
+
+def bench_segments(args):
+    import threading
+    from configparser import ConfigParser
+    import launch
+    from query import Query
+    from segments import SegmentSet, read_segments
+
+    rng = random.Random(args.seed)
+    pages = synthetic_pages(args.pages + args.updates * args.pages, args.seed)
+    fresh = iter(pages[args.pages:])
+    cparser = ConfigParser()
+    cparser.read('config.ini')
+    cparser['LOCAL PROPERTIES']['INGESTMODE'] = 'processes'
+    # every page of the update is indexed, whatever it resembles
+    cparser['INDEX']['DUPLICATEBITS'] = '-1'
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        json_dir = os.path.join(tmp, 'corpus')
+        os.makedirs(json_dir)
+
+        def write_page(name, url, html_content):
+            with open(os.path.join(json_dir, name), 'w', encoding='utf-8') as f:
+                json.dump({'url': url, 'content': html_content, 'encoding': 'utf-8'}, f)
+
+        for i, (url, html_content) in enumerate(pages[:args.pages]):
+            write_page(f"{i}.json", url, html_content)
+        with open(os.path.join(tmp, 'config.ini'), 'w') as f:
+            cparser.write(f)
+
+        def timed(fn):
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                fn()
+            return time.perf_counter() - start
+
+        def query_ms():
+            engine = Query(cache_size=0, postings_cache_mb=0)
+            queries = [' '.join(rng.choices([f"w{i}" for i in range(200)], k=2)) for _ in range(args.queries)]
+            return timed(lambda: [engine.query(q, exhaustive=True) for q in queries]) / len(queries) * 1000
+
+        def segment_count():
+            return len(read_segments('main_index')['segments'])
+
+        os.chdir(tmp)
+        try:
+            full = timed(lambda: launch.main('config.ini', True, json_dir))
+            print(f"{args.pages} pages; each update adds {args.share:.1%} of them and changes and removes "
+                  f"half as many each")
+            print(f"{'step':>10} {'s':>7} {'of full':>8} {'segments':>9} {'query ms':>9}")
+            print(f"{'full':>10} {full:7.2f} {1:8.1%} {segment_count():9d} {query_ms():9.2f}")
+            changes = max(1, int(args.pages * args.share))
+            for update in range(1, args.updates + 1):
+                files = sorted(os.listdir(json_dir))
+                picked = rng.sample(files, changes)
+                for name in picked[:changes // 2]:
+                    os.remove(os.path.join(json_dir, name))
+                for name in picked[changes // 2:]:
+                    with open(os.path.join(json_dir, name), encoding='utf-8') as f:
+                        page = json.load(f)
+                    write_page(name, page['url'], page['content'].replace('</body>', f"<p>edit {update}</p></body>"))
+                for i in range(changes):
+                    url, html_content = next(fresh)
+                    write_page(f"u{update}_{i}.json", url, html_content)
+                seconds = timed(lambda: launch.main('config.ini', True, json_dir, incremental=True))
+                # background merges started by the update
+                for thread in threading.enumerate():
+                    if thread is not threading.current_thread() and not thread.daemon:
+                        thread.join()
+                print(f"{'update ' + str(update):>10} {seconds:7.2f} {seconds / full:8.1%} {segment_count():9d} "
+                      f"{query_ms():9.2f}")
+            merge = timed(lambda: SegmentSet('main_index').merge(force=True))
+            print(f"{'merge':>10} {merge:7.2f} {merge / full:8.1%} {segment_count():9d} {query_ms():9.2f}")
+        finally:
+            os.chdir(cwd)
+
+
+# share of English words starting with each letter, roughly
+INITIAL_LETTER_WEIGHTS = {
+    'a': 5.7, 'b': 6.0, 'c': 9.4, 'd': 6.1, 'e': 3.9, 'f': 4.1, 'g': 3.3, 'h': 3.7, 'i': 3.9, 'j': 1.1,
+    'k': 1.0, 'l': 3.1, 'm': 5.6, 'n': 2.2, 'o': 2.5, 'p': 7.7, 'q': 0.5, 'r': 6.0, 's': 11.0, 't': 5.0,
+    'u': 2.9, 'v': 1.5, 'w': 2.7, 'x': 0.1, 'y': 0.4, 'z': 0.3,
+}
+
+
+def bench_shards(args):
+    from index import BatchIndexer
+    from binary_index import read_index_manifest
+
+    rng = random.Random(args.seed)
+    letters = list(INITIAL_LETTER_WEIGHTS)
+    initials = rng.choices(letters, [INITIAL_LETTER_WEIGHTS[c] for c in letters], k=args.terms)
+    vocabulary = sorted({c + ''.join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 9))) for c in initials})
+    rng.shuffle(vocabulary)
+    weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+    documents = [set(rng.choices(vocabulary, weights, k=args.doc_terms)) for _ in range(args.docs)]
+
+    print(f"{args.docs} docs, {len(vocabulary)} terms with English first-letter frequencies")
+    print(f"{'layout':>14} {'shards':>7} {'largest MB':>11} {'mean MB':>8} {'largest/mean':>13} {'merge s':>8}")
+    for label, shard_mb in (("first letter", 1 << 20), (f"{args.shard_mb} MB shards", args.shard_mb)):
+        with tempfile.TemporaryDirectory() as tmp:
+            indexer = BatchIndexer(output_dir=os.path.join(tmp, 'main_index'), temp_dir=os.path.join(tmp, 'temp'))
+            for doc_id, tokens in enumerate(documents, 1):
+                for token in tokens:
+                    indexer.add_document(doc_id, token, 1, 0)
+                if doc_id % args.batch == 0:
+                    indexer.save_batch_to_disk()
+            indexer.save_batch_to_disk()
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                indexer.merge_all_buckets(workers=1, shard_mb=shard_mb)
+            merge_time = time.perf_counter() - start
+
+            sizes = [shard['bytes'] / 2 ** 20 for shard in read_index_manifest(indexer.output_dir)]
+        mean = sum(sizes) / len(sizes)
+        print(f"{label:>14} {len(sizes):7d} {max(sizes):11.2f} {mean:8.2f} {max(sizes) / mean:13.1f} "
+              f"{merge_time:8.2f}")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    codec = subparsers.add_parser("codec", help="postings size and decode throughput, JSON vs codec")
+    codec.add_argument("--docs", type=int, default=50000)
+    codec.add_argument("--terms", type=int, default=20000)
+    codec.add_argument("--seed", type=int, default=0)
+    codec.set_defaults(func=bench_codec)
+
+    parse = subparsers.add_parser("parse", help="CPU per document, two parses vs process_document")
+    parse.add_argument("--json_dir", type=str, default=None, help="corpus to sample, synthetic if omitted")
+    parse.add_argument("--limit", type=int, default=1000)
+    parse.set_defaults(func=bench_parse)
+
+    tokenize = subparsers.add_parser("tokenize", help="tokens per second, per-token vs distinct-token stemming")
+    tokenize.add_argument("--json_dir", type=str, default=None, help="corpus to sample, synthetic if omitted")
+    tokenize.add_argument("--limit", type=int, default=2000)
+    tokenize.set_defaults(func=bench_tokenize)
+
+    stats = subparsers.add_parser("stats", help="time per page to update corpus statistics, union_freq vs in place")
+    stats.add_argument("--pages", type=int, default=4000)
+    stats.add_argument("--seed", type=int, default=0)
+    stats.set_defaults(func=bench_stats)
+
+    frontier = subparsers.add_parser("frontier", help="frontier add/complete operations per second")
+    frontier.add_argument("--ops", type=int, default=2000, help="urls added, then marked complete")
+    frontier.set_defaults(func=bench_frontier)
+
+    manifest = subparsers.add_parser("manifest", help="startup url mapping, full reads vs corpus manifest")
+    manifest.add_argument("--json_dir", type=str, default=None, help="corpus to scan, synthetic if omitted")
+    manifest.add_argument("--limit", type=int, default=5000, help="synthetic pages")
+    manifest.set_defaults(func=bench_manifest)
+
+    pagerank = subparsers.add_parser("pagerank", help="PageRank time on a synthetic link graph")
+    pagerank.add_argument("--pages", type=int, default=100000)
+    pagerank.add_argument("--links", type=int, default=2000000)
+    pagerank.add_argument("--seed", type=int, default=0)
+    pagerank.set_defaults(func=bench_pagerank)
+
+    query = subparsers.add_parser("query", help="postings scored and latency, exhaustive vs top-k pruning")
+    query.add_argument("--docs", type=int, default=50000)
+    query.add_argument("--terms", type=int, default=20000)
+    query.add_argument("--queries", type=int, default=200)
+    query.add_argument("--seed", type=int, default=0)
+    query.set_defaults(func=bench_query)
+
+    impact = subparsers.add_parser("impact", help="short query latency as the corpus grows, impact order vs MaxScore")
+    impact.add_argument("--docs", type=int, nargs="+", default=[10000, 50000, 200000])
+    impact.add_argument("--terms", type=int, default=2000)
+    impact.add_argument("--queries", type=int, default=100)
+    impact.add_argument("--seed", type=int, default=0)
+    impact.set_defaults(func=bench_impact)
+
+    cache = subparsers.add_parser("cache", help="latency of a skewed query stream with and without the result cache")
+    cache.add_argument("--docs", type=int, default=50000)
+    cache.add_argument("--terms", type=int, default=20000)
+    cache.add_argument("--queries", type=int, default=5000)
+    cache.add_argument("--distinct", type=int, default=1000)
+    cache.add_argument("--cache_size", type=int, default=256)
+    cache.add_argument("--seed", type=int, default=0)
+    cache.set_defaults(func=bench_cache)
+
+    postings_cache = subparsers.add_parser("postings_cache", help="query latency and hit rate per postings cache policy")
+    postings_cache.add_argument("--docs", type=int, default=50000)
+    postings_cache.add_argument("--terms", type=int, default=20000)
+    postings_cache.add_argument("--queries", type=int, default=4000)
+    postings_cache.add_argument("--budget_mb", type=int, default=4)
+    postings_cache.add_argument("--seed", type=int, default=0)
+    postings_cache.set_defaults(func=bench_postings_cache)
+
+    batch = subparsers.add_parser("batch", help="queries per second, query() loop vs query_batch")
+    batch.add_argument("--docs", type=int, default=50000)
+    batch.add_argument("--terms", type=int, default=20000)
+    batch.add_argument("--queries", type=int, default=2000)
+    batch.add_argument("--seed", type=int, default=0)
+    batch.set_defaults(func=bench_batch)
+
+    serve = subparsers.add_parser("serve", help="requests per second of interface/serve.py by worker processes")
+    serve.add_argument("--docs", type=int, default=50000)
+    serve.add_argument("--terms", type=int, default=20000)
+    serve.add_argument("--requests", type=int, default=1000)
+    serve.add_argument("--concurrency", type=int, default=16)
+    serve.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    serve.add_argument("--port", type=int, default=5077)
+    serve.add_argument("--seed", type=int, default=0)
+    serve.set_defaults(func=bench_serve)
+
+    shards = subparsers.add_parser("shards", help="shard size balance, first-letter buckets vs size-balanced shards")
+    shards.add_argument("--docs", type=int, default=20000)
+    shards.add_argument("--terms", type=int, default=50000)
+    shards.add_argument("--doc_terms", type=int, default=60, help="term draws per document")
+    shards.add_argument("--batch", type=int, default=5000, help="documents per partial run")
+    shards.add_argument("--shard_mb", type=float, default=0.25)
+    shards.add_argument("--seed", type=int, default=0)
+    shards.set_defaults(func=bench_shards)
+
+    conjunctive = subparsers.add_parser("conjunctive", help="rare + common word query cost, AND vs OR vs the rare list")
+    conjunctive.add_argument("--docs", type=int, default=200000)
+    conjunctive.add_argument("--terms", type=int, default=5000)
+    conjunctive.add_argument("--queries", type=int, default=100)
+    conjunctive.add_argument("--seed", type=int, default=0)
+    conjunctive.set_defaults(func=bench_conjunctive)
+
+    flush = subparsers.add_parser("flush", help="per-document stalls, synchronous vs background batch flushes")
+    flush.add_argument("--docs", type=int, default=2000)
+    flush.add_argument("--docs_per_batch", type=int, default=500)
+    flush.add_argument("--paragraphs", type=int, default=8, help="60-word paragraphs per synthetic page")
+    flush.set_defaults(func=bench_flush)
+
+    duplicates = subparsers.add_parser("duplicates", help="duplicate detection cost, accuracy and index size saved")
+    duplicates.add_argument("--pages", type=int, default=3000)
+    duplicates.add_argument("--share", type=float, default=0.2, help="share of pages copying an earlier one")
+    duplicates.add_argument("--max_distance", type=int, default=3)
+    duplicates.add_argument("--seed", type=int, default=0)
+    duplicates.set_defaults(func=bench_duplicates)
+
+    segments = subparsers.add_parser("segments", help="incremental update and merge time against a full build")
+    segments.add_argument("--pages", type=int, default=5000)
+    segments.add_argument("--share", type=float, default=0.01, help="share of the pages added by each update")
+    segments.add_argument("--updates", type=int, default=5)
+    segments.add_argument("--queries", type=int, default=200)
+    segments.add_argument("--seed", type=int, default=0)
+    segments.set_defaults(func=bench_segments)
+
+    static = subparsers.add_parser("static", help="page rank per candidate, by url vs doc ID indexed array")
+    static.add_argument("--docs", type=int, default=200000)
+    static.add_argument("--terms", type=int, default=5000)
+    static.add_argument("--queries", type=int, default=50)
+    static.add_argument("--seed", type=int, default=0)
+    static.set_defaults(func=bench_static)
+
+    args = parser.parse_args()
+    args.func(args)
@@ -0,0 +1,448 @@
+import mmap
+import os
+import string
+import struct
+import time
+from bisect import bisect_right
+from collections import namedtuple
+
+# pip install orjson
+import orjson
+# pip install numpy
+import numpy as np
+
+from postings import decode_postings, probe_postings
+
+# File layout of a bucket's term dictionary (bucket_<key>.terms):
+#   header  : magic, version, number of terms
+#   records : one fixed-size record per term, sorted by term bytes
+#   blob    : utf-8 bytes of every term, in record order
+# Each record points into the blob for its term and into the bucket's
+# postings file (bucket_<key>.postings) for the term's postings payload.
+# Indexes built with the optional impact-ordered layout also have a
+# bucket_<key>.impacts file with each term's postings in impact order.
+# Together the dictionaries of all buckets are the lexicon (see Lexicon).
+# The merge may split a first-character bucket into several shards, each a
+# contiguous term range with the same layout, named bucket_<shard key>.*;
+# the index manifest lists them (see write_index_manifest). Shard files are
+# never rewritten in place: every full build writes a new directory and the
+# manifest then points to it, so readers mapping the old files keep them.
+MAGIC = b'TDIC'
+VERSION = 4
+HEADER = struct.Struct('<4sII')
+# term offset, term length, document frequency, collection frequency,
+# postings offset, postings length, largest term weight of any posting
+# (an upper bound for pruning), impact-ordered postings offset and length
+# (0 without the impact-ordered layout)
+RECORD = struct.Struct('<IHIIQIfQI')
+# float32 rounding must not lower a stored upper bound
+ROUND_UP = 1 + 2 ** -20
+
+BUCKET_KEYS = list(string.ascii_lowercase) + ['0-9']
+
+# per-term statistics of a dictionary record
+TermEntry = namedtuple('TermEntry', ['doc_freq', 'coll_freq', 'offset', 'length', 'max_weight',
+                                     'impact_offset', 'impact_length'])
+
+
+def bucket_key(term):
+    """Return which bucket a term belongs to"""
+    first_char = term[0].lower()
+    return first_char if first_char.isalpha() else '0-9'
+
+
+def terms_filename(index_dir, bucket_key):
+    return os.path.join(index_dir, f'bucket_{bucket_key}.terms')
+
+
+def postings_filename(index_dir, bucket_key):
+    return os.path.join(index_dir, f'bucket_{bucket_key}.postings')
+
+
+def impacts_filename(index_dir, bucket_key):
+    return os.path.join(index_dir, f'bucket_{bucket_key}.impacts')
+
+
+class BucketWriter:
+    """
+    Writes one bucket's binary layout. Terms must be added in sorted order;
+    postings payloads are streamed straight to disk and only the (small)
+    dictionary records are kept in memory until close(). With
+    impact_ordered, every term also needs its impact-ordered payload.
+    """
+
+    def __init__(self, index_dir, bucket_key, impact_ordered=False):
+        self.terms_path = terms_filename(index_dir, bucket_key)
+        self.postings_file = open(postings_filename(index_dir, bucket_key), 'wb')
+        self.impacts_file = open(impacts_filename(index_dir, bucket_key), 'wb') if impact_ordered else None
+        self.records = []
+        self.blob = bytearray()
+        self.offset = 0
+        self.impact_offset = 0
+        self.last_term = None
+
+    def add_term(self, term, doc_freq, payload, max_weight=0.0, coll_freq=0, impact_payload=b''):
+        """Append the postings payload (bytes) for term."""
+        term_bytes = term.encode('utf-8')
+        if self.last_term is not None and term_bytes <= self.last_term:
+            raise ValueError(f"Terms must be added in sorted order: {term!r}")
+        self.last_term = term_bytes
+
+        self.records.append((len(self.blob), len(term_bytes), doc_freq, coll_freq, self.offset,
+                             len(payload), max_weight * ROUND_UP, self.impact_offset, len(impact_payload)))
+        self.blob += term_bytes
+        self.postings_file.write(payload)
+        self.offset += len(payload)
+        if self.impacts_file is not None:
+            self.impacts_file.write(impact_payload)
+            self.impact_offset += len(impact_payload)
+
+    def close(self):
+        self.postings_file.close()
+        if self.impacts_file is not None:
+            self.impacts_file.close()
+        with open(self.terms_path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, len(self.records)))
+            for record in self.records:
+                f.write(RECORD.pack(*record))
+            f.write(self.blob)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+MANIFEST_VERSION = 1
+
+
+def index_manifest_filename(index_dir):
+    return os.path.join(index_dir, 'index_manifest.json')
+
+
+def write_index_manifest(index_dir, shards, directory='.'):
+    """
+    Record the shards of a merged index: a list of dicts with the shard
+    key, its bucket, its first term, number of terms and size in bytes, in
+    term order within each bucket, and the directory holding their files,
+    relative to index_dir.
+    """
+    path = index_manifest_filename(index_dir)
+    temp_path = f'{path}.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(orjson.dumps({'version': MANIFEST_VERSION, 'directory': directory, 'shards': shards}))
+    os.replace(temp_path, path)
+
+
+def _load_index_manifest(index_dir):
+    try:
+        with open(index_manifest_filename(index_dir), 'rb') as f:
+            manifest = orjson.loads(f.read())
+    except FileNotFoundError:
+        return None
+    if manifest.get('version') != MANIFEST_VERSION:
+        raise ValueError(f"Unsupported index manifest in {index_dir}")
+    return manifest
+
+
+def read_index_manifest(index_dir):
+    """Return the shard list of index_dir, or None for an index written
+    without a manifest (one shard per bucket)."""
+    manifest = _load_index_manifest(index_dir)
+    return manifest['shards'] if manifest is not None else None
+
+
+def index_files_dir(index_dir):
+    """Return the directory holding the shard files of index_dir: the one
+    its manifest names (a full build writes a new one every time, see
+    BatchIndexer.merge_all_buckets), else index_dir itself."""
+    manifest = _load_index_manifest(index_dir)
+    return os.path.join(index_dir, manifest.get('directory', '.')) if manifest is not None else index_dir
+
+
+def generation_filename(index_dir):
+    return os.path.join(index_dir, 'generation')
+
+
+def write_generation(index_dir):
+    """Record that a new index was written to index_dir, so readers holding
+    the previous one (and results computed from it) know to reload."""
+    path = generation_filename(index_dir)
+    temp_path = f'{path}.tmp'
+    with open(temp_path, 'w') as f:
+        f.write(f'{time.time_ns()}-{os.getpid()}')
+    os.replace(temp_path, path)
+
+
+def read_generation(index_dir):
+    """Return the generation token of index_dir, or None if it has none."""
+    try:
+        with open(generation_filename(index_dir)) as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def _map_file(path):
+    """Memory-map a file read-only; empty files cannot be mapped."""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b''
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class BucketReader:
+    """
+    Seek-on-demand access to one bucket. Both files are memory mapped, so a
+    lookup touches only the dictionary pages visited by the binary search and
+    the pages holding the requested term's postings.
+    """
+
+    def __init__(self, index_dir, bucket_key):
+        self.terms = _map_file(terms_filename(index_dir, bucket_key))
+        self.postings = _map_file(postings_filename(index_dir, bucket_key))
+        impacts_path = impacts_filename(index_dir, bucket_key)
+        self.impacts = _map_file(impacts_path) if os.path.exists(impacts_path) else b''
+
+        magic, version, self.count = HEADER.unpack_from(self.terms, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Unsupported term dictionary in {index_dir} for bucket '{bucket_key}'")
+        self.blob_start = HEADER.size + self.count * RECORD.size
+
+    def __len__(self):
+        return self.count
+
+    def _record(self, i):
+        return RECORD.unpack_from(self.terms, HEADER.size + i * RECORD.size)
+
+    def _term_at(self, record):
+        start = self.blob_start + record[0]
+        return self.terms[start:start + record[1]]
+
+    def lookup(self, term):
+        """Return the TermEntry of term, or None."""
+        target = term.encode('utf-8')
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            record = self._record(mid)
+            current = self._term_at(record)
+            if current < target:
+                lo = mid + 1
+            elif current > target:
+                hi = mid
+            else:
+                return TermEntry(*record[2:])
+        return None
+
+    def read_postings(self, term):
+        """Return the raw postings payload for term, or None if absent."""
+        entry = self.lookup(term)
+        if entry is None:
+            return None
+        return self.postings_at(entry)
+
+    def postings_at(self, entry):
+        """Return the raw postings payload a TermEntry points to."""
+        return self.postings[entry.offset:entry.offset + entry.length]
+
+    def impacts_at(self, entry):
+        """Return the impact-ordered postings payload of a TermEntry, or
+        None if the index was built without the impact-ordered layout."""
+        if not entry.impact_length:
+            return None
+        return self.impacts[entry.impact_offset:entry.impact_offset + entry.impact_length]
+
+    def items(self):
+        """Yield (term, TermEntry) for every term in sorted order."""
+        for i in range(self.count):
+            record = self._record(i)
+            yield self._term_at(record).decode('utf-8'), TermEntry(*record[2:])
+
+    def close(self):
+        for mapped in (self.terms, self.postings, self.impacts):
+            if isinstance(mapped, mmap.mmap):
+                mapped.close()
+
+
+class Lexicon:
+    """
+    Term statistics and postings of every shard written by the merge.
+    Opening it only maps the files, so it costs the same for any index
+    size; each lookup picks the shard by bucket and first term, then binary
+    searches that shard's dictionary. The files stay mapped until close(),
+    even once a newer build has replaced them.
+    """
+    def __init__(self, index_dir, bucket_keys=BUCKET_KEYS):
+        # bucket -> (first term bytes of each shard, readers), in term order
+        self.shards = {}
+        manifest = _load_index_manifest(index_dir)
+        if manifest is None:
+            files_dir = index_dir
+            shards = [{'key': key, 'bucket': key, 'first_term': ''} for key in bucket_keys
+                      if os.path.exists(terms_filename(index_dir, key))]
+        else:
+            files_dir = os.path.join(index_dir, manifest.get('directory', '.'))
+            shards = manifest['shards']
+        for shard in shards:
+            first_terms, readers = self.shards.setdefault(shard['bucket'], ([], []))
+            first_terms.append(shard['first_term'].encode('utf-8'))
+            readers.append(BucketReader(files_dir, shard['key']))
+
+    def __len__(self):
+        return sum(len(reader) for _, readers in self.shards.values() for reader in readers)
+
+    def shard_of(self, term):
+        """Return the reader of the shard that would hold term, or None."""
+        shards = self.shards.get(bucket_key(term))
+        if shards is None:
+            return None
+        first_terms, readers = shards
+        return readers[max(0, bisect_right(first_terms, term.encode('utf-8')) - 1)]
+
+    def lookup(self, term):
+        """Return the TermEntry of term, or None."""
+        shard = self.shard_of(term)
+        return shard.lookup(term) if shard is not None else None
+
+    def read_postings(self, term, entry=None):
+        """Return the raw postings payload for term, or None if absent."""
+        entry = entry or self.lookup(term)
+        if entry is None:
+            return None
+        return self.shard_of(term).postings_at(entry)
+
+    def postings(self, term, entry=None):
+        """Return the decoded PostingsList of term, or None if absent."""
+        payload = self.read_postings(term, entry)
+        return decode_postings(payload) if payload is not None else None
+
+    def probe(self, term, entry, doc_ids):
+        """probe_postings of term's postings for the sorted doc_ids."""
+        return probe_postings(self.shard_of(term).postings_at(entry), doc_ids)
+
+    def read_impacts(self, term, entry):
+        """Return the impact-ordered postings payload for term's entry, or
+        None if the index was built without that layout."""
+        return self.shard_of(term).impacts_at(entry)
+
+    def close(self):
+        for _, readers in self.shards.values():
+            for reader in readers:
+                reader.close()
+
+
+# File layout of the URL index (url_id_index.bin):
+#   header  : magic, version, number of urls
+#   offsets : count + 1 little-endian uint64, url i spans offsets[i-1]:offsets[i]
+#   blob    : utf-8 bytes of every url, in doc ID order (doc IDs start at 1)
+URL_MAGIC = b'URLS'
+URL_VERSION = 1
+URL_HEADER = struct.Struct('<4sII')
+URL_OFFSET = struct.Struct('<Q')
+
+
+def write_url_file(path, urls):
+    """Write urls (doc ID i is urls[i - 1]) in the offset-indexed layout.
+    The file is replaced whole, so readers mapping the old one keep it."""
+    encoded = [url.encode('utf-8') for url in urls]
+    temp_path = f'{path}.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(URL_HEADER.pack(URL_MAGIC, URL_VERSION, len(encoded)))
+        offset = 0
+        f.write(URL_OFFSET.pack(offset))
+        for url in encoded:
+            offset += len(url)
+            f.write(URL_OFFSET.pack(offset))
+        for url in encoded:
+            f.write(url)
+    os.replace(temp_path, path)
+
+
+class URLFileReader:
+    """Memory-mapped doc ID -> url lookups on a file from write_url_file."""
+
+    def __init__(self, path):
+        self.data = _map_file(path)
+        magic, version, self.count = URL_HEADER.unpack_from(self.data, 0)
+        if magic != URL_MAGIC or version != URL_VERSION:
+            raise ValueError(f"Unsupported URL index file {path}")
+        self.blob_start = URL_HEADER.size + (self.count + 1) * URL_OFFSET.size
+
+    def __len__(self):
+        return self.count
+
+    def get(self, doc_id, default=None):
+        """Returns the url of doc_id, or default if there is none."""
+        doc_id = int(doc_id)
+        if not 1 <= doc_id <= self.count:
+            return default
+        start, end = struct.unpack_from('<QQ', self.data, URL_HEADER.size + (doc_id - 1) * URL_OFFSET.size)
+        return self.data[self.blob_start + start:self.blob_start + end].decode('utf-8')
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+
+
+# File layout of the static scores (static_scores.bin):
+#   header : magic, version, number of documents
+#   scores : count + 1 little-endian float32, the score of doc ID i at index
+#            i (index 0 is unused), e.g. each document's page rank
+STATIC_MAGIC = b'STAT'
+STATIC_VERSION = 1
+STATIC_HEADER = struct.Struct('<4sII')
+
+
+def write_static_scores(path, scores):
+    """Write scores (doc ID i has scores[i - 1]) as a dense float32 array."""
+    array = np.zeros(len(scores) + 1, dtype='<f4')
+    array[1:] = scores
+    temp_path = f'{path}.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(STATIC_HEADER.pack(STATIC_MAGIC, STATIC_VERSION, len(scores)))
+        f.write(array.tobytes())
+    os.replace(temp_path, path)
+
+
+class StaticScores:
+    """
+    Query-independent score of every doc ID. array is the float32 NumPy
+    view for vectorized scoring; values[doc_id] returns a Python float,
+    for scoring loops that look up one document at a time.
+    """
+
+    def __init__(self, array, data=b''):
+        self.array = array
+        self.values = memoryview(array)
+        self.data = data
+
+    @classmethod
+    def open(cls, path):
+        """Memory-map a file from write_static_scores."""
+        data = _map_file(path)
+        magic, version, count = STATIC_HEADER.unpack_from(data, 0)
+        if magic != STATIC_MAGIC or version != STATIC_VERSION:
+            raise ValueError(f"Unsupported static scores file {path}")
+        return cls(np.frombuffer(data, dtype='<f4', count=count + 1, offset=STATIC_HEADER.size), data)
+
+    @classmethod
+    def from_scores(cls, scores):
+        """In-memory static scores, scores[i - 1] being doc ID i's."""
+        array = np.zeros(len(scores) + 1, dtype='<f4')
+        array[1:] = scores
+        return cls(array)
+
+    def __len__(self):
+        return len(self.array) - 1
+
+    def max(self):
+        return float(self.array.max())
+
+    def close(self):
+        # the views must go before the mapping they export can be closed
+        self.values.release()
+        self.array = None
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
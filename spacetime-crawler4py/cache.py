@@ -0,0 +1,258 @@
+import heapq
+import time
+from collections import OrderedDict
+from threading import Lock
+
+
+class ResultCache:
+    """
+    Query results by normalized query key, evicting the least recently
+    used entry beyond max_entries and dropping entries older than ttl
+    seconds. clear() is called when a new index generation is opened.
+    """
+
+    def __init__(self, max_entries=1024, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()  # key -> (expiry time, results)
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        """Returns the cached results for key, or None."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                del self.entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, results):
+        if self.max_entries <= 0:
+            return
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, results)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
+
+
+class LRUPolicy:
+    """Evicts the least recently used key."""
+
+    def __init__(self):
+        self.order = OrderedDict()
+
+    def insert(self, key):
+        self.order[key] = None
+
+    def hit(self, key):
+        self.order.move_to_end(key)
+
+    def remove(self, key):
+        del self.order[key]
+
+    def victim(self):
+        return next(iter(self.order))
+
+    def clear(self):
+        self.order.clear()
+
+
+class LFUPolicy:
+    """Evicts the least frequently used key, the least recently used of
+    those on ties. Stale heap entries are skipped when popped."""
+
+    def __init__(self):
+        self.counts = {}
+        self.heap = []
+        self.tick = 0
+
+    def _push(self, key):
+        self.tick += 1
+        heapq.heappush(self.heap, (self.counts[key], self.tick, key))
+        # rebuild once stale entries dominate, so the heap stays O(keys)
+        if len(self.heap) > 4 * len(self.counts) + 64:
+            self.heap = [(count, 0, key) for key, count in self.counts.items()]
+            heapq.heapify(self.heap)
+
+    def insert(self, key):
+        self.counts[key] = 1
+        self._push(key)
+
+    def hit(self, key):
+        self.counts[key] += 1
+        self._push(key)
+
+    def remove(self, key):
+        del self.counts[key]
+
+    def victim(self):
+        while True:
+            count, _, key = self.heap[0]
+            if self.counts.get(key) == count:
+                return key
+            heapq.heappop(self.heap)
+
+    def clear(self):
+        self.counts.clear()
+        self.heap.clear()
+
+
+class ARCPolicy:
+    """
+    Adaptive replacement: keys seen once (recent) and keys seen again
+    (frequent) are kept in separate LRU lists, and the ghost lists of keys
+    recently evicted from each move the target size of the recent list
+    towards whichever list would have produced the hit.
+    """
+
+    def __init__(self):
+        self.recent = OrderedDict()
+        self.frequent = OrderedDict()
+        self.recent_ghosts = OrderedDict()
+        self.frequent_ghosts = OrderedDict()
+        self.target = 0  # target number of keys in the recent list
+
+    def insert(self, key):
+        resident = len(self.recent) + len(self.frequent)
+        if key in self.recent_ghosts:
+            self.target = min(resident, self.target + max(1, len(self.frequent_ghosts) // len(self.recent_ghosts)))
+            del self.recent_ghosts[key]
+            self.frequent[key] = None
+        elif key in self.frequent_ghosts:
+            self.target = max(0, self.target - max(1, len(self.recent_ghosts) // len(self.frequent_ghosts)))
+            del self.frequent_ghosts[key]
+            self.frequent[key] = None
+        else:
+            self.recent[key] = None
+
+    def hit(self, key):
+        if key in self.recent:
+            del self.recent[key]
+        self.frequent[key] = None
+        self.frequent.move_to_end(key)
+
+    def remove(self, key):
+        # the ghost of an evicted key remembers which list it left
+        limit = max(1, len(self.recent) + len(self.frequent))
+        if key in self.recent:
+            del self.recent[key]
+            ghosts = self.recent_ghosts
+        else:
+            del self.frequent[key]
+            ghosts = self.frequent_ghosts
+        ghosts[key] = None
+        while len(ghosts) > limit:
+            ghosts.popitem(last=False)
+
+    def victim(self):
+        if self.recent and (len(self.recent) > self.target or not self.frequent):
+            return next(iter(self.recent))
+        return next(iter(self.frequent))
+
+    def clear(self):
+        for keys in (self.recent, self.frequent, self.recent_ghosts, self.frequent_ghosts):
+            keys.clear()
+        self.target = 0
+
+
+EVICTION_POLICIES = {'lru': LRUPolicy, 'lfu': LFUPolicy, 'arc': ARCPolicy}
+
+
+class PostingsCache:
+    """
+    Decoded postings by term, held within budget_bytes of memory as
+    reported by each value's nbytes. The policy ('lru', 'lfu' or 'arc')
+    picks which terms are evicted to make room.
+    """
+
+    def __init__(self, budget_bytes=64 * 1024 * 1024, policy='lru'):
+        if policy not in EVICTION_POLICIES:
+            raise ValueError(f"Unknown eviction policy {policy!r}, expected one of {sorted(EVICTION_POLICIES)}")
+        self.budget_bytes = budget_bytes
+        self.policy_name = policy
+        self.policy = EVICTION_POLICIES[policy]()
+        self.entries = {}  # key -> (size, value)
+        self.bytes = 0
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.rejected = 0
+
+    def get(self, key):
+        """Returns the cached value of key, or None."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.policy.hit(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        size = value.nbytes
+        with self.lock:
+            if key in self.entries:
+                return
+            if size > self.budget_bytes:
+                # would evict everything else and still not fit
+                self.rejected += 1
+                return
+            while self.bytes + size > self.budget_bytes:
+                victim = self.policy.victim()
+                self.policy.remove(victim)
+                self.bytes -= self.entries.pop(victim)[0]
+                self.evictions += 1
+            self.entries[key] = (size, value)
+            self.bytes += size
+            self.policy.insert(key)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.policy.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'policy': self.policy_name,
+                'entries': len(self.entries),
+                'bytes': self.bytes,
+                'budget_bytes': self.budget_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'rejected': self.rejected,
+            }
@@ -0,0 +1,162 @@
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urldefrag
+
+# pip install orjson
+import orjson
+
+from scraper import normalize_url
+from utils import get_logger
+
+MANIFEST_VERSION = 1
+# bytes read from the start of a document to find its url; documents keep
+# the url before the (large) content, so this is nearly always enough
+HEAD_BYTES = 4096
+# a JSON string, a bracket, or a quote that opens a string the head cuts
+# off: enough to follow the nesting depth of the start of a document
+JSON_TOKEN = re.compile(rb'"(?:[^"\\]|\\.)*"|[{}\[\]"]')
+# the string value after a key
+STRING_VALUE = re.compile(rb'\s*:\s*("(?:[^"\\]|\\.)*")')
+
+
+def _top_level_url(head):
+    """The raw string value of the top-level "url" key in head, the start
+    of a JSON document, or None if head does not show one. A "url" key of a
+    nested object does not count."""
+    depth = 0
+    for token in JSON_TOKEN.finditer(head):
+        text = token.group()
+        if text in (b'{', b'['):
+            depth += 1
+        elif text in (b'}', b']'):
+            depth -= 1
+        elif text == b'"':
+            return None
+        elif depth == 1 and text == b'"url"':
+            value = STRING_VALUE.match(head, token.end())
+            if value is not None:
+                return value.group(1)
+    return None
+
+
+def read_url(filepath):
+    """
+    Description: Reads the url field of a JSON document without loading
+    the rest of it, falling back to a full parse if the url is not in the
+    first HEAD_BYTES
+
+    Input: Path of the JSON document
+    Output: The raw url, or None if the document has none
+    """
+    with open(filepath, 'rb') as f:
+        head = f.read(HEAD_BYTES)
+        url = _top_level_url(head)
+        if url is not None:
+            return orjson.loads(url)
+        data = orjson.loads(head + f.read())
+    return data.get('url')
+
+
+def indexed_url(filepath):
+    """Defragmented url of a JSON document, as the indexer records it, or
+    None if it has none or cannot be read."""
+    try:
+        url = read_url(filepath)
+    except Exception:
+        return None
+    return urldefrag(url)[0] if url else None
+
+
+def _document_url(filepath):
+    """Normalized, defragmented url of a document, as the crawler links to it."""
+    url = read_url(filepath)
+    if not url:
+        return None
+    url, _ = urldefrag(normalize_url(url))
+    return url
+
+
+def walk_json_files(json_dir):
+    """Yields (path, stat) of every .json file under json_dir."""
+    for root, _, filenames in os.walk(json_dir):
+        for filename in filenames:
+            if filename.endswith('.json'):
+                filepath = os.path.join(root, filename)
+                yield filepath, os.stat(filepath)
+
+
+class CorpusManifest:
+    """
+    (path, size, mtime, normalized url) of every JSON document under
+    json_dir, cached in manifest_file. A refresh only stats the files and
+    re-reads the urls of those that are new or changed since the manifest
+    was written, on a thread pool.
+    """
+
+    def __init__(self, json_dir, manifest_file, workers=None):
+        self.logger = get_logger("MANIFEST")
+        self.json_dir = json_dir
+        self.manifest_file = manifest_file
+        self.workers = workers
+        # path -> [size, mtime_ns, url], in directory walk order
+        self.entries = {}
+
+    def _load(self):
+        if not self.manifest_file or not os.path.exists(self.manifest_file):
+            return {}
+        try:
+            with open(self.manifest_file, 'rb') as f:
+                data = orjson.loads(f.read())
+        except (OSError, orjson.JSONDecodeError) as e:
+            self.logger.error(f"Ignoring unreadable manifest {self.manifest_file}: {e}")
+            return {}
+        if (data.get('version') != MANIFEST_VERSION
+                or data.get('json_dir') != os.path.abspath(self.json_dir)):
+            return {}
+        return data['entries']
+
+    def save(self):
+        if not self.manifest_file:
+            return
+        temp_file = f"{self.manifest_file}.tmp"
+        with open(temp_file, 'wb') as f:
+            f.write(orjson.dumps({'version': MANIFEST_VERSION, 'json_dir': os.path.abspath(self.json_dir),
+                                  'entries': self.entries}))
+        os.replace(temp_file, self.manifest_file)
+
+    def refresh(self):
+        """Brings the manifest up to date with json_dir and saves it if anything changed."""
+        cached = self._load()
+        self.entries = {}
+        changed = []
+        for filepath, stat in walk_json_files(self.json_dir):
+            entry = cached.get(filepath)
+            if entry is None or entry[0] != stat.st_size or entry[1] != stat.st_mtime_ns:
+                entry = [stat.st_size, stat.st_mtime_ns, None]
+                changed.append(filepath)
+            self.entries[filepath] = entry
+
+        def read(filepath):
+            try:
+                return _document_url(filepath)
+            except Exception as e:
+                self.logger.error(f"Error reading {filepath}: {e}")
+                return None
+
+        if changed:
+            # reading is I/O bound, so threads overlap it well
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                for filepath, url in zip(changed, pool.map(read, changed)):
+                    self.entries[filepath][2] = url
+
+        removed = len(cached.keys() - self.entries.keys())
+        self.logger.info(f"Manifest of {len(self.entries)} files: {len(changed)} read, "
+                         f"{len(self.entries) - len(changed)} cached, {removed} removed")
+        if changed or removed:
+            self.save()
+
+    def items(self):
+        """Yields (path, normalized url or None) in directory walk order."""
+        for filepath, (_, _, url) in self.entries.items():
+            yield filepath, url
@@ -20,6 +20,7 @@ class Crawler(object):
     def start(self):
         self.start_async()
         self.join()
+        self.frontier.close()
 
     def join(self):
         for worker in self.workers:
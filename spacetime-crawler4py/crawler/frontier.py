@@ -1,6 +1,7 @@
 import os
 import json
 import shelve
+import time
 from pathlib import Path
 
 
@@ -9,6 +10,12 @@ from queue import Queue, Empty
 
 from utils import get_logger, get_urlhash, normalize
 from scraper import is_valid
+from corpus_manifest import CorpusManifest
+
+# state changes are appended to a log and copied into the shelve save file
+# in batches: after this many changes or this many seconds, whichever is first
+CHECKPOINT_EVERY = 5000
+CHECKPOINT_SECONDS = 30
 
 class Frontier(object):
     def __init__(self, config, restart):
@@ -22,6 +29,7 @@ class Frontier(object):
 
         # Build URL to file mapping
         self.url_to_file_map = {}
+        self.json_files = []
         self._build_url_mapping()
         
         if not os.path.exists(self.config.save_file) and not restart:
@@ -34,19 +42,29 @@ class Frontier(object):
             self.logger.info(
                 f"Found save file {self.config.save_file}, deleting it.")
             os.remove(self.config.save_file)
+        self.log_file = f"{self.config.save_file}.log"
+        if restart and os.path.exists(self.log_file):
+            os.remove(self.log_file)
         # Load existing save file, or create one if it does not exist.
         self.save = shelve.open(self.config.save_file)
+        # Apply changes logged after the last checkpoint of a previous run.
+        self._replay_log()
+        self.state = dict(self.save.items())
+        self.dirty = {}
+        self.log = open(self.log_file, 'a', encoding='utf-8')
+        self.last_checkpoint = time.monotonic()
         if restart:
             # Scan the JSON directory for seed files
             self._scan_json_directory()
         else:
             # Set the frontier state with contents of save file.
             self._parse_save_file()
-            if not self.save:
+            if not self.state:
                 self._scan_json_directory()  
 
     def _build_url_mapping(self):
-        """Build a mapping from URLs to file paths by reading all JSON files"""
+        """Build a mapping from URLs to file paths from the corpus manifest,
+        which only reads the urls of files that are new or changed"""
         json_dir = Path(self.config.json_dir)
         
         if not json_dir.exists():
@@ -55,26 +73,12 @@ class Frontier(object):
         
         self.logger.info(f"Building URL to file mapping from {json_dir}...")
         
-        # Find all JSON files recursively
-        json_files = list(json_dir.rglob('*.json'))
-        
-        for json_file in json_files:
-            try:
-                with open(json_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    url = data.get('url')
-                    if url:
-                        # Normalize the URL before storing
-                        from scraper import normalize_url
-                        normalized_url = normalize_url(url)
-                        # Remove fragment
-                        from urllib.parse import urldefrag
-                        normalized_url, _ = urldefrag(normalized_url)
-                        
-                        self.url_to_file_map[normalized_url] = str(json_file)
-            except Exception as e:
-                self.logger.error(f"Error reading {json_file}: {e}")
-                continue
+        manifest = CorpusManifest(self.config.json_dir, self.config.manifest_file)
+        manifest.refresh()
+        for json_file, url in manifest.items():
+            self.json_files.append(json_file)
+            if url:
+                self.url_to_file_map[url] = json_file
         
         self.logger.info(f"Built mapping for {len(self.url_to_file_map)} URLs")
 
@@ -86,18 +90,64 @@ class Frontier(object):
             self.logger.error(f"JSON directory {json_dir} does not exist!")
             return
         
-        # Find all JSON files recursively
-        json_files = list(json_dir.rglob('*.json'))
-        self.logger.info(f"Found {len(json_files)} JSON files in {json_dir}")
+        # JSON files were listed when building the URL mapping
+        self.logger.info(f"Found {len(self.json_files)} JSON files in {json_dir}")
         
-        for json_file in json_files:
-            self.add_url(str(json_file))
+        for json_file in self.json_files:
+            self.add_url(json_file)
+
+    def _replay_log(self):
+        """Copy the state changes of an unfinished run's log into the save file."""
+        if not os.path.exists(self.log_file):
+            return
+        replayed = 0
+        with open(self.log_file, 'r', encoding='utf-8') as log:
+            for line in log:
+                try:
+                    urlhash, filepath, completed = json.loads(line)
+                except ValueError:
+                    # the last line may be cut short by a crash
+                    break
+                self.save[urlhash] = (filepath, completed)
+                replayed += 1
+        self.save.sync()
+        os.remove(self.log_file)
+        self.logger.info(f"Replayed {replayed} logged frontier changes.")
+
+    def _record(self, urlhash, filepath, completed):
+        """Apply a state change in memory and append it to the log.
+        Must be called with self.lock held."""
+        self.state[urlhash] = (filepath, completed)
+        self.dirty[urlhash] = (filepath, completed)
+        self.log.write(json.dumps([urlhash, filepath, completed]) + "\n")
+        self.log.flush()
+        if (len(self.dirty) >= CHECKPOINT_EVERY
+                or time.monotonic() - self.last_checkpoint >= CHECKPOINT_SECONDS):
+            self.checkpoint()
+
+    def checkpoint(self):
+        """Write the logged changes to the save file and start a new log."""
+        with self.lock:
+            for urlhash, value in self.dirty.items():
+                self.save[urlhash] = value
+            self.save.sync()
+            self.dirty.clear()
+            self.log.truncate(0)
+            self.last_checkpoint = time.monotonic()
+
+    def close(self):
+        """Checkpoint and close the save file, e.g. once crawling is done."""
+        with self.lock:
+            self.checkpoint()
+            self.log.close()
+            os.remove(self.log_file)
+            self.save.close()
 
     def _parse_save_file(self):
         ''' This function can be overridden for alternate saving techniques. '''
-        total_count = len(self.save)
+        total_count = len(self.state)
         tbd_count = 0
-        for url, completed in self.save.values():
+        for url, completed in self.state.values():
             if not completed and is_valid(url):
                 self.to_be_downloaded.put(url)
                 tbd_count += 1
@@ -116,10 +166,9 @@ class Frontier(object):
         filepath = normalize(filepath)
         urlhash = get_urlhash(filepath)
         add = False
-        with self.lock: # for self.save changes
-            if urlhash not in self.save:
-                self.save[urlhash] = (filepath, False)
-                self.save.sync()
+        with self.lock: # for self.state changes
+            if urlhash not in self.state:
+                self._record(urlhash, filepath, False)
                 add = True
         # Queue is thread safe, so we can use add variable to move it outside lock
         if add:
@@ -127,14 +176,13 @@ class Frontier(object):
     
     def mark_url_complete(self, filepath):
         urlhash = get_urlhash(filepath)
-        with self.lock: # for self.save changes
-            if urlhash not in self.save:
+        with self.lock: # for self.state changes
+            if urlhash not in self.state:
                 # This should not happen.
                 self.logger.error(
                     f"Completed url {filepath}, but have not seen it before.")
 
-            self.save[urlhash] = (filepath, True)
-            self.save.sync()
+            self._record(urlhash, filepath, True)
 
     def get_url_to_file_map(self):
         """Return the URL to file mapping"""
@@ -0,0 +1,104 @@
+from bs4 import BeautifulSoup
+from bs4 import XMLParsedAsHTMLWarning
+import warnings
+
+import tokenizer
+
+# Suppress XML warnings
+warnings.filterwarnings("ignore", category=XMLParsedAsHTMLWarning)
+
+# tags whose text is stored in the 'important' field
+IMPORTANT_TAGS = ['h1', 'h2', 'h3', 'title', 'strong']
+
+
+class ParsedDocument:
+    """Result of parsing a page once: everything the indexer and the link
+    graph need, so neither has to parse the html again."""
+
+    def __init__(self, url, title, text, important_tokens, hrefs):
+        self.url = url
+        self.title = title
+        self.text = text
+        self.important_tokens = important_tokens
+        self.hrefs = hrefs
+
+
+def _important_tokens(texts):
+    important_tokens = set()
+    for text in texts:
+        important_tokens.update(tokenizer.tokenize_and_stem(text))
+    return important_tokens
+
+
+class SoupParser:
+    """BeautifulSoup with one of its tree builders ('html.parser', 'lxml')."""
+
+    def __init__(self, features):
+        self.features = features
+
+    def parse(self, url, html_content):
+        soup = BeautifulSoup(html_content, self.features)
+        title = soup.title.get_text(strip=True) if soup.title else ''
+        text = soup.get_text(separator=' ', strip=True)
+        important = [tag.get_text() for tag in soup.find_all(IMPORTANT_TAGS)]
+        hrefs = [a['href'] for a in soup.find_all('a', href=True)]
+        return ParsedDocument(url, title, text, _important_tokens(important), hrefs)
+
+
+class SelectolaxParser:
+    """selectolax's lexbor engine, several times faster than BeautifulSoup."""
+
+    def __init__(self):
+        # pip install selectolax
+        from selectolax.lexbor import LexborHTMLParser
+        self.parser_class = LexborHTMLParser
+
+    def parse(self, url, html_content):
+        tree = self.parser_class(html_content)
+        title_node = tree.css_first('title')
+        title = title_node.text(strip=True) if title_node else ''
+        text = tree.root.text(separator=' ', strip=True) if tree.root else ''
+        important = [node.text() for node in tree.css(', '.join(IMPORTANT_TAGS))]
+        hrefs = [node.attributes['href'] for node in tree.css('a[href]')]
+        return ParsedDocument(url, title, text, _important_tokens(important), hrefs)
+
+
+def _has_module(name):
+    try:
+        __import__(name)
+        return True
+    except ImportError:
+        return False
+
+
+# parser backends by name; 'auto' picks the fastest one installed
+PARSERS = {
+    'html.parser': lambda: SoupParser('html.parser'),
+    'lxml': lambda: SoupParser('lxml'),
+    'selectolax': SelectolaxParser,
+}
+FASTEST_FIRST = [('selectolax', 'selectolax'), ('lxml', 'lxml')]
+
+_parser = SoupParser('html.parser')
+
+
+def set_parser(name):
+    """Selects the parser backend used by process_document."""
+    global _parser
+    if name == 'auto':
+        name = next((backend for backend, module in FASTEST_FIRST if _has_module(module)),
+                     'html.parser')
+    if name not in PARSERS:
+        raise ValueError(f"Unknown html parser '{name}', expected one of {sorted(PARSERS)} or 'auto'")
+    _parser = PARSERS[name]()
+    return name
+
+
+def process_document(url, html_content):
+    """
+    Description: Parses a page exactly once
+
+    Input: The url of the page and its html content
+    Output: ParsedDocument with title, body text, important tokens and hrefs
+    """
+    return _parser.parse(url, html_content)
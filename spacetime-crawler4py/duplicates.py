@@ -0,0 +1,120 @@
+from hashlib import blake2b
+from multiprocessing.managers import BaseManager
+from threading import Lock
+import zlib
+
+# pip install numpy
+import numpy as np
+
+# bits two SimHashes may differ in for their pages to be near duplicates
+DEFAULT_MAX_DISTANCE = 3
+# pages with fewer distinct tokens are only checked for exact duplicates;
+# their SimHashes are too coarse to compare
+MIN_NEAR_TOKENS = 20
+HASH_BITS = 64
+BIT_VALUES = np.uint64(1) << np.arange(HASH_BITS, dtype=np.uint64)
+
+
+def token_hashes(tokens):
+    """64-bit hashes of tokens, the same in every process (unlike hash(),
+    which is salted per process): the CRC-32 of each token spread over 64
+    bits by the splitmix64 finalizer."""
+    x = np.fromiter(map(zlib.crc32, map(str.encode, tokens)), dtype=np.uint64, count=len(tokens))
+    x += np.uint64(0x9E3779B97F4A7C15)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def simhash(tokens):
+    """64-bit SimHash of a collection of distinct tokens: bit i is set when
+    most tokens have bit i set in their hash. Tokens are not weighted by
+    count, which would let the commonest words make every page alike."""
+    hashes = token_hashes(tokens)
+    bits = np.unpackbits(hashes.view(np.uint8).reshape(-1, 8), axis=1, bitorder='little')
+    return int(BIT_VALUES[2 * bits.sum(axis=0) > len(tokens)].sum())
+
+
+def fingerprint(text, freq):
+    """(digest of text, SimHash of the distinct tokens of freq or None if
+    there are too few to compare) of a page, for check_fingerprint."""
+    digest = blake2b(text.encode('utf-8'), digest_size=16).digest()
+    return digest, simhash(freq) if len(freq) >= MIN_NEAR_TOKENS else None
+
+
+class DuplicateDetector:
+    """
+    Flags pages that repeat one seen earlier: exact duplicates by a digest
+    of their text, near duplicates by a SimHash of their distinct tokens
+    within max_distance bits of an earlier page's. The hash is cut into
+    max_distance + 1 bands, and two hashes that close agree on at least one
+    of them, so each band's table of earlier hashes yields the only
+    candidates worth comparing. A negative max_distance turns detection off.
+    """
+
+    def __init__(self, max_distance=DEFAULT_MAX_DISTANCE):
+        self.lock = Lock()
+        # (url, url of the page it repeats, bits apart; None for exact copies)
+        self.duplicates = []
+        self.set_max_distance(max_distance)
+
+    def set_max_distance(self, max_distance):
+        with self.lock:
+            self.max_distance = max_distance
+            bands = max(max_distance + 1, 1)
+            # band boundaries, as even as 64 bits allow
+            self.bands = [(HASH_BITS * i // bands, HASH_BITS * (i + 1) // bands) for i in range(bands)]
+            self.tables = [{} for _ in self.bands]  # band value -> [(simhash, url)]
+            self.digests = {}  # text digest -> url
+
+    def check(self, url, text, freq):
+        """Returns the url of an earlier page that url duplicates, or None
+        after remembering url as an original."""
+        if self.max_distance < 0:
+            return None
+        return self.check_fingerprint(url, *fingerprint(text, freq))
+
+    def check_fingerprint(self, url, digest, page_hash):
+        """check() of a page by its fingerprint(): the digest of its text and
+        its SimHash. Ingest workers compute these themselves and send them
+        to a detector they share."""
+        if self.max_distance < 0:
+            return None
+        with self.lock:
+            original = self.digests.get(digest)
+            if original is not None:
+                self.duplicates.append((url, original, None))
+                return original
+            if page_hash is not None:
+                keys = [(page_hash >> lo) & ((1 << (hi - lo)) - 1) for lo, hi in self.bands]
+                for table, key in zip(self.tables, keys):
+                    for earlier, earlier_url in table.get(key, ()):
+                        distance = bin(page_hash ^ earlier).count('1')
+                        if distance <= self.max_distance:
+                            self.duplicates.append((url, earlier_url, distance))
+                            return earlier_url
+                for table, key in zip(self.tables, keys):
+                    table.setdefault(key, []).append((page_hash, url))
+            self.digests[digest] = url
+        return None
+
+    def found(self):
+        """The (url, original url, bits apart) of every duplicate so far."""
+        with self.lock:
+            return list(self.duplicates)
+
+    def write_report(self, file_name):
+        """Writes every duplicate as 'url<TAB>original url<TAB>bits apart',
+        or 'exact' instead of the bits for an exact copy."""
+        with open(file_name, 'w', encoding='utf-8') as report:
+            for url, original, distance in self.duplicates:
+                print(f"{url}\t{original}\t{'exact' if distance is None else distance}", file=report)
+
+
+class DuplicateManager(BaseManager):
+    """Serves one DuplicateDetector to several processes: ingest workers
+    check every page against it, so duplicates in different chunks are
+    found too."""
+
+
+DuplicateManager.register('DuplicateDetector', DuplicateDetector)
@@ -1,40 +1,148 @@
-from postings import Posting
-import json
-import string
+from postings import (Posting, decode_postings, encode_impact_postings, encode_postings,
+                      from_postings_dict, max_term_weight, merge_postings)
+from binary_index import (BUCKET_KEYS, BucketWriter, bucket_key, impacts_filename, index_files_dir,
+                          postings_filename, read_index_manifest, terms_filename, write_generation,
+                          write_index_manifest, write_static_scores, write_url_file, StaticScores,
+                          URLFileReader)
+from threading import Lock, Thread
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from bisect import bisect_right
+from itertools import groupby
+from operator import itemgetter
+import heapq
+import queue
+import shutil
+import struct
+import time
 import os
 
-def custom_encoder(obj):
-    """Encodes Posting objects into a dictionary for JSON serialization."""
-    if isinstance(obj, Posting):
-        return {
-            'freq': obj.freq,
-            'fields': obj.fields,
-            'position': obj.position
-        }
-    raise TypeError("Object of type %s is not JSON serializable" % type(obj).__name__)
+# pip install numpy
+import numpy as np
+
+# read buffer per partial run during the merge
+DEFAULT_RUN_BUFFER = 8 * 1024 * 1024
+MIN_RUN_BUFFER = 64 * 1024
+# smallest share of the memory budget a single merge process may get
+MIN_MERGE_MEMORY = 32 * 1024 * 1024
+# partial run record header: token length, encoded postings length
+RUN_RECORD = struct.Struct('<HI')
+# a run records (token, offset) about every this many bytes, so the merge
+# can pick shard boundaries and seek to them without reading the run
+RUN_SAMPLE_BYTES = 64 * 1024
+# default target size of a merged shard
+DEFAULT_SHARD_MB = 64
+# subdirectories of the output directory a full build writes its shards to
+BUILD_PREFIX = 'build_'
+# default memory budget of the batch being filled
+DEFAULT_BATCH_MB = 256
+# memory of a batch as estimated by add_document (measured with
+# tracemalloc): a new token's dictionaries, a Posting and its dict entry,
+# and one position in a positions list
+TOKEN_BYTES = 400
+POSTING_BYTES = 170
+POSITION_BYTES = 36
+# full batches waiting for the background writer before add_document blocks
+MAX_PENDING_BATCHES = 1
+
+
+def _write_run_record(f, token, payload):
+    token_bytes = token.encode('utf-8')
+    f.write(RUN_RECORD.pack(len(token_bytes), len(payload)))
+    f.write(token_bytes)
+    f.write(payload)
+
+
+def _read_run(filepath, buffer_size, start=0, lo=None, hi=None):
+    """Yield (token bytes, encoded postings) from a sorted partial run,
+    reading from byte offset start and keeping tokens in [lo, hi)."""
+    with open(filepath, 'rb', buffering=buffer_size) as f:
+        f.seek(start)
+        while True:
+            header = f.read(RUN_RECORD.size)
+            if not header:
+                return
+            token_len, payload_len = RUN_RECORD.unpack(header)
+            token = f.read(token_len)
+            if hi is not None and token >= hi:
+                return
+            if lo is not None and token < lo:
+                f.seek(payload_len, os.SEEK_CUR)
+                continue
+            yield token, f.read(payload_len)
+
+
+def merge_runs(partial_files, buffer_size=DEFAULT_RUN_BUFFER, starts=None, lo=None, hi=None):
+    """Heap-based k-way merge of sorted partial runs, optionally of the
+    token range [lo, hi) only, reading each run from its offset in starts.
+    Yields (token, encoded postings) in token order."""
+    starts = starts or [0] * len(partial_files)
+    runs = [_read_run(filepath, buffer_size, start, lo, hi) for filepath, start in zip(partial_files, starts)]
+    for token, group in groupby(heapq.merge(*runs, key=itemgetter(0)), key=itemgetter(0)):
+        chunks = [postings for _, postings in group]
+        if len(chunks) == 1:
+            payload = chunks[0]
+        else:
+            payload = encode_postings(merge_postings([decode_postings(c) for c in chunks]))
+        yield token.decode('utf-8'), payload
+
+
+def shard_files_size(output_dir, shard_key):
+    size = 0
+    for filename in (terms_filename, postings_filename, impacts_filename):
+        path = filename(output_dir, shard_key)
+        if os.path.exists(path):
+            size += os.path.getsize(path)
+    return size
+
+
+def remove_shard_files(output_dir, shard_key):
+    for filename in (terms_filename, postings_filename, impacts_filename):
+        path = filename(output_dir, shard_key)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _merge_shard_job(job):
+    """Merge one shard's token range of its bucket's runs and stream its
+    binary files. Runs in a worker process, so it only takes plain
+    arguments. Returns (shard key, terms, first term, bytes written)."""
+    output_dir, shard_key, partial_files, starts, lo, hi, buffer_size, impact_ordered = job
+    term_count = 0
+    first_term = None
 
-def custom_decoder(dct):
-    """Decodes a dictionary into a Posting object if applicable."""
-    if 'freq' in dct and 'fields' in dct and 'position' in dct:
-        post = Posting()
-        post.freq = dct['freq']
-        post.fields = dct['fields']
-        post.position = dct['position']
-        return post
-    return dct
+    with BucketWriter(output_dir, shard_key, impact_ordered) as writer:
+        for token, payload in merge_runs(partial_files, buffer_size, starts, lo, hi):
+            postings = decode_postings(payload)
+            impact_payload = encode_impact_postings(postings) if impact_ordered else b''
+            writer.add_term(token, len(postings), payload, max_term_weight(postings),
+                            int(postings.freqs.sum()), impact_payload)
+            if first_term is None:
+                first_term = token
+            term_count += 1
+
+    return shard_key, term_count, first_term, shard_files_size(output_dir, shard_key)
 
 
 class BatchIndexer:
     """
     Build inverted index with bucketing from the start.
     Each batch creates bucketed partial indexes.
-    Final merge combines all partial indexes into one JSON file per bucket.
+    Final merge combines all partial indexes into one binary term dictionary
+    and compressed postings file per bucket for seek-on-demand lookups
+    (see binary_index.py and postings.py).
+
+    A batch is flushed once its estimated memory reaches batch_mb: a
+    background thread writes it while documents go into a fresh batch,
+    and add_document blocks while MAX_PENDING_BATCHES more are waiting.
+    Not thread-safe; callers serialize add_document (analysis holds
+    json_index_lock).
     """
     
-    def __init__(self, output_dir='main_index', temp_dir='temp'):
+    def __init__(self, output_dir='main_index', temp_dir='temp', batch_mb=DEFAULT_BATCH_MB):
         self.output_dir = output_dir
         self.temp_dir = temp_dir
-        self.bucket_keys = list(string.ascii_lowercase) + ['0-9']
+        self.bucket_keys = list(BUCKET_KEYS)
         
         # create directories for the index
         os.makedirs(output_dir, exist_ok=True)
@@ -42,107 +150,271 @@ class BatchIndexer:
         
         # track partial index files for each bucket
         self.partial_files = {bucket: [] for bucket in self.bucket_keys}
+        # (token bytes, byte offset) samples of every partial file
+        self.run_samples = {}
         self.batch_count = 0
         
-        # current batch's index
+        # current batch's index and its estimated memory
         self.current_batch = self._initialize_bucketed_index()
+        self.batch_bytes = 0
+        self.batch_budget_bytes = int(batch_mb * 1024 * 1024)
+
+        # full batches on their way to disk, and the thread writing them
+        self.pending = queue.Queue(maxsize=MAX_PENDING_BATCHES)
+        self.writer = None
+        self.writer_error = None
+        # one record per batch written, and the time spent blocked on the writer
+        self.flushes = []
+        self.flush_wait_seconds = 0.0
     
     def _get_bucket_key(self, token):
         """Return which bucket a token belongs to"""
-        # if not token:
-        #     return '0-9'
-        first_char = token[0].lower()
-        return first_char if first_char.isalpha() else '0-9'
+        return bucket_key(token)
     
     def get_bucket_filename(self, token):
         """Return the name of the file associated with the token."""
         bucket = self._get_bucket_key(token)
-        return f"./main_index/bucket_{bucket}.json"
+        return postings_filename(self.output_dir, bucket)
     
     def _initialize_bucketed_index(self):
         """Create empty bucketed structure"""
         return {bucket: {} for bucket in self.bucket_keys}
     
-    def add_document(self, doc_id, token, freq, fields):
+    def add_document(self, doc_id, token, freq, fields, positions=None):
         """Add a single document to the current batched index."""
         bucket_key = self._get_bucket_key(token)
         
         if token not in self.current_batch[bucket_key]:
             self.current_batch[bucket_key][token] = {}
+            self.batch_bytes += TOKEN_BYTES
         
         self.current_batch[bucket_key][token][doc_id] = Posting()
-        self.current_batch[bucket_key][token][doc_id].add_entry(freq, fields)
-    
+        self.current_batch[bucket_key][token][doc_id].add_entry(freq, fields, positions)
+        self.batch_bytes += POSTING_BYTES + POSITION_BYTES * len(positions or ())
+        if self.batch_bytes >= self.batch_budget_bytes:
+            self.flush()
+
+    def flush(self):
+        """Hand the current batch to the background writer and start a
+        fresh one. Blocks while MAX_PENDING_BATCHES batches are waiting."""
+        if not any(self.current_batch.values()):
+            return
+        self._raise_writer_error()
+        if self.writer is None:
+            self.writer = Thread(target=self._write_batches, daemon=True)
+            self.writer.start()
+
+        batch = (self.batch_count, self.current_batch, self.batch_bytes)
+        self.batch_count += 1
+        self.current_batch = self._initialize_bucketed_index()
+        self.batch_bytes = 0
+        start = time.perf_counter()
+        self.pending.put(batch)
+        self.flush_wait_seconds += time.perf_counter() - start
+
     def save_batch_to_disk(self):
-        """Save current batch to disk as partial files."""
-        for bucket_key, bucket_data in self.current_batch.items():
+        """Flush the current batch and wait until every batch is on disk."""
+        self.flush()
+        if self.writer is not None:
+            self.pending.put(None)
+            self.writer.join()
+            self.writer = None
+        self._raise_writer_error()
+
+    def _raise_writer_error(self):
+        if self.writer_error is not None:
+            error, self.writer_error = self.writer_error, None
+            raise error
+
+    def _write_batches(self):
+        while True:
+            batch = self.pending.get()
+            if batch is None:
+                return
+            try:
+                self._write_batch(*batch)
+            except Exception as e:
+                # keep taking batches so flush never blocks forever; the
+                # next flush raises the error
+                self.writer_error = e
+
+    def _write_batch(self, batch_number, batch, estimated_bytes):
+        """Save a batch to disk as partial files.
+        Each partial file is a sorted run: one (token, encoded postings)
+        record per token, in token order, so the final merge can stream it."""
+        start = time.perf_counter()
+        file_bytes = 0
+        for bucket_key, bucket_data in batch.items():
             # skip empty buckets
             if not bucket_data:
                 continue
             
             # create filename for this bucket's partial index
-            filename = f'bucket_{bucket_key}_batch_{self.batch_count}.json'
+            filename = f'bucket_{bucket_key}_batch_{batch_number}.run'
             filepath = os.path.join(self.temp_dir, filename)
             
-            # save to disk
-            with open(filepath, 'w') as f:
-                json.dump(bucket_data, f, indent=2, default=custom_encoder)
+            # save to disk, sorted by token bytes to match the final dictionary order
+            samples = []
+            offset = 0
+            next_sample = 0
+            with open(filepath, 'wb') as f:
+                for token in sorted(bucket_data, key=lambda t: t.encode('utf-8')):
+                    if offset >= next_sample:
+                        samples.append((token.encode('utf-8'), offset))
+                        next_sample = offset + RUN_SAMPLE_BYTES
+                    payload = encode_postings(from_postings_dict(bucket_data[token]))
+                    _write_run_record(f, token, payload)
+                    offset = f.tell()
             
             # track this partial file
             self.partial_files[bucket_key].append(filepath)
-        
-        self.batch_count += 1
-        
-        # reset current batch
-        self.current_batch = self._initialize_bucketed_index()
+            self.run_samples[filepath] = samples
+            file_bytes += offset
+
+        self.flushes.append({
+            'batch': batch_number,
+            'estimated_bytes': estimated_bytes,
+            'file_bytes': file_bytes,
+            'terms': sum(len(bucket_data) for bucket_data in batch.values()),
+            'seconds': time.perf_counter() - start,
+        })
+
+    def flush_stats(self):
+        """Totals over the batches written: how many, their estimated memory
+        and run file sizes, the seconds the writer spent on them and the
+        seconds add_document was blocked waiting for it."""
+        return {
+            'batches': len(self.flushes),
+            'estimated_bytes': sum(flush['estimated_bytes'] for flush in self.flushes),
+            'file_bytes': sum(flush['file_bytes'] for flush in self.flushes),
+            'write_seconds': sum(flush['seconds'] for flush in self.flushes),
+            'wait_seconds': self.flush_wait_seconds,
+        }
     
-    def merge_bucket_files(self, bucket_key):
-        """Merge all partial files for a single bucket."""
-        merged_bucket = {}
+    def merge_bucket_files(self, bucket_key, buffer_size=DEFAULT_RUN_BUFFER):
+        """Merge all partial files for a single bucket.
+        Yields (token, encoded postings) in token order without holding
+        more than one token's postings in memory."""
         partial_files = self.partial_files[bucket_key]
-        
         print(f"Merging {len(partial_files)} partial files for bucket '{bucket_key}'...")
-        
-        for filepath in partial_files:
-            # Load partial index
-            with open(filepath, 'r') as f:
-                partial_data = json.load(f, object_hook=custom_decoder)
-            
-            # Merge into final bucket
-            for token, doc_postings in partial_data.items():
-                if token not in merged_bucket:
-                    merged_bucket[token] = {}
-                
-                # Merge document postings
-                for doc_id, posting in doc_postings.items():
-                    if doc_id not in merged_bucket[token]:
-                        merged_bucket[token][doc_id] = Posting()
-                        merged_bucket[token][doc_id].add_entry(posting.freq, posting.fields.copy())
-                    else:
-                        # Merge with existing (in case same doc appears in multiple batches)
-                        existing = merged_bucket[token][doc_id]
-                        existing.merge(posting.freq, posting.fields)
-        
-        return merged_bucket
+        return merge_runs(partial_files, buffer_size)
     
-    def merge_all_buckets(self, cleanup_temp=True):
-        """Merge all partial files into final bucket JSON files."""
+    def _plan_shards(self, shard_bytes):
+        """
+        Split every bucket into contiguous token ranges of at most about
+        shard_bytes of partial runs each. Boundaries are picked from the run samples,
+        weighting each sample by the bytes up to the next one. Returns
+        (bucket, shard key, lo, hi, partial files, start offsets) per shard;
+        a bucket that fits in one shard keeps its own name.
+        """
+        shards = []
+        for bucket in self.bucket_keys:
+            files = self.partial_files[bucket]
+            if not files:
+                continue
+            points = []
+            for filepath in files:
+                samples = self.run_samples.get(filepath) or [(b'', 0)]
+                ends = [offset for _, offset in samples[1:]] + [os.path.getsize(filepath)]
+                points += [(token, end - offset) for (token, offset), end in zip(samples, ends)]
+            points.sort()
+            total = sum(size for _, size in points)
+            count = max(1, -(-total // shard_bytes))
+
+            boundaries = []
+            running = 0
+            for token, size in points:
+                if running >= total * (len(boundaries) + 1) / count and (not boundaries or token > boundaries[-1]):
+                    boundaries.append(token)
+                    if len(boundaries) == count - 1:
+                        break
+                running += size
+            ranges = list(zip([None] + boundaries, boundaries + [None]))
+
+            for i, (lo, hi) in enumerate(ranges):
+                key = bucket if len(ranges) == 1 else f"{bucket}.{i}"
+                starts = []
+                for filepath in files:
+                    samples = self.run_samples.get(filepath) or [(b'', 0)]
+                    # the last sample at or before lo
+                    j = bisect_right(samples, (lo,)) - 1 if lo is not None else 0
+                    if j >= 0 and j < len(samples) - 1 and samples[j + 1][0] == lo:
+                        j += 1
+                    starts.append(samples[j][1] if j >= 0 else 0)
+                shards.append((bucket, key, lo, hi, files, starts))
+        return shards
+
+    def _merge_plan(self, workers, memory_budget_mb, jobs):
+        """Pick the number of merge processes and the read buffer per run
+        so that all concurrent merges together stay within the budget."""
+        budget = memory_budget_mb * 1024 * 1024
+        workers = workers or os.cpu_count() or 1
+        workers = max(1, min(workers, len(jobs), budget // MIN_MERGE_MEMORY))
+
+        # each merge holds one read buffer per run plus the term being merged
+        max_runs = max((len(files) for _, _, _, _, files, _ in jobs), default=1)
+        buffer_size = budget // workers // (2 * max_runs)
+        buffer_size = max(MIN_RUN_BUFFER, min(buffer_size, DEFAULT_RUN_BUFFER))
+        return workers, buffer_size
+
+    def merge_all_buckets(self, cleanup_temp=True, workers=None, memory_budget_mb=512, impact_ordered=False,
+                          shard_mb=DEFAULT_SHARD_MB):
+        """Merge all partial files into final shard files.
+        Each bucket is split into token ranges of about shard_mb of runs
+        (see _plan_shards), so shards are of similar size whatever the
+        distribution of first letters. Shards are independent, so they are
+        merged in parallel on a process pool sized to fit memory_budget_mb,
+        and recorded in the index manifest that Lexicon reads. They go to a
+        new directory under output_dir, so readers of the previous build
+        are unaffected until they reopen for the new generation.
+        impact_ordered also writes every term's postings in impact order,
+        for early termination of short queries."""
         print(f"\nMerging all buckets from {self.batch_count} batches...")
-        
+        shards = self._plan_shards(max(1, int(shard_mb * 1024 * 1024)))
+        workers, buffer_size = self._merge_plan(workers, memory_budget_mb, shards)
+        print(f"Using {workers} merge process(es), {buffer_size // 1024} KB read buffer per run")
+
         for bucket_key in self.bucket_keys:
             if not self.partial_files[bucket_key]:
                 print(f"Bucket '{bucket_key}': No data (skipped)")
-                continue
-            
-            # Merge all partial files for this bucket
-            merged_bucket = self.merge_bucket_files(bucket_key)
-            
-            # Save final bucket file
-            output_file = os.path.join(self.output_dir, f'bucket_{bucket_key}.json')
-            with open(output_file, 'w') as f:
-                json.dump(dict(sorted(merged_bucket.items())), f, default=custom_encoder)
-            
-            print(f"Bucket '{bucket_key}': {len(merged_bucket)} terms -> {output_file}")
+
+        # the shards go to a new directory, which the manifest points to once
+        # they are complete; readers keep mapping the previous build's files
+        build = f"{BUILD_PREFIX}{time.time_ns()}"
+        build_dir = os.path.join(self.output_dir, build)
+        os.makedirs(build_dir)
+        try:
+            jobs = [(build_dir, key, files, starts, lo, hi, buffer_size, impact_ordered)
+                    for _, key, lo, hi, files, starts in shards]
+            # the pool is shut down however the merge ends
+            with ProcessPoolExecutor(max_workers=workers) if workers > 1 else nullcontext() as pool:
+                results = pool.map(_merge_shard_job, jobs) if pool is not None else map(_merge_shard_job, jobs)
+                manifest = []
+                for (bucket, _, _, _, _, _), (shard_key, term_count, first_term, size) in zip(shards, results):
+                    print(f"Shard '{shard_key}': {term_count} terms, {size / (1024 * 1024):.2f} MB")
+                    if term_count:
+                        manifest.append({'key': shard_key, 'bucket': bucket, 'first_term': first_term,
+                                         'terms': term_count, 'bytes': size})
+                    else:
+                        remove_shard_files(build_dir, shard_key)
+        except BaseException:
+            # nothing refers to the new directory yet
+            shutil.rmtree(build_dir, ignore_errors=True)
+            raise
+
+        previous_dir = index_files_dir(self.output_dir)
+        previous = read_index_manifest(self.output_dir) or [{'key': key} for key in self.bucket_keys]
+        write_index_manifest(self.output_dir, manifest, build)
+        # readers (see Query) reload and drop cached results on a new generation
+        write_generation(self.output_dir)
+        # earlier builds, and shard files of an index written in output_dir
+        # itself; readers still mapping them keep them until they reopen
+        if os.path.normpath(previous_dir) == os.path.normpath(self.output_dir):
+            for shard in previous:
+                remove_shard_files(self.output_dir, shard['key'])
+        for name in os.listdir(self.output_dir):
+            if name.startswith(BUILD_PREFIX) and name != build:
+                shutil.rmtree(os.path.join(self.output_dir, name), ignore_errors=True)
         
         # Cleanup temporary files
         if cleanup_temp:
@@ -153,45 +425,88 @@ class BatchIndexer:
     def _cleanup_temp_files(self):
         """Remove temporary partial index files"""
         print("Cleaning up temporary files...")
+        run_dirs = set()
         for bucket_key, file_list in self.partial_files.items():
             for filepath in file_list:
                 if os.path.exists(filepath):
                     os.remove(filepath)
+                run_dirs.add(os.path.dirname(filepath))
+
+        # remove per-process run directories (see ingest.py) once empty
+        for run_dir in run_dirs:
+            if run_dir != self.temp_dir and os.path.exists(run_dir) and not os.listdir(run_dir):
+                os.rmdir(run_dir)
         
         # remove temp directory if empty
         if os.path.exists(self.temp_dir) and not os.listdir(self.temp_dir):
             os.rmdir(self.temp_dir)
     
     def get_final_stats(self):
-        """Get statistics about final buckets"""
+        """Get statistics about final shards"""
         stats = {}
-        for bucket_key in self.bucket_keys:
-            filepath = os.path.join(self.output_dir, f'bucket_{bucket_key}.json')
-            if os.path.exists(filepath):
-                with open(filepath, 'r') as f:
-                    data = json.load(f, object_hook=custom_decoder)
-                stats[bucket_key] = {
-                    'terms': len(data),
-                    'file_size_mb': os.path.getsize(filepath) / (1024 * 1024)
-                }
+        for shard in read_index_manifest(self.output_dir) or []:
+            stats[shard['key']] = {
+                'terms': shard['terms'],
+                'file_size_mb': shard['bytes'] / (1024 * 1024)
+            }
         return stats
 
 
 class URLIndex:
+    """
+    Bidirectional doc ID <-> url map: a hash map from url to ID and a list
+    from ID to url, so both directions are O(1). IDs start at 1.
+    """
     def __init__(self):
-        self.index = {}
+        self.ids = {}
+        self.urls = []
         self.id = 0
+        self.lock = Lock()
+
+    def get_or_add(self, url) -> int:
+        """Returns the id of url, atomically assigning the next id if the url
+        is new. Safe to call from several threads."""
+        with self.lock:
+            doc_id = self.ids.get(url)
+            if doc_id is None:
+                self.urls.append(url)
+                self.id = doc_id = len(self.urls)
+                self.ids[url] = doc_id
+            return doc_id
+
+    def reassign(self, url):
+        """Gives url the next id, e.g. for a new version of its page.
+        Returns (new id, previous id of url or None)."""
+        with self.lock:
+            previous = self.ids.get(url)
+            self.urls.append(url)
+            self.id = doc_id = len(self.urls)
+            self.ids[url] = doc_id
+            return doc_id, previous
+
+    def remove(self, doc_id):
+        """Forgets the url of doc_id if it still maps to it, leaving an
+        empty url in its place so the file keeps it forgotten; the id
+        itself stays taken."""
+        with self.lock:
+            url = self.urls[doc_id - 1]
+            if self.ids.get(url) == doc_id:
+                del self.ids[url]
+                self.urls[doc_id - 1] = ''
+
+    def live_count(self) -> int:
+        """Returns the number of ids whose url still maps to them, i.e.
+        that neither remove nor reassign retired."""
+        return len(self.ids)
 
     def add_entry(self, url):
         """Adds a url to the index if not already in the list.
         There is a unique ID for every url."""
-        if (url not in self.index.values()):
-            self.id += 1
-            self.index[self.id] = url
+        self.get_or_add(url)
 
     def get_url(self, id) -> str:
         """Returns url associated with id."""
-        return self.index[id]
+        return self.urls[id - 1]
 
     def length(self) -> int:
         """Returns number of index documents with unique ids."""
@@ -199,12 +514,41 @@ class URLIndex:
     
     def get_id(self, url) -> int:
         """Returns the id associated with the url."""
-        ids = [id for id, val in self.index.items() if val == url]
-        if (len(ids) == 1):
-            return ids[0]
+        if url in self.ids:
+            return self.ids[url]
         else:
             raise Exception(IndexError, f"{url} not found in URL Index\n")
         
     def write_to_file(self, file):
-        with open(file, "w") as outfile:
-            json.dump(dict(sorted(self.index.items())), outfile, default=custom_encoder)
\ No newline at end of file
+        """Writes the offset-indexed binary file read by URLFileReader."""
+        write_url_file(file, self.urls)
+
+    def load(self, file):
+        """Reads back a file from write_to_file. A url listed under several
+        ids maps to the last one; removed ids map from no url."""
+        reader = URLFileReader(file)
+        urls = [reader.get(doc_id) for doc_id in range(1, len(reader) + 1)]
+        reader.close()
+        with self.lock:
+            self.urls = urls
+            self.ids = {url: doc_id for doc_id, url in enumerate(urls, 1) if url}
+            self.id = len(urls)
+
+    def write_static_scores(self, file, scores):
+        """Writes the doc ID indexed static scores read by StaticScores,
+        from scores by url (0 for urls without one)."""
+        write_static_scores(file, [scores.get(url, 0) for url in self.urls])
+
+    def extend_static_scores(self, file, previous):
+        """Extends the static scores of file to every id: an id in previous
+        ({new id: previous id}) keeps the score of the previous version of
+        its page, other new ids score 0."""
+        scores = np.zeros(len(self.urls), dtype=np.float32)
+        if os.path.exists(file):
+            old = StaticScores.open(file)
+            count = min(len(old), len(scores))
+            scores[:count] = old.array[1:count + 1]
+            old.close()
+        for doc_id, previous_id in previous.items():
+            scores[doc_id - 1] = scores[previous_id - 1]
+        write_static_scores(file, scores)
\ No newline at end of file
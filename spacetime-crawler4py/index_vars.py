@@ -4,6 +4,5 @@ from page_rank import PageRanker
 
 json_index_lock = Lock()
 URL_id_index = URLIndex()
-url_index_lock = Lock()
 
 page_rank = PageRanker()
\ No newline at end of file
@@ -0,0 +1,214 @@
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import analyze
+from analyze import tokenize_document, add_to_index
+from corpus_manifest import indexed_url
+from document import process_document
+from duplicates import DuplicateManager, fingerprint
+from index import BatchIndexer, DEFAULT_BATCH_MB
+from index_vars import URL_id_index, page_rank
+from scraper import extract_outgoing_urls
+from tokenizer import stemmer
+from utils import get_logger
+
+logger = get_logger("INGEST")
+
+# files handed to a worker process at a time; each chunk gets its own
+# contiguous doc ID range and its own partial runs
+CHUNK_SIZE = 2000
+
+
+def _read_content(filepath):
+    """Returns the html content of a JSON document, or None if the document
+    would be skipped by the crawler."""
+    try:
+        with open(filepath, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except Exception:
+        return None
+
+    html_content = data.get('content', '')
+    if not html_content or not data.get('url') or len(html_content) < 500:
+        return None
+    return html_content
+
+
+def _ingest_chunk(job):
+    """
+    Parses, tokenizes and indexes one chunk of documents in a worker process,
+    reading each file once. Doc IDs are assigned locally from first_doc_id,
+    in chunk order. Pages too short to index, unreadable ones and those the
+    shared detector (None if off) finds repeating an earlier page keep
+    their doc ID but are not indexed.
+    Returns the partial run files and everything the parent needs to build
+    the URL index, the link graph and the report.
+    """
+    chunk_id, documents, first_doc_id, temp_dir, batch_mb, detector = job
+    known_stems = len(stemmer.cache)
+    indexer = BatchIndexer(temp_dir=os.path.join(temp_dir, f'chunk_{chunk_id}'), batch_mb=batch_mb)
+    links = {}
+    word_freq = {}
+    skipped = []
+
+    for doc_id, (filepath, url) in enumerate(documents, first_doc_id):
+        html_content = _read_content(filepath)
+        if html_content is None:
+            skipped.append(doc_id)
+            continue
+        try:
+            document = process_document(url, html_content)
+            freq, positions = tokenize_document(document)
+        except Exception:
+            skipped.append(doc_id)
+            continue
+        links[url] = extract_outgoing_urls(url, document.hrefs)
+        if detector is not None and detector.check_fingerprint(url, *fingerprint(document.text, freq)) is not None:
+            skipped.append(doc_id)
+            continue
+        add_to_index(indexer, doc_id, freq, positions, document.important_tokens)
+        for token, count in freq.items():
+            word_freq[token] = word_freq.get(token, 0) + count
+
+    indexer.save_batch_to_disk()
+    # stems this chunk added to the worker's table, for the parent's
+    return (indexer.partial_files, indexer.run_samples, (indexer.flushes, indexer.flush_wait_seconds),
+            links, word_freq, stemmer.entries_after(known_stems), skipped)
+
+
+def ingest(json_dir, processes=None, temp_dir='temp', batch_mb=DEFAULT_BATCH_MB):
+    """
+    Indexes every JSON document under json_dir on a process pool, bypassing
+    the threaded crawler. Each worker builds its own bucketed partial index;
+    the parent only assigns doc IDs, collects the link graph and statistics
+    and registers the partial runs with the global indexer for the final
+    merge. Every worker flushes its batches within batch_mb of memory.
+    Duplicates are detected across all chunks, as
+    analyze.duplicate_detector is configured; the parent reports them.
+    """
+    processes = processes or os.cpu_count() or 1
+    files = sorted(str(path) for path in Path(json_dir).rglob('*.json'))
+    logger.info(f"Found {len(files)} JSON files in {json_dir}, using {processes} processes")
+
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        # assign doc IDs up front: one per distinct url, in file order, so
+        # that workers never need to coordinate. Only the head of a file is
+        # read here; the worker indexing it parses the whole file.
+        documents = []
+        seen = set()
+        for filepath, url in zip(files, pool.map(indexed_url, files, chunksize=256)):
+            if url is not None and url not in seen:
+                seen.add(url)
+                documents.append((filepath, url))
+        first_doc_id = URL_id_index.length() + 1
+        for filepath, url in documents:
+            URL_id_index.add_entry(url)
+        logger.info(f"Assigned doc IDs to {len(documents)} documents")
+
+        chunks, skipped = _index_documents(pool, documents, first_doc_id, analyze.indexer, temp_dir, batch_mb)
+
+    # skipped pages were never indexed, so they are not documents
+    for doc_id in skipped:
+        URL_id_index.remove(doc_id)
+    skipped = set(skipped)
+    stats = analyze.stats_shard()
+    for doc_id, (filepath, url) in enumerate(documents, first_doc_id):
+        if doc_id not in skipped:
+            stats.unique_pages.add(url)
+    logger.info(f"Indexed {len(documents) - len(skipped)} documents in {chunks} chunks, "
+                f"skipping {len(skipped)}")
+
+
+def _index_documents(pool, documents, first_doc_id, indexer, temp_dir, batch_mb):
+    """
+    Indexes (filepath, url) documents with consecutive doc IDs from
+    first_doc_id in chunks on pool, and registers the partial runs with
+    indexer for its merge. Every chunk checks its pages against one
+    duplicate detector. Returns the number of chunks and the doc IDs of
+    the documents not indexed.
+    """
+    max_distance = analyze.duplicate_detector.max_distance
+    skipped = []
+    with DuplicateManager() as manager:
+        detector = manager.DuplicateDetector(max_distance) if max_distance >= 0 else None
+        jobs = []
+        for chunk_id, start in enumerate(range(0, len(documents), CHUNK_SIZE)):
+            jobs.append((chunk_id, documents[start:start + CHUNK_SIZE], first_doc_id + start, temp_dir, batch_mb,
+                         detector))
+
+        stats = analyze.stats_shard()
+        for (partial_files, run_samples, flushes, links, word_freq, stems,
+             chunk_skipped) in pool.map(_ingest_chunk, jobs):
+            stemmer.update(stems)
+            for bucket_key, file_list in partial_files.items():
+                indexer.partial_files[bucket_key].extend(file_list)
+            indexer.run_samples.update(run_samples)
+            indexer.flushes.extend(flushes[0])
+            indexer.flush_wait_seconds += flushes[1]
+            for url, outgoing_urls in links.items():
+                page_rank.update_links(url, outgoing_urls)
+            stats.add_freq(word_freq)
+            skipped.extend(chunk_skipped)
+        if detector is not None:
+            analyze.duplicate_detector.duplicates.extend(detector.found())
+    return len(jobs), skipped
+
+
+def ingest_changes(changed, removed, segments, indexer, processes=None, temp_dir='temp',
+                   batch_mb=DEFAULT_BATCH_MB):
+    """
+    Indexes the new or changed documents of segments.changes() for a new
+    segment, on a process pool, into indexer. Every document gets a new
+    doc ID, after the existing ones; the doc IDs of the previous versions
+    of changed documents and of removed documents are to be deleted.
+    Returns the {path: [size, mtime_ns, doc ID]} of the changed documents
+    (doc ID 0 if not indexed), the doc IDs to delete, the {new doc ID:
+    previous doc ID} of new versions of pages and the new doc IDs of the
+    documents that were not indexed after all.
+    """
+    deleted = set()
+    for filepath in removed:
+        doc_id = segments.doc_id(filepath)
+        if doc_id:
+            deleted.add(doc_id)
+            URL_id_index.remove(doc_id)
+    for filepath, _ in changed:
+        if segments.doc_id(filepath):
+            deleted.add(segments.doc_id(filepath))
+
+    processes = max(1, min(processes or os.cpu_count() or 1, -(-len(changed) // CHUNK_SIZE)))
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        paths = [filepath for filepath, _ in changed]
+        documents = []
+        doc_ids = {}
+        previous = {}
+        for filepath, url in zip(paths, pool.map(indexed_url, paths, chunksize=256)):
+            if url is None or url in doc_ids:
+                # the file no longer holds a page of its own
+                continue
+            doc_ids[url], previous_id = URL_id_index.reassign(url)
+            documents.append((filepath, url))
+            if previous_id is not None:
+                # a new version of a page, possibly indexed under another file
+                previous[doc_ids[url]] = previous_id
+                if not segments.is_deleted(previous_id):
+                    deleted.add(previous_id)
+        # the url a changed file held must not lead to its deleted doc ID
+        # any more, e.g. if the file now holds another url; a no-op for
+        # urls reassigned above
+        for filepath in paths:
+            if segments.doc_id(filepath):
+                URL_id_index.remove(segments.doc_id(filepath))
+        first_doc_id = URL_id_index.length() - len(documents) + 1
+        chunks, skipped = _index_documents(pool, documents, first_doc_id, indexer, temp_dir, batch_mb)
+
+    for doc_id in skipped:
+        URL_id_index.remove(doc_id)
+    skipped_ids = set(skipped)
+    indexed = {filepath: doc_ids[url] for filepath, url in documents if doc_ids[url] not in skipped_ids}
+    files = {filepath: stat + [indexed.get(filepath, 0)] for filepath, stat in changed}
+    logger.info(f"Indexed {len(indexed)} new or changed documents in {chunks} chunks, "
+                f"deleting {len(deleted)}")
+    return files, sorted(deleted), previous, skipped
@@ -0,0 +1,66 @@
+"""
+Production serving for web_interface: the parent binds one listening socket
+and forks worker processes that all accept on it, each answering requests
+on threads. The workers open the memory-mapped index after the fork, so
+its pages are shared through the OS page cache rather than copied, and
+queries use every core instead of one interpreter's. A rebuild while
+serving is picked up by each worker on its next query; builds never
+rewrite the files the workers still map (see merge_all_buckets).
+
+run python interface/serve.py --workers 4 (from the directory with main_index)
+"""
+from argparse import ArgumentParser
+import os
+import signal
+import socket
+
+from werkzeug.serving import make_server
+
+from web_interface import app
+from query import get_query_engine
+
+
+def serve_worker(host, port, fd):
+    # open the index before taking requests, so the first one is not slow
+    get_query_engine()
+    server = make_server(host, port, app, threaded=True, fd=fd)
+    # Ctrl-C reaches the whole process group; the parent stops the workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda signum, frame: os._exit(0))
+    server.serve_forever()
+
+
+def serve(host='127.0.0.1', port=5000, workers=os.cpu_count()):
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind((host, port))
+    listener.listen(128)
+    listener.set_inheritable(True)
+
+    children = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            serve_worker(host, port, listener.fileno())
+            os._exit(0)
+        children.append(pid)
+    print(f"Serving on http://{host}:{port} with {workers} worker processes")
+
+    def stop(signum, frame):
+        for pid in children:
+            os.kill(pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for pid in children:
+        os.waitpid(pid, 0)
+    listener.close()
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument("--host", type=str, default='127.0.0.1')
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+    serve(args.host, args.port, args.workers)
@@ -1,10 +1,10 @@
-from flask import Flask, render_template, request
+from flask import Flask, jsonify, render_template, request
 import time
 
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from query import process_query
+from query import get_query_engine
 
 app = Flask(__name__)
 
@@ -13,13 +13,27 @@ def index():
     if request.method == 'POST':
         query = request.form['user_query']
         start_time = time.time()
-        urls = process_query.query(query)
+        urls = get_query_engine().query(query)
         time_elapsed = time.time() - start_time
         results = {'urls': urls, 'time':time_elapsed, 'query':query}
         return render_template('result.html', results=results)
     return render_template('index.html')
 
-# run python web_interface.py
+@app.route('/api/search')
+def search():
+    """JSON results for /api/search?q=...[&mode=and]. The threaded server
+    answers each request on its own thread."""
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': "missing query parameter 'q'"}), 400
+    conjunctive = request.args.get('mode', 'or').lower() == 'and'
+    start_time = time.time()
+    urls = get_query_engine().query(query, conjunctive=conjunctive)
+    time_elapsed = time.time() - start_time
+    return jsonify({'query': query, 'time': time_elapsed,
+                    'results': [{'url': url, 'score': score} for url, score in urls]})
+
+# run python web_interface.py (or serve.py to serve on several processes)
 if __name__ == '__main__':
     app.run(debug=True)
     # app.run(debug=True, port=5001) # this is bc i had problem with port=5000, but by default it should work
\ No newline at end of file
@@ -1,5 +1,6 @@
 
 import json
+import os
 import time
 import multiprocessing
 from pathlib import Path
@@ -8,13 +9,18 @@ from argparse import ArgumentParser
 
 from utils.config import Config
 from crawler import Crawler
+from ingest import ingest, ingest_changes
+from document import set_parser
+from tokenizer import stemmer
+from index import BatchIndexer
+from segments import SegmentSet, read_segments
 
 from index_vars import URL_id_index, page_rank
-from analyze import write_analysis_to_file, indexer
-from query import process_query
+from analyze import write_analysis_to_file, indexer, duplicate_detector
+from query import get_query_engine
 
 
-def main(config_file, restart, json_dir=None):
+def main(config_file, restart, json_dir=None, incremental=False):
     cparser = ConfigParser()
     cparser.read(config_file)
     config = Config(cparser)
@@ -28,29 +34,92 @@ def main(config_file, restart, json_dir=None):
         print(f"Error: JSON directory '{config.json_dir}' does not exist!")
         return
 
-    crawler = Crawler(config, restart)
-    crawler.start()
+    set_parser(config.html_parser)
+    # stems known from earlier runs; ingest workers inherit them
+    stemmer.max_entries = config.stem_table_entries
+    stemmer.load(config.stem_table_file)
+    indexer.batch_budget_bytes = int(config.batch_mb * 1024 * 1024)
+    duplicate_detector.set_max_distance(config.duplicate_bits)
+    # only index what changed since the last build, if there was one
+    if incremental and read_segments(indexer.output_dir) is not None:
+        update_index(config)
+        stemmer.save(config.stem_table_file)
+        return
+    if config.ingest_mode == "processes":
+        ingest(config.json_dir, config.processes_count or None, batch_mb=config.batch_mb)
+    else:
+        crawler = Crawler(config, restart)
+        crawler.start()
     
-    # makes sure to save the rest of the documents
+    # makes sure to save the rest of the documents and waits for the writer
     indexer.save_batch_to_disk()
     # finally merge all the buckets into one index
-    indexer.merge_all_buckets(cleanup_temp=True)
+    indexer.merge_all_buckets(cleanup_temp=True,
+                              workers=config.merge_workers or None,
+                              memory_budget_mb=config.merge_memory_mb,
+                              impact_ordered=config.impact_ordered,
+                              shard_mb=config.shard_mb)
 
     # json_index.write_to_file(file="inverted_index.json")
-    URL_id_index.write_to_file(file="url_id_index.json")
-    page_rank.compute_rank()
+    URL_id_index.write_to_file(file="url_id_index.bin")
+    page_ranks = page_rank.compute_rank(URL_id_index.ids if config.page_rank_indexed_only else None)
+    # page rank by doc ID, so queries add it without looking up urls
+    URL_id_index.write_static_scores("static_scores.bin", page_ranks)
+    # the full build is the first segment of later incremental updates
+    SegmentSet(indexer.output_dir).reset(config.json_dir, URL_id_index)
     write_analysis_to_file()
+    stemmer.save(config.stem_table_file)
+
+
+def update_index(config):
+    """
+    Indexes the JSON documents added or changed since the last build into
+    a new segment, and deletes the previous versions of changed documents
+    and removed documents. New versions keep the page rank of the previous
+    one and new pages rank 0 until the next full build. Merges of the
+    segments then run in the background, and are done when it returns.
+    """
+    segments = SegmentSet(indexer.output_dir, config.merge_factor, config.shard_mb, config.impact_ordered)
+    changed, removed = segments.changes(config.json_dir)
+    if not changed and not removed:
+        print("Index is up to date")
+        return
+
+    URL_id_index.load("url_id_index.bin")
+    first_doc_id = URL_id_index.length() + 1
+    name = segments.new_segment()
+    segment_indexer = BatchIndexer(output_dir=segments.segment_dir(name), temp_dir=os.path.join('temp', name),
+                                   batch_mb=config.batch_mb)
+    files, deleted, previous, skipped = ingest_changes(changed, removed, segments, segment_indexer,
+                                                       config.processes_count or None, segment_indexer.temp_dir,
+                                                       config.batch_mb)
+    segment_indexer.save_batch_to_disk()
+    segment_indexer.merge_all_buckets(cleanup_temp=True,
+                                      workers=config.merge_workers or None,
+                                      memory_budget_mb=config.merge_memory_mb,
+                                      impact_ordered=config.impact_ordered,
+                                      shard_mb=config.shard_mb)
+
+    # doc IDs must resolve before queries see the segment
+    URL_id_index.write_to_file(file="url_id_index.bin")
+    URL_id_index.extend_static_scores("static_scores.bin", previous)
+    segments.add_segment(name, first_doc_id, URL_id_index.length(), deleted, files, removed, skipped)
+    # a merge that fails raises here rather than leaving the index half merged
+    segments.wait_for_merges()
 
 
 if __name__ == "__main__":
     # multiprocessing.set_start_method('fork', force=True)
     parser = ArgumentParser()
     parser.add_argument("--restart", action="store_true", default=False)
+    parser.add_argument("--incremental", action="store_true", default=False,
+                        help="Only index the JSON files added, changed or removed since the last build")
     parser.add_argument("--config_file", type=str, default="config.ini")
     parser.add_argument("--json_dir", type=str, required=True, 
                        help="Path to directory containing JSON files")
     args = parser.parse_args()
-    # main(args.config_file, args.restart, args.json_dir)
+    # main(args.config_file, args.restart, args.json_dir, args.incremental)
+    process_query = get_query_engine()
     str_input = ""
     while (str_input != "exit"):
         str_input = process_query.user_input()
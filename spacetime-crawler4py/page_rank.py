@@ -2,57 +2,105 @@ import orjson
 from threading import Lock
 from collections import defaultdict
 
+# pip install numpy
+import numpy as np
+
+from utils import get_logger
+
 class PageRanker:
     def __init__(self, filename='page_rank.json'):
         self.page_outlinks = defaultdict(set)
         self.page_rank_lock = Lock()
         self.save_path = filename
+        self.logger = get_logger("PAGERANK")
 
     def update_links(self, url, outgoing_urls):
         with self.page_rank_lock:
             self.page_outlinks[url].update(outgoing_urls)
 
-    # on slide27 lec24, it says in practice ~5 iterations is sufficient
-    def _calculate_page_rank(self, damping=0.85, iter=5):
-        pages = list(self.page_outlinks.keys())
-        n = len(pages)
+    def _build_graph(self, indexed_urls=None):
+        """
+        Interns every url, crawled or only linked to, to an integer ID and
+        stores the link graph in CSC form: the sources linking to page j are
+        sources[indptr[j]:indptr[j + 1]]. With indexed_urls, pages outside
+        that set and their links are left out.
+        Returns (urls, indptr, sources, out degree of every page).
+        """
+        ids = {}
+        urls = []
+        link_sources = []
+        link_targets = []
+
+        def intern(url):
+            if url not in ids:
+                ids[url] = len(urls)
+                urls.append(url)
+            return ids[url]
+
+        with self.page_rank_lock:
+            for url, outlinks in self.page_outlinks.items():
+                if indexed_urls is not None and url not in indexed_urls:
+                    continue
+                src = intern(url)
+                for target in outlinks:
+                    if indexed_urls is None or target in indexed_urls:
+                        link_sources.append(src)
+                        link_targets.append(intern(target))
+
+        n = len(urls)
+        link_sources = np.array(link_sources, dtype=np.int64)
+        link_targets = np.array(link_targets, dtype=np.int64)
+        order = np.argsort(link_targets, kind='stable')
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(link_targets, minlength=n), out=indptr[1:])
+        out_degree = np.bincount(link_sources, minlength=n)
+        return urls, indptr, link_sources[order], out_degree
+
+    # on slide27 lec24, it says in practice ~5 iterations is sufficient; we
+    # iterate until the ranks stop moving instead, which is cheap on arrays
+    def _calculate_page_rank(self, damping=0.85, max_iter=100, tol=1e-6, indexed_urls=None):
+        """
+        Power iteration of pi = (1-d) + d(sum from j=1...N: (Lij/cj)*pj),
+        starting from pagerank=1 for each page. Pages without outlinks
+        (dangling) spread their rank evenly over all pages, so the ranks keep
+        summing to N. Stops once the mean change per page is below tol.
+        """
+        urls, indptr, sources, out_degree = self._build_graph(indexed_urls)
+        n = len(urls)
 
         if n == 0:
             return {}
 
-        # Initialize pagerank=1 for each page
-        pr = {id: 1.0 for id in pages}
-
-        #TODO: idk if this is the smartest thing to do cause rn my inlink and outlink are all the urls themselves
-        # not the id since not all inlink/outlinks are guaranteed to be an "aprpoved" link that we will crawl, but it still counts
-        # i think? also analysis is the only time the id is referenced/updated so i don't really know how to add it in 
-        # during the scraper.py phase where we get all the links... 
-
-        for i in range(iter):
-            new_pr = {}
-            # iterate over each page
-            for p in pages:
-                rank_sum = 0
-                # sum contributions from in-links (sum j=1...N: (Lij/cj)*pj)
-                for src, outlinks in self.page_outlinks.items():
-                    if p in outlinks: # Lij
-                        outdeg = len(outlinks)  # C(Ti)
-                        if outdeg > 0:
-                            # PR(Ti) / C(Ti)
-                            rank_sum += pr[src] / outdeg
-                # pi = (1-d) + d(sum from j=1...N: (Lij/cj)*pj)
-                new_pr[p] = (1 - damping) + damping * rank_sum
-
-            # update
+        dangling = out_degree == 0
+        inv_out_degree = np.zeros(n)
+        inv_out_degree[~dangling] = 1.0 / out_degree[~dangling]
+        has_inlinks = np.diff(indptr) > 0
+
+        pr = np.ones(n)
+        for i in range(max_iter):
+            # PR(Ti) / C(Ti), summed over the in-links of every page
+            # (a trailing 0 keeps every segment start a valid index)
+            contributions = np.append((pr * inv_out_degree)[sources], 0.0)
+            rank_sum = np.add.reduceat(contributions, indptr[:-1]) * has_inlinks
+            rank_sum += pr[dangling].sum() / n
+
+            new_pr = (1 - damping) + damping * rank_sum
+            delta = np.abs(new_pr - pr).sum() / n
             pr = new_pr
+            if delta < tol:
+                break
 
-        return pr
+        self.logger.info(f"PageRank of {n} pages and {len(sources)} links "
+                         f"after {i + 1} iterations (change {delta:.2e})")
+        return dict(zip(urls, pr.tolist()))
 
     def _save_page_rank(self, pagerank):
         with open(self.save_path, "wb") as f:
             json_bytes = orjson.dumps(pagerank)
             f.write(json_bytes)
 
-    def compute_rank(self):
-        pr = self._calculate_page_rank()
-        self._save_page_rank(pr)
\ No newline at end of file
+    def compute_rank(self, indexed_urls=None):
+        """Computes, saves and returns the page rank of every url."""
+        pr = self._calculate_page_rank(indexed_urls=indexed_urls)
+        self._save_page_rank(pr)
+        return pr
@@ -1,3 +1,25 @@
+# pip install numpy
+import numpy as np
+
+# bit assigned to each field name in a posting's field mask
+FIELD_BITS = {'important': 1}
+IMPORTANT = FIELD_BITS['important']
+
+# score multiplier of a posting whose term is in an important field
+IMPORTANT_BOOST = 2.5
+
+# flags stored in the header of an encoded postings list
+HAS_POSITIONS = 1
+HAS_SKIPS = 2
+
+# postings per skip block, and the shortest list that gets a skip table
+SKIP_BLOCK = 64
+SKIP_MIN_DOCS = 8 * SKIP_BLOCK
+
+# below this many values a plain Python loop beats numpy's per-call overhead
+SMALL = 64
+
+
 class Posting:
     def __init__(self):
         self.freq = 0
@@ -13,3 +35,479 @@ class Posting:
     def merge(self, freq, fields):
         self.freq += freq
         self.fields += fields
+
+
+def fields_to_mask(fields):
+    """Turns a list of field names into a bitmask."""
+    mask = 0
+    for field in fields or ():
+        mask |= FIELD_BITS[field]
+    return mask
+
+
+def encode_varints(values):
+    """
+    Encodes non-negative integers as LEB128 varints: 7 bits per byte, high
+    bit set on every byte except the last one of a value.
+    """
+    if len(values) < SMALL:
+        return _encode_small(values)
+    values = np.asarray(values, dtype=np.uint64)
+    if values.max() < 0x80:
+        return values.astype(np.uint8).tobytes()
+
+    lengths = _varint_lengths(values)
+    width = int(lengths.max())
+
+    shifts = np.arange(width, dtype=np.uint64) * np.uint64(7)
+    lanes = (values[:, None] >> shifts) & np.uint64(0x7f)
+    lanes |= np.where(np.arange(width) < (lengths - 1)[:, None], 0x80, 0).astype(np.uint64)
+    return lanes[np.arange(width) < lengths[:, None]].astype(np.uint8).tobytes()
+
+
+def _varint_lengths(values):
+    """Number of bytes needed by each value of a uint64 array."""
+    lengths = np.ones(values.size, dtype=np.int64)
+    for shift in range(7, 64, 7):
+        lengths += values >= (np.uint64(1) << np.uint64(shift))
+    return lengths
+
+
+def _encode_small(values):
+    out = bytearray()
+    for value in values:
+        value = int(value)
+        while value >= 0x80:
+            out.append((value & 0x7f) | 0x80)
+            value >>= 7
+        out.append(value)
+    return bytes(out)
+
+
+def _decode_small(data):
+    values = []
+    value = shift = 0
+    for byte in data:
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            values.append(value)
+            value = shift = 0
+        else:
+            shift += 7
+    return np.array(values, dtype=np.uint64)
+
+
+def decode_varints(data):
+    """Decodes a buffer of LEB128 varints into a uint64 array."""
+    if len(data) < SMALL:
+        return _decode_small(data)
+    buf = np.frombuffer(data, dtype=np.uint8)
+    ends = np.flatnonzero(buf < 0x80)
+    if ends.size == buf.size:
+        # every value fits in one byte
+        return buf.astype(np.uint64)
+
+    starts = np.empty_like(ends)
+    starts[0] = 0
+    starts[1:] = ends[:-1] + 1
+    lengths = ends - starts + 1
+    shifts = (np.arange(buf.size) - np.repeat(starts, lengths)).astype(np.uint64) * np.uint64(7)
+    values = (buf & 0x7f).astype(np.uint64) << shifts
+    return np.add.reduceat(values, starts)
+
+
+def _read_varint(data, pos):
+    """Reads a single varint at pos; returns (value, next position)."""
+    result = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+class PostingsList:
+    """
+    Decoded postings of one term: parallel arrays sorted by doc ID.
+    positions(i) gives the token positions of the i-th document when the
+    list was encoded with positions.
+    """
+
+    def __init__(self, doc_ids, freqs, fields, positions=None, position_data=None):
+        self.doc_ids = doc_ids
+        self.freqs = freqs
+        self.fields = fields
+        # flat array of all positions, decoded from position_data on first use
+        self._positions = positions
+        self._position_data = position_data
+        # where each document's run starts in the flat array
+        self.position_starts = None
+        if self.has_positions:
+            self.position_starts = np.zeros(len(freqs) + 1, dtype=np.int64)
+            np.cumsum(freqs, out=self.position_starts[1:])
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    @property
+    def has_positions(self):
+        return self._positions is not None or self._position_data is not None
+
+    @property
+    def nbytes(self):
+        """Memory held by the arrays, counting positions as decoded."""
+        size = self.doc_ids.nbytes + self.freqs.nbytes + self.fields.nbytes
+        if self.has_positions:
+            size += self.position_starts.nbytes + int(self.position_starts[-1]) * 8
+            if self._position_data is not None:
+                size += len(self._position_data)
+        return size
+
+    @property
+    def flat_positions(self):
+        if self._positions is None and self._position_data is not None:
+            self._positions = _decode_positions(self._position_data, self.position_starts)
+        return self._positions
+
+    def find(self, doc_ids):
+        """Looks up sorted doc_ids; returns (mask of those present, their
+        freqs, their field masks)."""
+        if not len(self.doc_ids):
+            return np.zeros(len(doc_ids), dtype=bool), self.freqs, self.fields
+        at = np.minimum(np.searchsorted(self.doc_ids, doc_ids), len(self.doc_ids) - 1)
+        present = self.doc_ids[at] == doc_ids
+        at = at[present]
+        return present, self.freqs[at], self.fields[at]
+
+    def position_doc_ids(self):
+        """Doc ID of every entry in flat_positions."""
+        return np.repeat(self.doc_ids, self.freqs)
+
+    def positions(self, i):
+        return self.flat_positions[self.position_starts[i]:self.position_starts[i + 1]]
+
+
+def encode_postings(postings):
+    """
+    Encodes a PostingsList into bytes:
+      header    : varint doc count, varint flags, varint body length,
+                  varint skip table length (only with HAS_SKIPS)
+      skips     : (lists of SKIP_MIN_DOCS or more) per block of SKIP_BLOCK
+                  documents, the block's last doc ID and the byte offsets of
+                  its gaps, frequencies and field masks in the body (uint32)
+      body      : doc ID gaps, then frequencies, then field masks (varints)
+      positions : (optional) per document, the first position followed by
+                  gaps to the next one, freq values per document
+    """
+    doc_ids = np.asarray(postings.doc_ids, dtype=np.int64)
+    gaps = np.diff(doc_ids, prepend=0)
+    values = np.concatenate([gaps, postings.freqs, postings.fields])
+    body = encode_varints(values)
+    flags = 0
+    skips = tail = b''
+    if len(doc_ids) >= SKIP_MIN_DOCS:
+        flags |= HAS_SKIPS
+        skips = _skip_table(doc_ids, values)
+    if postings.has_positions:
+        flags |= HAS_POSITIONS
+        flat = np.asarray(postings.flat_positions, dtype=np.int64)
+        deltas = np.diff(flat, prepend=0)
+        # restart the gaps at the first position of every document
+        starts = postings.position_starts[:-1][np.diff(postings.position_starts) > 0]
+        deltas[starts] = flat[starts]
+        tail = encode_varints(deltas)
+
+    header = [len(doc_ids), flags, len(body)]
+    if flags & HAS_SKIPS:
+        header.append(len(skips))
+    return encode_varints(header) + skips + body + tail
+
+
+def _skip_table(doc_ids, values):
+    count = len(doc_ids)
+    offsets = np.zeros(values.size + 1, dtype=np.int64)
+    np.cumsum(_varint_lengths(values.astype(np.uint64)), out=offsets[1:])
+    starts = np.arange(0, count, SKIP_BLOCK)
+    table = np.empty((starts.size, 4), dtype='<u4')
+    table[:, 0] = doc_ids[np.minimum(starts + SKIP_BLOCK, count) - 1]
+    table[:, 1] = offsets[starts]
+    table[:, 2] = offsets[count + starts]
+    table[:, 3] = offsets[2 * count + starts]
+    return table.tobytes()
+
+
+def _read_header(data):
+    """(count, flags, body length, skip table bytes, position of the body)"""
+    count, pos = _read_varint(data, 0)
+    flags, pos = _read_varint(data, pos)
+    body_len, pos = _read_varint(data, pos)
+    skips = b''
+    if flags & HAS_SKIPS:
+        skip_len, pos = _read_varint(data, pos)
+        skips = data[pos:pos + skip_len]
+        pos += skip_len
+    return count, flags, body_len, skips, pos
+
+
+def decode_postings(data):
+    """Decodes the bytes written by encode_postings into a PostingsList."""
+    count, flags, body_len, _, pos = _read_header(data)
+
+    values = decode_varints(data[pos:pos + body_len]).astype(np.int64)
+    doc_ids = np.cumsum(values[:count])
+    freqs = values[count:2 * count]
+    fields = values[2 * count:3 * count]
+
+    # positions are only decoded if a phrase or proximity query asks for them
+    position_data = data[pos + body_len:] if flags & HAS_POSITIONS else None
+    return PostingsList(doc_ids, freqs, fields, position_data=position_data)
+
+
+def probe_postings(data, doc_ids):
+    """
+    Looks up sorted doc_ids in encoded postings. With a skip table only the
+    blocks that can hold one of them are decoded, so probing a long list
+    costs about as much as the doc_ids given rather than the whole list.
+    Returns (mask of doc_ids present, their freqs, their field masks,
+    number of postings decoded).
+    """
+    count, flags, body_len, skips, pos = _read_header(data)
+    if not flags & HAS_SKIPS:
+        return decode_postings(data).find(doc_ids) + (count,)
+
+    table = np.frombuffer(skips, dtype='<u4').reshape(-1, 4).astype(np.int64)
+    # blocks whose last doc ID is the first one at or past a doc ID
+    blocks = np.searchsorted(table[:, 0], doc_ids)
+    blocks = blocks[(blocks < len(table)) & np.diff(blocks, prepend=-1).astype(bool)]
+    # each stream of the body ends where the next one starts
+    ends = np.empty_like(table)
+    ends[:-1, 1:] = table[1:, 1:]
+    ends[-1, 1:] = table[0, 2], table[0, 3], body_len
+    # gather the gaps of the blocks, then their frequencies, then their
+    # field masks, and decode them together
+    starts = table[blocks, 1:].T.ravel()
+    lengths = ends[blocks, 1:].T.ravel() - starts
+    picked = np.arange(lengths.sum()) + np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+    body = np.frombuffer(data, dtype=np.uint8, count=body_len, offset=pos)
+    values = decode_varints(body[picked].tobytes()).astype(np.int64)
+    sizes = np.minimum(SKIP_BLOCK, count - blocks * SKIP_BLOCK)
+    gaps, freqs, fields = np.split(values, 3)
+
+    # restart the running sum of the gaps at each block's base doc ID
+    running = np.cumsum(gaps)
+    first = np.zeros(len(blocks), dtype=np.int64)
+    np.cumsum(sizes[:-1], out=first[1:])
+    bases = np.where(blocks > 0, table[blocks - 1, 0], 0)
+    block_ids = running - np.repeat(running[first] - gaps[first] - bases, sizes)
+    return PostingsList(block_ids, freqs, fields).find(doc_ids) + (len(block_ids),)
+
+
+def _decode_positions(data, position_starts):
+    deltas = decode_varints(data).astype(np.int64)
+    running = np.cumsum(deltas)
+    # undo the restart at each document boundary
+    starts = position_starts[:-1]
+    base = np.where(starts > 0, running[starts - 1], 0) if running.size else starts
+    return running - np.repeat(base, np.diff(position_starts))
+
+
+def doc_count(data):
+    """Number of documents in encoded postings, read from the header only."""
+    return _read_varint(data, 0)[0]
+
+
+def term_weights(freqs, fields):
+    """
+    (1 + log10 tf) x field boost of every posting: the part of a posting's
+    score that does not depend on the collection (the rest is the idf).
+    """
+    weights = 1 + np.log10(np.maximum(freqs, 1))
+    weights[(fields & IMPORTANT) != 0] *= IMPORTANT_BOOST
+    return weights
+
+
+def max_term_weight(postings):
+    """Largest term weight over the postings, so that max_term_weight x idf
+    bounds the score of every document of the term."""
+    if len(postings) == 0:
+        return 0.0
+    return float(term_weights(postings.freqs, postings.fields).max())
+
+
+def encode_impact_postings(postings):
+    """
+    Encodes a PostingsList in impact order. Postings with the same
+    frequency and field mask have the same term weight, so they form a
+    block; blocks are written from the highest weight down, letting a
+    reader stop once the remaining weights are too low to matter:
+      header : varint block count
+      block  : varint freq, varint field mask, varint doc count, varint
+               body length, then doc ID gaps (ascending within the block)
+    """
+    doc_ids = np.asarray(postings.doc_ids, dtype=np.int64)
+    freqs = np.asarray(postings.freqs, dtype=np.int64)
+    fields = np.asarray(postings.fields, dtype=np.int64)
+    order = np.lexsort((doc_ids, fields, freqs, -term_weights(freqs, fields)))
+    doc_ids, freqs, fields = doc_ids[order], freqs[order], fields[order]
+
+    starts = np.flatnonzero((np.diff(freqs, prepend=-1) != 0) | (np.diff(fields, prepend=-1) != 0))
+    ends = np.append(starts[1:], len(doc_ids))
+    out = [encode_varints([len(starts)])]
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        body = encode_varints(np.diff(doc_ids[start:end], prepend=0))
+        out.append(encode_varints([int(freqs[start]), int(fields[start]), end - start, len(body)]))
+        out.append(body)
+    return b''.join(out)
+
+
+def impact_blocks(data):
+    """
+    Yields (freq, field mask, doc IDs) for each block written by
+    encode_impact_postings, highest term weight first. A block's doc IDs
+    are only decoded when the caller asks for the block.
+    """
+    count, pos = _read_varint(data, 0)
+    for _ in range(count):
+        freq, pos = _read_varint(data, pos)
+        fields, pos = _read_varint(data, pos)
+        docs, pos = _read_varint(data, pos)
+        body_len, pos = _read_varint(data, pos)
+        doc_ids = np.cumsum(decode_varints(data[pos:pos + body_len]).astype(np.int64))
+        pos += body_len
+        yield freq, fields, doc_ids
+
+
+def from_postings_dict(doc_postings):
+    """Builds a PostingsList from a {doc_id: Posting} dictionary."""
+    items = sorted(doc_postings.items(), key=lambda item: int(item[0]))
+    doc_ids = np.array([int(doc_id) for doc_id, _ in items], dtype=np.int64)
+    freqs = np.array([posting.freq for _, posting in items], dtype=np.int64)
+    fields = np.array([fields_to_mask(posting.fields) for _, posting in items], dtype=np.int64)
+
+    positions = None
+    if items and all(posting.position is not None and len(posting.position) == posting.freq
+                     for _, posting in items):
+        positions = np.array([p for _, posting in items for p in sorted(posting.position)],
+                             dtype=np.int64)
+    return PostingsList(doc_ids, freqs, fields, positions)
+
+
+def merge_postings(lists):
+    """
+    Merges PostingsLists of the same term (e.g. from several batches) into
+    one list sorted by doc ID. A document present in more than one list has
+    its frequencies added, its field masks OR'ed and its positions combined.
+    """
+    doc_ids = np.concatenate([p.doc_ids for p in lists])
+    freqs = np.concatenate([p.freqs for p in lists])
+    fields = np.concatenate([p.fields for p in lists])
+    with_positions = all(p.has_positions for p in lists)
+
+    unique_ids, inverse = np.unique(doc_ids, return_inverse=True)
+    if unique_ids.size == doc_ids.size and np.all(np.diff(doc_ids) > 0):
+        # lists cover consecutive doc ID ranges, the usual case for batches
+        positions = np.concatenate([p.flat_positions for p in lists]) if with_positions else None
+        return PostingsList(doc_ids, freqs, fields, positions)
+
+    if unique_ids.size == doc_ids.size:
+        order = np.argsort(doc_ids, kind='stable')
+        positions = None
+        if with_positions:
+            runs = [p.positions(i) for p in lists for i in range(len(p))]
+            positions = np.concatenate([runs[i] for i in order])
+        return PostingsList(doc_ids[order], freqs[order], fields[order], positions)
+
+    # same document in several lists
+    merged_freqs = np.bincount(inverse, weights=freqs, minlength=unique_ids.size).astype(np.int64)
+    merged_fields = np.zeros(unique_ids.size, dtype=np.int64)
+    np.bitwise_or.at(merged_fields, inverse, fields)
+    positions = None
+    if with_positions:
+        runs = [[] for _ in range(unique_ids.size)]
+        i = 0
+        for p in lists:
+            for j in range(len(p)):
+                runs[inverse[i]].extend(p.positions(j).tolist())
+                i += 1
+        positions = np.array([pos for run in runs for pos in sorted(run)], dtype=np.int64)
+    return PostingsList(unique_ids, merged_freqs, merged_fields, positions)
+
+
+def concat_postings(lists):
+    """
+    Joins PostingsLists of one term over consecutive doc ID ranges, given
+    in doc ID order, e.g. from the segments of an index. Positions that were
+    not decoded yet stay encoded: every document's run starts from an
+    absolute position, so the encoded runs can simply be joined.
+    """
+    doc_ids = np.concatenate([p.doc_ids for p in lists])
+    freqs = np.concatenate([p.freqs for p in lists])
+    fields = np.concatenate([p.fields for p in lists])
+    if not all(p.has_positions for p in lists):
+        return PostingsList(doc_ids, freqs, fields)
+    if all(p._positions is None for p in lists):
+        return PostingsList(doc_ids, freqs, fields, position_data=b''.join(p._position_data for p in lists))
+    return PostingsList(doc_ids, freqs, fields, np.concatenate([p.flat_positions for p in lists]))
+
+
+def select_postings(postings, keep):
+    """The postings of the documents where the boolean mask keep is set."""
+    if keep.all():
+        return postings
+    positions = None
+    if postings.has_positions:
+        positions = postings.flat_positions[np.repeat(keep, postings.freqs)]
+    return PostingsList(postings.doc_ids[keep], postings.freqs[keep], postings.fields[keep], positions)
+
+
+def _position_keys(postings, doc_ids, offset=0):
+    """
+    Encodes every position of postings inside doc_ids as doc_id << 32 | pos,
+    shifted back by offset. Keys come out sorted since postings are ordered
+    by doc ID and then by position.
+    """
+    pos_docs = postings.position_doc_ids()
+    positions = postings.flat_positions
+    idx = np.minimum(np.searchsorted(doc_ids, pos_docs), max(len(doc_ids) - 1, 0))
+    mask = (doc_ids[idx] == pos_docs) & (positions >= offset) if len(doc_ids) else pos_docs < 0
+    return (pos_docs[mask] << 32) | (positions[mask] - offset)
+
+
+def _common_doc_ids(lists):
+    """Doc IDs shared by all lists, intersecting from the rarest term up."""
+    lists = sorted(lists, key=len)
+    doc_ids = lists[0].doc_ids
+    for postings in lists[1:]:
+        doc_ids = np.intersect1d(doc_ids, postings.doc_ids, assume_unique=True)
+    return doc_ids
+
+
+def phrase_doc_ids(lists):
+    """Doc IDs in which the terms of lists occur at consecutive positions."""
+    doc_ids = _common_doc_ids(lists)
+    if doc_ids.size == 0 or not all(p.has_positions for p in lists):
+        return doc_ids
+
+    keys = None
+    for offset, postings in enumerate(lists):
+        term_keys = _position_keys(postings, doc_ids, offset)
+        keys = term_keys if keys is None else np.intersect1d(keys, term_keys, assume_unique=True)
+    return np.unique(keys >> 32)
+
+
+def near_doc_ids(first, second, distance):
+    """Doc IDs in which the two terms occur at most distance positions apart."""
+    doc_ids = _common_doc_ids([first, second])
+    if doc_ids.size == 0 or not (first.has_positions and second.has_positions):
+        return doc_ids
+
+    first_keys = _position_keys(first, doc_ids)
+    second_keys = _position_keys(second, doc_ids)
+    # nearest occurrence of the second term on either side of each first one
+    idx = np.searchsorted(second_keys, first_keys)
+    after = second_keys[np.minimum(idx, len(second_keys) - 1)]
+    before = second_keys[np.maximum(idx - 1, 0)]
+    close = (np.abs(after - first_keys) <= distance) | (np.abs(first_keys - before) <= distance)
+    return np.unique(first_keys[close] >> 32)
@@ -1,70 +1,194 @@
 from tokenizer import stemmer
+from binary_index import StaticScores, URLFileReader, bucket_key, generation_filename, read_generation
+from segments import open_lexicon
+from cache import PostingsCache, ResultCache
+from postings import impact_blocks, phrase_doc_ids, near_doc_ids, IMPORTANT, IMPORTANT_BOOST
 # pip install orjson
 import orjson
 import math
-import string
-from collections import OrderedDict
+from bisect import bisect_left
 import heapq
 import time
+import re
+import os
+from contextlib import contextmanager
+from threading import Condition, Lock, local
+# pip install numpy
+import numpy as np
+
+# "quoted phrase" and term NEAR/k term operators; the lookahead lets NEAR
+# constraints chain (a NEAR/2 b NEAR/3 c)
+PHRASE_PATTERN = re.compile(r'"([^"]*)"')
+NEAR_PATTERN = re.compile(r'(\S+)\s+NEAR/(\d+)\s+(?=(\S+))')
+# queries with at most this many distinct terms use impact-ordered postings
+# when the index has them
+IMPACT_MAX_TERMS = 2
+
+
+def _score(tf, fields, idf):
+    # TF-IDF score
+    score = (1 + math.log10(tf)) * idf if tf > 0 else 0
+    # Boost for important fields (titles, headers)
+    if fields & IMPORTANT:
+        score *= IMPORTANT_BOOST  # Stronger boost for important content
+    return score
+
+
+class _ReadWriteLock:
+    """Any number of readers, or one writer. A waiting writer holds off
+    new readers, so a reload is not starved by a steady stream of queries."""
+
+    def __init__(self):
+        self.condition = Condition()
+        self.readers = 0
+        self.writing_or_waiting = False
+
+    @contextmanager
+    def reading(self):
+        with self.condition:
+            while self.writing_or_waiting:
+                self.condition.wait()
+            self.readers += 1
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.readers -= 1
+                if self.readers == 0:
+                    self.condition.notify_all()
+
+    @contextmanager
+    def writing(self):
+        with self.condition:
+            while self.writing_or_waiting:
+                self.condition.wait()
+            self.writing_or_waiting = True
+            while self.readers:
+                self.condition.wait()
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.writing_or_waiting = False
+                self.condition.notify_all()
 
 
 class Query:
-    def __init__(self, url_id_filename='url_id_index.json', page_rank_filename='', max_cache=5) -> None:
-        #TODO mayeb accept these filenames as parameters
-        with open(url_id_filename, 'r') as f:
-            self.url_mapping = orjson.loads(f.read())
+    """
+    Safe to share between threads: queries hold the index lock as readers,
+    and reopening the index for a new generation waits for them as the
+    writer. The caches lock internally; the other per-term caches only
+    ever gain entries, which is atomic for dicts.
+    """
+
+    def __init__(self, url_id_filename='url_id_index.bin', page_rank_filename='', index_dir='main_index',
+                 cache_size=1024, cache_ttl=300, postings_cache_mb=64, postings_cache_policy='lru',
+                 static_scores_filename='') -> None:
+        self.url_id_filename = url_id_filename
+        self.page_rank_filename = page_rank_filename
+        self.static_scores_filename = static_scores_filename
+        self.index_dir = index_dir
+        # results of recent queries, keyed by their normalized terms and
+        # options; dropped whenever the index generation changes
+        self.result_cache = ResultCache(cache_size, cache_ttl)
+        # decoded postings of frequently queried terms, within a memory
+        # budget; the encoded postings stay in the (shared) page cache
+        self.postings_cache = PostingsCache(postings_cache_mb * 1024 * 1024, postings_cache_policy)
+        self.index_lock = _ReadWriteLock()
+        # each thread sees the stats of its own last query
+        self.thread_state = local()
+        self.url_mapping = None
+        self.lexicon = None
+        self._open_index()
+
+    def _open_index(self):
+        """(Re)opens the index files and forgets everything derived from the
+        previously opened ones."""
+        if self.lexicon is not None:
+            self.lexicon.close()
+            self.url_mapping.close()
+            self.static_scores.close()
+        # (mtime, size, inode) of the generation file and its token, checked
+        # before every query so a re-merged index is picked up
+        self.generation_stat = self._stat_generation()
+        self.generation = read_generation(self.index_dir)
+        # memory-mapped doc id -> url, urls are only decoded when looked up
+        self.url_mapping = URLFileReader(self.url_id_filename)
+        # memory-mapped term statistics and postings of every bucket (of
+        # every segment, after incremental updates); nothing is read until
+        # a term is looked up, so startup does not depend on the size of
+        # the index
+        self.lexicon, retired_docs = open_lexicon(self.index_dir)
+        self.max_doc_id = len(self.url_mapping)
+        # doc IDs of deleted pages and of pages that were not indexed do
+        # not count
+        self.total_docs = self.max_doc_id - retired_docs
+        # page rank of every doc id, added to its text score without looking
+        # up its url; urls are only resolved for the results
+        self.static_scores = self._load_static_scores()
+        # upper bound of the page rank addend of any document
+        self.max_page_rank = self.static_scores.max()
+        # idf and largest (1 + log10 tf) x boost (see max_term_weight) of
+        # every term looked up so far, from its lexicon entry
+        self.idf_cache = {}
+        self.max_weight_cache = {}
+        # 1 + log10 tf by tf, grown as larger frequencies are seen
+        self.tf_weight_table = np.zeros(1)
+        self.result_cache.clear()
+        self.postings_cache.clear()
+
+    def _load_static_scores(self):
+        """The static scores file written at build time if there is one,
+        else the page ranks by url of page_rank_filename, else zeros."""
+        if self.static_scores_filename and os.path.exists(self.static_scores_filename):
+            static_scores = StaticScores.open(self.static_scores_filename)
+            if len(static_scores) >= self.max_doc_id:
+                return static_scores
+            # written for fewer documents: the rest score 0
+            scores = np.zeros(self.max_doc_id)
+            scores[:len(static_scores)] = static_scores.array[1:]
+            static_scores.close()
+            return StaticScores.from_scores(scores)
         try:
-            with open(page_rank_filename, "rb") as f:
-                self.page_rank = orjson.loads(f.read())
+            with open(self.page_rank_filename, "rb") as f:
+                page_rank = orjson.loads(f.read())
         except FileNotFoundError:
-            self.page_rank = {}
-        self.idf_cache = {}
-        self.bucket_cache = OrderedDict()
-        self.total_docs = len(self.url_mapping)
-        self.max_cached_buckets = max_cache
-        self._compute_idf()
-    
-    def _get_bucket_key(self, word):
-        first_char = word[0].lower()
-        if not first_char.isalpha():
-            first_char = '0-9'
-        return first_char
-    
-    def _load_bucket_to_cache(self, letter: str):
-        if letter in self.bucket_cache:
-            self.bucket_cache.move_to_end(letter)
-            return self.bucket_cache[letter]
-
-        if len(self.bucket_cache) > self.max_cached_buckets:
-            self.bucket_cache.popitem(last=False)
-
-        json_file_path = f"main_index/bucket_{letter}.json"
-        with open(json_file_path, 'r') as f:
-            bucket = orjson.loads(f.read())
-        
-        self.bucket_cache[letter] = bucket
-        self.bucket_cache.move_to_end(letter)
-        return bucket
-        
-    def _compute_idf(self):
-        for letter in string.ascii_lowercase:
-            json_file_path = f"main_index/bucket_{letter}.json"
-
-            with open(json_file_path, 'r') as f:
-                index = orjson.loads(f.read())
-            
-            for term, posting in index.items():
-                doc_freq = len(posting)  # Number of docs containing this term
-                self.idf_cache[term] = math.log10(self.total_docs / doc_freq) if doc_freq > 0 else 0
-        
-        json_file_path = f"main_index/bucket_0-9.json"
-
-        with open(json_file_path, 'r') as f:
-            index = orjson.loads(f.read())
-        
-        for term, posting in index.items():
-            doc_freq = len(posting)  # Number of docs containing this term
-            self.idf_cache[term] = math.log10(self.total_docs / doc_freq) if doc_freq > 0 else 0
+            page_rank = {}
+        if not page_rank:
+            return StaticScores.from_scores(np.zeros(self.max_doc_id))
+        return StaticScores.from_scores([page_rank.get(self.url_mapping.get(docid), 0)
+                                         for docid in range(1, self.max_doc_id + 1)])
+
+    def _stat_generation(self):
+        try:
+            st = os.stat(generation_filename(self.index_dir))
+        except FileNotFoundError:
+            return None
+        return st.st_mtime_ns, st.st_size, st.st_ino
+
+    def _check_generation(self):
+        """Reopens the index if a merge wrote a new generation since it was
+        opened, once the queries running on the old one are done. Costs one
+        stat while the index is unchanged."""
+        current = self._stat_generation()
+        if current != self.generation_stat:
+            with self.index_lock.writing():
+                if read_generation(self.index_dir) != self.generation:
+                    self._open_index()
+                else:
+                    self.generation_stat = current
+
+    @property
+    def last_query_stats(self):
+        """Postings scored by this thread's last query, out of the postings
+        of its terms."""
+        if not hasattr(self.thread_state, 'stats'):
+            self.thread_state.stats = {'postings_scored': 0, 'postings_total': 0}
+        return self.thread_state.stats
+
+    @last_query_stats.setter
+    def last_query_stats(self, stats):
+        self.thread_state.stats = stats
 
     def user_input(self):
         """Gets the user input from the query."""
@@ -79,54 +203,534 @@ class Query:
 
         return tokens
 
-    def query(self, q):
-        """Given a list of terms, check respective files for the token and
-        then return the postings for each token and check intersections of
-        the postings. Returns the top 5 urls."""
+    def _extract_constraints(self, user_input: str):
+        """Returns the quoted phrases (lists of stemmed terms) and the
+        NEAR/k pairs (stemmed term, stemmed term, k) of the user input."""
+        phrases = []
+        for phrase in PHRASE_PATTERN.findall(user_input):
+            stems = [stemmer.stem(term) for term in self._extract_terms(phrase)]
+            if len(stems) > 1:
+                phrases.append(stems)
 
-        terms = self._extract_terms(q)
-        # Stem all query terms
-        stemmed_query = [stemmer.stem(term) for term in terms]
+        nears = []
+        for left, distance, right in NEAR_PATTERN.findall(user_input):
+            left, right = self._extract_terms(left), self._extract_terms(right)
+            if left and right:
+                nears.append((stemmer.stem(left[-1]), stemmer.stem(right[0]), int(distance)))
+        return phrases, nears
+
+    def _lookup(self, word):
+        """Returns the lexicon entry of a stemmed word, or None, and caches
+        its idf and max weight."""
+        entry = self.lexicon.lookup(word)
+        if entry is not None:
+            # doc_freq: number of docs containing this term
+            self.idf_cache[word] = math.log10(self.total_docs / entry.doc_freq) if entry.doc_freq > 0 else 0
+            self.max_weight_cache[word] = entry.max_weight
+        return entry
+
+    def _get_postings(self, word):
+        """Returns the decoded postings of a stemmed word, or None."""
+        entry = self._lookup(word)
+        if entry is None:
+            return None
+        postings = self.postings_cache.get(word)
+        if postings is None:
+            postings = self.lexicon.postings(word, entry)
+            self.postings_cache.put(word, postings)
+        return postings
+
+    def cache_stats(self):
+        """Hit rates and sizes of the result and postings caches, for sizing
+        cache_size and postings_cache_mb."""
+        return {'results': self.result_cache.stats(), 'postings': self.postings_cache.stats()}
+
+    def _get_impacts(self, words):
+        """Returns {word: impact-ordered postings payload} for the words in
+        the index, or None if it was built without that layout."""
+        impacts = {}
+        for word in words:
+            entry = self._lookup(word)
+            if entry is None:
+                continue
+            impacts[word] = self.lexicon.read_impacts(word, entry)
+            if impacts[word] is None:
+                return None
+        return impacts
+
+    def _match_constraints(self, phrases, nears, postings_by_word):
+        """Returns the set of docids satisfying every phrase and NEAR
+        constraint, found by positional intersection of the postings."""
+        constraints = [(phrase, None) for phrase in phrases]
+        constraints += [((left, right), distance) for left, right, distance in nears]
 
+        allowed = None
+        for words, distance in constraints:
+            lists = [postings_by_word.get(word) for word in words]
+            if any(postings is None for postings in lists):
+                return set()
+            if distance is None:
+                docids = set(phrase_doc_ids(lists).tolist())
+            else:
+                docids = set(near_doc_ids(lists[0], lists[1], distance).tolist())
+            allowed = docids if allowed is None else allowed & docids
+        return allowed
+
+    def _score_all(self, stemmed_query, postings_by_word, allowed):
+        """Scores every posting of every query term. Returns {docid: score}."""
         all_postings = {}
-        doc_term_count = {}
         for word in stemmed_query:
-            #Impliment opening file for batches here
-            bucket_key = self._get_bucket_key(word)
-            bucket = self._load_bucket_to_cache(bucket_key)
-            if word not in bucket:
+            postings = postings_by_word[word]
+            if postings is None:
                 continue
             
             idf = self.idf_cache.get(word, 0)
             
-            for docid, posting_data in bucket[word].items():
-                tf = posting_data.get('freq', 0)  # Term frequency in document
-                fields = posting_data.get('fields') or []
-                
-                # TF-IDF score
-                score = (1 + math.log10(tf)) * idf if tf > 0 else 0
-                
-                # Boost for important fields (titles, headers)
-                if fields and 'important' in fields:
-                    score *= 2.5  # Stronger boost for important content
+            for docid, tf, fields in zip(postings.doc_ids.tolist(), postings.freqs.tolist(),
+                                         postings.fields.tolist()):
+                # tf: term frequency in document, fields: field bitmask
+                score = _score(tf, fields, idf)
                 
                 # Accumulate scores for documents
                 all_postings[docid] = all_postings.get(docid, 0) + score
-                doc_term_count[docid] = doc_term_count.get(docid, 0) + 1
+            self.last_query_stats['postings_scored'] += len(postings)
+
+        # keep only documents matching the phrase and proximity constraints
+        if allowed is not None:
+            all_postings = {docid: score for docid, score in all_postings.items() if docid in allowed}
 
         # add page rank to tf-idf
+        static_scores = self.static_scores.values
         for docid in all_postings:
-            url = self.url_mapping.get(str(docid))
-            pr_score = self.page_rank.get(url, 0) 
-            all_postings[docid] += pr_score
+            all_postings[docid] += static_scores[docid]
+        return all_postings
+
+    def _score_top_k(self, stemmed_query, postings_by_word, allowed, k):
+        """
+        Document-at-a-time MaxScore. Each term's score is bounded by its
+        stored max weight x idf and every document's page rank by the largest
+        one. Terms are sorted by bound; the longest prefix of them whose
+        bounds together cannot beat the current k-th score is non-essential:
+        candidates only come from the other (essential) lists, and the
+        non-essential ones are probed by binary search while the document
+        can still enter the top k. Returns the (docid, score) pairs scoring
+        every posting would rank first, ties going to the lower docid.
+        """
+        words = sorted((word for word in dict.fromkeys(stemmed_query) if postings_by_word[word] is not None),
+                       key=lambda word: stemmed_query.count(word) * self.max_weight_cache[word]
+                       * self.idf_cache.get(word, 0))
+        if not words:
+            return []
+        position = {word: i for i, word in enumerate(words)}
+        # terms in query order, repeated words included, to add up scores
+        # in the same order as _score_all
+        query_order = [position[word] for word in stemmed_query if word in position]
 
-        # Sort by score (descending) and get top 5
-        top_docids = heapq.nlargest(5, all_postings.items(), key=lambda x: x[1])
+        counts = [stemmed_query.count(word) for word in words]
+        idfs = [self.idf_cache.get(word, 0) for word in words]
+        bounds = [count * self.max_weight_cache[word] * idf for word, count, idf in zip(words, counts, idfs)]
+        # prefix[i]: the bounds of words[:i] added up
+        prefix = [0.0]
+        for bound in bounds:
+            prefix.append(prefix[-1] + bound)
+        doc_ids = [postings_by_word[word].doc_ids.tolist() for word in words]
+        freqs = [postings_by_word[word].freqs.tolist() for word in words]
+        fields = [postings_by_word[word].fields.tolist() for word in words]
+        lengths = [len(ids) for ids in doc_ids]
+        pointers = [0] * len(words)
+        static_scores = self.static_scores.values
+
+        top = []  # min-heap of (score, -docid)
+        threshold = -math.inf
+        first_essential = 0
+        scored = 0
+        while first_essential < len(words):
+            # next candidate: the smallest current docid of the essential lists
+            doc = min((doc_ids[i][pointers[i]] for i in range(first_essential, len(words))
+                       if pointers[i] < lengths[i]), default=None)
+            if doc is None:
+                break
+
+            term_scores = {}
+            partial = 0.0
+            for i in range(first_essential, len(words)):
+                p = pointers[i]
+                if p < lengths[i] and doc_ids[i][p] == doc:
+                    term_scores[i] = _score(freqs[i][p], fields[i][p], idfs[i])
+                    partial += term_scores[i] * counts[i]
+                    pointers[i] = p + 1
+                    scored += 1
+            if allowed is not None and doc not in allowed:
+                continue
+
+            # probe the non-essential lists, largest bound first
+            remaining = prefix[first_essential] + self.max_page_rank
+            for i in range(first_essential - 1, -1, -1):
+                if partial + remaining <= threshold:
+                    break
+                p = bisect_left(doc_ids[i], doc, pointers[i])
+                pointers[i] = p
+                if p < lengths[i] and doc_ids[i][p] == doc:
+                    term_scores[i] = _score(freqs[i][p], fields[i][p], idfs[i])
+                    partial += term_scores[i] * counts[i]
+                    scored += 1
+                remaining -= bounds[i]
+            if partial + remaining <= threshold:
+                continue
+
+            score = 0
+            for i in query_order:
+                if i in term_scores:
+                    score += term_scores[i]
+            score += static_scores[doc]
+            if len(top) < k:
+                heapq.heappush(top, (score, -doc))
+            elif score > threshold:
+                heapq.heapreplace(top, (score, -doc))
+            else:
+                continue
+
+            if len(top) == k:
+                threshold = top[0][0]
+                while (first_essential < len(words)
+                       and prefix[first_essential + 1] + self.max_page_rank <= threshold):
+                    first_essential += 1
+
+        self.last_query_stats['postings_scored'] += scored
+        return [(-neg_doc, score) for score, neg_doc in sorted(top, reverse=True)]
+
+    def _score_impact_ordered(self, stemmed_query, impacts, k):
+        """
+        Score-at-a-time evaluation over impact-ordered postings, for short
+        queries. Blocks are read across the terms from the highest score
+        down, and reading new documents stops once the unread blocks plus
+        the largest page rank cannot beat the k-th best score seen. The
+        documents seen that could still make it then pick up their scores
+        from the unread blocks. Returns the same scores as _score_top_k;
+        documents tied with the k-th one may differ, as a document that
+        could only tie is never read.
+        """
+        words = list(impacts)
+        if not words:
+            return []
+        position = {word: i for i, word in enumerate(words)}
+        query_order = [position[word] for word in stemmed_query if word in position]
+        counts = [stemmed_query.count(word) for word in words]
+        static_scores = self.static_scores.values
+
+        def blocks(word):
+            idf = self.idf_cache.get(word, 0)
+            for freq, fields, doc_ids in impact_blocks(impacts[word]):
+                yield _score(freq, fields, idf), doc_ids
+
+        streams = [blocks(word) for word in words]
+        heads = [next(stream, None) for stream in streams]
+        term_scores = {}  # docid -> score per term, None where not seen
+        lower = {}  # docid -> page rank plus the term scores seen so far
+        top = {}  # the k docids with the largest lower bounds
+        floor = [-math.inf]  # k-th largest lower bound once there are k
+        read = 0
+
+        def raise_lower(doc, amount):
+            lower[doc] += amount
+            if doc in top or len(top) < k:
+                top[doc] = lower[doc]
+            elif lower[doc] > floor[0]:
+                del top[min(top, key=top.get)]
+                top[doc] = lower[doc]
+            else:
+                return
+            if len(top) == k:
+                floor[0] = min(top.values())
+
+        def head_bound(i):
+            return heads[i][0] * counts[i] if heads[i] is not None else 0
+
+        while any(head is not None for head in heads):
+            # most the unread blocks can add up to for an unseen document
+            if sum(map(head_bound, range(len(words)))) + self.max_page_rank <= floor[0]:
+                break
+            i = max((i for i, head in enumerate(heads) if head is not None), key=head_bound)
+            score, doc_ids = heads[i]
+            heads[i] = next(streams[i], None)
+            read += len(doc_ids)
+            for doc in doc_ids.tolist():
+                if doc not in term_scores:
+                    term_scores[doc] = [None] * len(words)
+                    lower[doc] = 0
+                    raise_lower(doc, static_scores[doc])
+                term_scores[doc][i] = score
+                raise_lower(doc, score * counts[i])
+
+        # documents seen in some terms only can still gain from the unread
+        # blocks of the others; look for them there while they can make it
+        for i in range(len(words)):
+            candidates = []
+            bounds = []
+            for doc, scores in term_scores.items():
+                if scores[i] is None:
+                    others = sum(head_bound(j) for j in range(len(words)) if j != i and scores[j] is None)
+                    if lower[doc] + others + head_bound(i) > floor[0]:
+                        candidates.append(doc)
+                        bounds.append(lower[doc] + others)
+            order = np.argsort(candidates)
+            candidates = np.array(candidates, dtype=np.int64)[order]
+            bounds = np.array(bounds)[order]
+            while candidates.size and heads[i] is not None:
+                score, doc_ids = heads[i]
+                heads[i] = next(streams[i], None)
+                read += len(doc_ids)
+                found = np.isin(candidates, doc_ids, assume_unique=True)
+                for doc in candidates[found].tolist():
+                    term_scores[doc][i] = score
+                    raise_lower(doc, score * counts[i])
+                alive = ~found & (bounds + head_bound(i) > floor[0])
+                candidates, bounds = candidates[alive], bounds[alive]
+            heads[i] = None
+
+        self.last_query_stats['postings_scored'] += read
+        results = []
+        for doc, scores in term_scores.items():
+            if lower[doc] < floor[0]:
+                continue
+            # add up in query order, as _score_all does
+            score = 0
+            for i in query_order:
+                if scores[i] is not None:
+                    score += scores[i]
+            score += static_scores[doc]
+            results.append((doc, score))
+        return heapq.nsmallest(k, results, key=lambda item: (-item[1], item[0]))
+
+    def _score_conjunctive(self, stemmed_query, phrases, nears, k):
+        """
+        Top k (docid, score) of the documents holding every query term. The
+        postings are intersected from the rarest term to the most common:
+        the rarest list is decoded, and every other list is only probed for
+        the doc IDs still in the running, through its skip table unless it
+        is in the postings cache already, so each other list costs at most
+        a skip block per document of the rarest one. Scores are those of
+        _score_all.
+        """
+        words = list(dict.fromkeys(stemmed_query))
+        entries = {word: self._lookup(word) for word in words}
+        self.last_query_stats = {
+            'postings_scored': 0,
+            'postings_total': sum(entry.doc_freq for entry in entries.values() if entry is not None),
+        }
+        if not words or any(entry is None for entry in entries.values()):
+            return []
+
+        words.sort(key=lambda word: entries[word].doc_freq)
+        rarest = self._get_postings(words[0])
+        doc_ids = rarest.doc_ids
+        freqs = {words[0]: rarest.freqs}
+        fields = {words[0]: rarest.fields}
+        read = len(doc_ids)
+        for word in words[1:]:
+            if not len(doc_ids):
+                return []
+            postings = self.postings_cache.get(word)
+            if postings is not None:
+                present, word_freqs, word_fields = postings.find(doc_ids)
+                read += len(doc_ids)
+            else:
+                present, word_freqs, word_fields, decoded = self.lexicon.probe(word, entries[word], doc_ids)
+                read += decoded
+            doc_ids = doc_ids[present]
+            for seen in freqs:
+                freqs[seen], fields[seen] = freqs[seen][present], fields[seen][present]
+            freqs[word], fields[word] = word_freqs, word_fields
+        self.last_query_stats['postings_scored'] = read
+
+        scores = np.zeros(len(doc_ids))
+        for word in stemmed_query:
+            scores += self._term_weights(word, freqs[word], fields[word])
+        if phrases or nears:
+            constraint_words = {word for phrase in phrases for word in phrase}
+            constraint_words |= {word for left, right, _ in nears for word in (left, right)}
+            allowed = self._match_constraints(phrases, nears, {word: self._get_postings(word)
+                                                               for word in constraint_words})
+            keep = np.isin(doc_ids, np.fromiter(allowed, dtype=np.int64, count=len(allowed)))
+            doc_ids, scores = doc_ids[keep], scores[keep]
+        return self._top_k(doc_ids, scores + self.static_scores.array[doc_ids], k)
+
+    def query(self, q, exhaustive=False, conjunctive=False):
+        """Given a list of terms, check respective files for the token and
+        then return the postings for each token and check intersections of
+        the postings. Quoted phrases and NEAR/k pairs restrict the results to
+        documents where the terms occur together. Returns the top 5 urls,
+        found with MaxScore pruning unless exhaustive is set; repeated
+        queries are answered from the result cache. With conjunctive set,
+        documents holding every term rank first, and if fewer than 5 do,
+        the rest come from the ranking without it."""
+
+        self._check_generation()
+        stemmed_query, phrases, nears = self._parse(q)
+        key = self._cache_key(stemmed_query, phrases, nears, exhaustive, conjunctive)
+        with self.index_lock.reading():
+            top_urls = self.result_cache.get(key)
+            if top_urls is None:
+                top_urls = self._rank(stemmed_query, phrases, nears, exhaustive, conjunctive)
+                self.result_cache.put(key, top_urls)
+            else:
+                self.last_query_stats = {'postings_scored': 0, 'postings_total': 0}
+        return list(top_urls)
+
+    def _parse(self, q):
+        """Returns the stemmed terms, phrases and NEAR pairs of a query."""
+        phrases, nears = self._extract_constraints(q)
+        terms = self._extract_terms(re.sub(r'NEAR/\d+', ' ', q))
+        # Stem all query terms
+        stemmed_query = [stemmer.stem(term) for term in terms]
+        return stemmed_query, phrases, nears
+
+    def _cache_key(self, stemmed_query, phrases, nears, *options):
+        # the same terms in any order, case or inflection rank the same
+        # documents, so they share one cache entry
+        return (tuple(sorted(stemmed_query)), tuple(tuple(phrase) for phrase in phrases),
+                tuple(nears)) + options
+
+    def _tf_weights(self, freqs):
+        """1 + log10 tf of every frequency, from a table of math.log10 so
+        the weights round exactly as in _score."""
+        largest = int(freqs.max(initial=0))
+        # read once: a concurrent query may publish a table of its own
+        table = self.tf_weight_table
+        if largest >= len(table):
+            table = np.array([0.0] + [1 + math.log10(tf) for tf in range(1, 2 * largest + 1)])
+            self.tf_weight_table = table
+        return table[freqs]
+
+    def _term_weights(self, word, freqs, fields):
+        """The scores _score gives postings of word, vectorized."""
+        weights = self._tf_weights(freqs) * self.idf_cache.get(word, 0)
+        weights[(fields & IMPORTANT) != 0] *= IMPORTANT_BOOST
+        return weights
+
+    @staticmethod
+    def _top_k(doc_ids, scores, k):
+        """The k best (docid, score) by score, ties going to the lower docid."""
+        if len(doc_ids) > k:
+            # everything scoring at least the k-th best, then by score and
+            # lower docid
+            kth = np.partition(scores, len(scores) - k)[len(scores) - k]
+            candidates = scores >= kth
+            doc_ids, scores = doc_ids[candidates], scores[candidates]
+        best = np.lexsort((doc_ids, -scores))[:k]
+        return list(zip(doc_ids[best].tolist(), scores[best].tolist()))
+
+    def query_batch(self, queries, k=5):
+        """
+        Answers many queries at once, for offline evaluation. Every distinct
+        term across the batch is looked up once, shard by shard, and its
+        postings are turned into an array of scores once; each query then
+        adds up its terms' arrays per document with NumPy and keeps the top
+        k. Returns the top k (url, score) of every query, in order, with
+        the scores of query(q, exhaustive=True) and ties going to the lower
+        docid.
+        """
+        self._check_generation()
+        with self.index_lock.reading():
+            parsed = [self._parse(q) for q in queries]
+
+            # read the terms shard by shard (shards are term ranges of a bucket), in term order
+            words = {word for stemmed_query, phrases, nears in parsed for word in stemmed_query}
+            postings_by_word = {}
+            weights_by_word = {}
+            for word in sorted(words, key=lambda word: (bucket_key(word), word)):
+                postings = self._get_postings(word)
+                postings_by_word[word] = postings
+                if postings is not None:
+                    weights_by_word[word] = self._term_weights(word, postings.freqs, postings.fields)
+            page_ranks = self.static_scores.array
+            # per-document score accumulator and matched flags, reset after
+            # every query
+            accumulator = np.zeros(self.max_doc_id + 1)
+            matched = np.zeros(self.max_doc_id + 1, dtype=bool)
+
+            results = []
+            ranked = {}  # identical queries in the batch are scored once
+            scored = 0
+            for stemmed_query, phrases, nears in parsed:
+                key = self._cache_key(stemmed_query, phrases, nears, k)
+                if key not in ranked:
+                    present = [word for word in stemmed_query if postings_by_word[word] is not None]
+                    top_docids = []
+                    if present:
+                        # one term at a time in query order (a doc id occurs
+                        # once per term), so scores add up as in _score_all
+                        for word in present:
+                            doc_ids = postings_by_word[word].doc_ids
+                            accumulator[doc_ids] += weights_by_word[word]
+                            matched[doc_ids] = True
+                            scored += len(doc_ids)
+                        docs = np.flatnonzero(matched)
+                        scores = accumulator[docs]
+                        accumulator[docs] = 0
+                        matched[docs] = False
+                        if phrases or nears:
+                            allowed = self._match_constraints(phrases, nears, postings_by_word)
+                            keep = np.isin(docs, np.fromiter(allowed, dtype=np.int64, count=len(allowed)))
+                            docs, scores = docs[keep], scores[keep]
+                        top_docids = self._top_k(docs, scores + page_ranks[docs], k)
+                    ranked[key] = [(self.url_mapping.get(docid, "URL not found"), score)
+                                   for docid, score in top_docids]
+                results.append(list(ranked[key]))
+
+            self.last_query_stats = {'postings_scored': scored, 'postings_total': scored}
+            return results
+
+    def _rank(self, stemmed_query, phrases, nears, exhaustive, conjunctive=False, k=5):
+        """Top k (url, score) of the stemmed query terms under the phrase
+        and NEAR constraints."""
+        top_docids = []
+        if conjunctive:
+            top_docids = self._score_conjunctive(stemmed_query, phrases, nears, k)
+        if len(top_docids) < k:
+            # too few documents hold every term: fill up from the ranking of
+            # documents holding any of them
+            and_stats = self.last_query_stats if conjunctive else None
+            matched = {docid for docid, _ in top_docids}
+            fallback = self._rank_any(stemmed_query, phrases, nears, exhaustive, k + len(matched))
+            top_docids += [(docid, score) for docid, score in fallback if docid not in matched][:k - len(top_docids)]
+            if and_stats is not None:
+                self.last_query_stats = {name: count + and_stats[name]
+                                         for name, count in self.last_query_stats.items()}
 
         # Convert docIDs to URLs with scores
-        top_urls = [(self.url_mapping.get(str(docid), "URL not found"), score)
-                    for docid, score in top_docids]
-        return top_urls
+        return [(self.url_mapping.get(docid, "URL not found"), score) for docid, score in top_docids]
+
+    def _rank_any(self, stemmed_query, phrases, nears, exhaustive, k):
+        """Top k (docid, score) of the documents holding any query term."""
+        words = list(dict.fromkeys(stemmed_query))
+        if not exhaustive and not (phrases or nears) and len(words) <= IMPACT_MAX_TERMS:
+            impacts = self._get_impacts(words)
+            if impacts is not None:
+                self.last_query_stats = {
+                    'postings_scored': 0,
+                    'postings_total': sum(self.lexicon.lookup(word).doc_freq for word in impacts),
+                }
+                return self._score_impact_ordered(stemmed_query, impacts, k)
+
+        postings_by_word = {}
+        for word in stemmed_query:
+            if word not in postings_by_word:
+                postings_by_word[word] = self._get_postings(word)
+        self.last_query_stats = {
+            'postings_scored': 0,
+            'postings_total': sum(len(p) for p in postings_by_word.values() if p is not None),
+        }
+
+        allowed = None
+        if phrases or nears:
+            allowed = self._match_constraints(phrases, nears, postings_by_word)
+
+        if exhaustive:
+            all_postings = self._score_all(stemmed_query, postings_by_word, allowed)
+            # Sort by score (descending) and get top k
+            return heapq.nlargest(k, all_postings.items(), key=lambda x: x[1])
+        return self._score_top_k(stemmed_query, postings_by_word, allowed, k)
 
 
     def print_query_results(self, top_urls):
@@ -136,4 +740,17 @@ class Query:
             print(f"URL: {url} | Score: {score:.4f}")
 
 
-process_query = Query()
\ No newline at end of file
+_engine = None
+_engine_lock = Lock()
+
+
+def get_query_engine():
+    """Returns the shared Query, opening the index on first use rather than
+    when this module is imported. It adds the page ranks launch.py writes
+    to static_scores.bin, or 0 until there is such a file."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = Query(static_scores_filename='static_scores.bin')
+    return _engine
@@ -1,17 +1,12 @@
 import re
 import json
 from pathlib import Path
-from bs4 import BeautifulSoup
 from urllib.parse import urlparse, parse_qs, urlencode, urljoin, urldefrag
-from bs4 import XMLParsedAsHTMLWarning
-import warnings
 
 from analyze import analysis
+from document import process_document
 from index_vars import page_rank
 
-# Suppress XML warnings
-warnings.filterwarnings("ignore", category=XMLParsedAsHTMLWarning)
-
 
 def scraper(filepath, json_dir, url_to_file_map):
     """ 
@@ -68,42 +63,20 @@ def extract_next_links(filepath, json_dir, url_to_file_map):
         if len(html_content) < 500:
             return []
 
+        # parse once, for both the analysis and the links
+        document = process_document(url, html_content)
+
         # do analysis
-        analysis(url, html_content)
+        analysis(url, document)
 
-        # parse with BeautifulSoup for links
-        soup = BeautifulSoup(html_content, 'html.parser')
+        outgoing_urls = extract_outgoing_urls(url, document.hrefs)
+
+        # Look up the corresponding files in our mapping
         found_files = []
-        outgoing_urls = set()
-
-        # extract links from HTML content
-        for a in soup.find_all('a', href=True):
-            href = a['href']
-
-            # Skip empty hrefs and fragments
-            if not href or href.startswith('#') or href.startswith('javascript:'):
-                continue
-
-            try:
-                # Convert relative URLs to absolute using the page's URL
-                absolute_url = urljoin(url, href)
-                
-                # defragment
-                absolute_url, _ = urldefrag(absolute_url)
-                
-                # Normalize the URL
-                absolute_url = normalize_url(absolute_url)
-
-                # add outgoing links for PR
-                outgoing_urls.add(absolute_url) 
-                
-                # Look up the corresponding file in our mapping
-                target_file = url_to_file_map.get(absolute_url)
-                if target_file:
-                    found_files.append(target_file)
-
-            except Exception as e:
-                continue
+        for absolute_url in outgoing_urls:
+            target_file = url_to_file_map.get(absolute_url)
+            if target_file:
+                found_files.append(target_file)
 
         page_rank.update_links(url, outgoing_urls)
 
@@ -112,6 +85,39 @@ def extract_next_links(filepath, json_dir, url_to_file_map):
         return []
 
 
+def extract_outgoing_urls(url, hrefs):
+    """
+    Description: collect the outgoing links of a parsed page
+
+    Input: the page's url and the hrefs of its links
+    Output: set of absolute, defragmented and normalized urls
+    """
+    outgoing_urls = set()
+
+    for href in hrefs:
+        # Skip empty hrefs and fragments
+        if not href or href.startswith('#') or href.startswith('javascript:'):
+            continue
+
+        try:
+            # Convert relative URLs to absolute using the page's URL
+            absolute_url = urljoin(url, href)
+            
+            # defragment
+            absolute_url, _ = urldefrag(absolute_url)
+            
+            # Normalize the URL
+            absolute_url = normalize_url(absolute_url)
+
+            # add outgoing links for PR
+            outgoing_urls.add(absolute_url) 
+
+        except Exception as e:
+            continue
+
+    return outgoing_urls
+
+
 def is_valid(filepath):
     """
     Description: Decide whether to process this file or not
@@ -0,0 +1,489 @@
+import heapq
+import os
+import shutil
+import time
+from bisect import bisect_left
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from itertools import groupby
+from operator import itemgetter
+from threading import Lock, Thread
+
+# pip install orjson
+import orjson
+# pip install numpy
+import numpy as np
+
+from binary_index import (BUCKET_KEYS, BucketWriter, Lexicon, TermEntry, index_files_dir, index_manifest_filename,
+                          read_index_manifest, write_generation, write_index_manifest)
+from corpus_manifest import indexed_url, walk_json_files
+from index import DEFAULT_SHARD_MB, remove_shard_files, shard_files_size
+from postings import (concat_postings, decode_postings, encode_impact_postings, encode_postings,
+                      max_term_weight, select_postings)
+from utils import get_logger
+
+logger = get_logger("SEGMENTS")
+
+# File layout of an incrementally updated index (index_dir/segments.json):
+#   segments : name, first and last doc ID, documents and bytes of every
+#              segment, in doc ID order. A segment is a directory of shards
+#              with the layout of a merged index; the base segment, '.', is
+#              the full build in index_dir itself
+#   deleted  : doc IDs of deleted documents still held by a segment
+#   retired  : doc IDs that are no documents (any more): ever deleted,
+#              held or merged away, or given to a page that was not indexed
+#   files    : size, mtime and doc ID (0 if not indexed) of every JSON
+#              document indexed, by path
+SEGMENTS_VERSION = 1
+BASE_SEGMENT = '.'
+# adjacent segments of one size tier merged together
+DEFAULT_MERGE_FACTOR = 4
+# segments of up to this many documents are all in the lowest tier
+FLOOR_DOCS = 1000
+
+# a term of a SegmentedLexicon: its statistics over every segment, and the
+# (segment number, TermEntry) of each segment holding it
+SegmentEntry = namedtuple('SegmentEntry', TermEntry._fields + ('parts',))
+
+
+def segments_filename(index_dir):
+    return os.path.join(index_dir, 'segments.json')
+
+
+def segment_dir(index_dir, name):
+    return os.path.join(index_dir, name)
+
+
+def read_segments(index_dir):
+    """Return the segment state of index_dir, or None if it has none."""
+    try:
+        with open(segments_filename(index_dir), 'rb') as f:
+            state = orjson.loads(f.read())
+    except FileNotFoundError:
+        return None
+    return state if state.get('version') == SEGMENTS_VERSION else None
+
+
+def write_segments(index_dir, state):
+    path = segments_filename(index_dir)
+    temp_path = f'{path}.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(orjson.dumps(state))
+    os.replace(temp_path, path)
+
+
+def open_lexicon(index_dir):
+    """Returns the Lexicon of index_dir, or a SegmentedLexicon if
+    incremental updates left it in several segments or with deleted
+    documents, and the number of doc IDs that are no documents."""
+    state = read_segments(index_dir)
+    if state is None:
+        return Lexicon(index_dir), 0
+    segments = state['segments']
+    if len(segments) == 1 and not state['deleted']:
+        return Lexicon(segment_dir(index_dir, segments[0]['name'])), state['retired']
+    return SegmentedLexicon(index_dir, state), state['retired']
+
+
+class SegmentedLexicon:
+    """
+    Lexicon over the segments of an incrementally updated index, with the
+    lookups Query uses. Segments hold consecutive doc ID ranges in order,
+    so the postings of a term are those of every segment holding it joined
+    in segment order, less the deleted documents. A term's statistics
+    still count its deleted documents until a merge drops them.
+    """
+
+    def __init__(self, index_dir, state):
+        self.lexicons = [Lexicon(segment_dir(index_dir, segment['name'])) for segment in state['segments']]
+        self.last_docs = np.array([segment['last_doc'] for segment in state['segments']], dtype=np.int64)
+        deleted = np.array(state['deleted'], dtype=np.int64)
+        self.live = np.ones(max(int(self.last_docs.max(initial=0)), int(deleted.max(initial=0))) + 1, dtype=bool)
+        self.live[deleted] = False
+        # segments with deleted documents, whose postings are filtered
+        self.with_deleted = set(np.searchsorted(self.last_docs, deleted).tolist())
+
+    def __len__(self):
+        return sum(len(lexicon) for lexicon in self.lexicons)
+
+    def lookup(self, term):
+        """Return the SegmentEntry of term, or None."""
+        parts = []
+        for i, lexicon in enumerate(self.lexicons):
+            entry = lexicon.lookup(term)
+            if entry is not None:
+                parts.append((i, entry))
+        if not parts:
+            return None
+        entries = [entry for _, entry in parts]
+        return SegmentEntry(sum(entry.doc_freq for entry in entries), sum(entry.coll_freq for entry in entries),
+                            0, 0, max(entry.max_weight for entry in entries), 0, 0, tuple(parts))
+
+    def postings(self, term, entry=None):
+        """Return the decoded PostingsList of term, or None if absent."""
+        entry = entry or self.lookup(term)
+        if entry is None:
+            return None
+        lists = []
+        for i, part in entry.parts:
+            postings = self.lexicons[i].postings(term, part)
+            if i in self.with_deleted:
+                postings = select_postings(postings, self.live[postings.doc_ids])
+            lists.append(postings)
+        return lists[0] if len(lists) == 1 else concat_postings(lists)
+
+    def probe(self, term, entry, doc_ids):
+        """probe_postings of term's postings for the sorted doc_ids, each
+        segment probed for the doc IDs in its range. doc_ids are expected
+        to be live."""
+        present = np.zeros(len(doc_ids), dtype=bool)
+        freqs, fields = [], []
+        decoded = 0
+        # doc_ids[ends[i - 1]:ends[i]] fall in segment i
+        ends = np.searchsorted(doc_ids, self.last_docs, side='right')
+        for i, part in entry.parts:
+            lo, hi = (ends[i - 1] if i else 0), ends[i]
+            if lo == hi:
+                continue
+            found, part_freqs, part_fields, part_decoded = self.lexicons[i].probe(term, part, doc_ids[lo:hi])
+            present[lo:hi] = found
+            freqs.append(part_freqs)
+            fields.append(part_fields)
+            decoded += part_decoded
+        empty = np.zeros(0, dtype=np.int64)
+        return (present, np.concatenate(freqs) if freqs else empty, np.concatenate(fields) if fields else empty,
+                decoded)
+
+    def read_impacts(self, term, entry):
+        """Return the impact-ordered postings payload of term, or None
+        unless they are all in one segment without deleted documents."""
+        if len(entry.parts) != 1 or entry.parts[0][0] in self.with_deleted:
+            return None
+        i, part = entry.parts[0]
+        return self.lexicons[i].read_impacts(term, part)
+
+    def close(self):
+        for lexicon in self.lexicons:
+            lexicon.close()
+
+
+def _segment_terms(segment, readers):
+    """Yield (term bytes, segment number, reader, TermEntry) of every term
+    of a segment's shards of one bucket, in term order."""
+    for reader in readers:
+        for term, entry in reader.items():
+            yield term.encode('utf-8'), segment, reader, entry
+
+
+class SegmentSet:
+    """
+    The segments of an incrementally updated index. The full build is the
+    base segment; every update adds a segment of the documents added or
+    changed since, under new doc IDs, and marks the doc IDs of their
+    previous versions and of removed documents as deleted. Whenever
+    merge_factor adjacent segments are in the same size tier (documents
+    over FLOOR_DOCS, in powers of merge_factor), a background thread merges
+    them into one and drops their deleted documents, so a document is
+    rewritten about log(N) / log(merge_factor) times. Every change writes
+    a new index generation, which running queries pick up.
+    """
+
+    def __init__(self, index_dir='main_index', merge_factor=DEFAULT_MERGE_FACTOR, shard_mb=DEFAULT_SHARD_MB,
+                 impact_ordered=False):
+        self.index_dir = index_dir
+        self.merge_factor = max(2, merge_factor)
+        self.shard_mb = shard_mb
+        self.impact_ordered = impact_ordered
+        # guards state, which the merge thread updates too
+        self.lock = Lock()
+        self.state = read_segments(index_dir)
+        self.merger = None
+        self.merge_requested = False
+        self.merge_error = None
+
+    def segment_dir(self, name):
+        return segment_dir(self.index_dir, name)
+
+    def reset(self, json_dir, url_index):
+        """Makes the full build in index_dir the only segment, recording
+        the doc ID of every JSON document under json_dir from url_index.
+        Doc IDs whose url url_index forgot, of pages that were not indexed,
+        are retired."""
+        paths, stats = [], []
+        for filepath, stat in walk_json_files(os.path.abspath(json_dir)):
+            paths.append(filepath)
+            stats.append(stat)
+        # reading is I/O bound, so threads overlap it well
+        with ThreadPoolExecutor() as pool:
+            urls = list(pool.map(indexed_url, paths))
+        files = {filepath: [stat.st_size, stat.st_mtime_ns, url_index.ids.get(url, 0)]
+                 for filepath, stat, url in zip(paths, stats, urls)}
+
+        with self.lock:
+            previous = self.state['segments'] if self.state else []
+            self.state = {
+                'version': SEGMENTS_VERSION,
+                'next_segment': 1,
+                'segments': [{'name': BASE_SEGMENT, 'first_doc': 1, 'last_doc': url_index.length(),
+                              'docs': url_index.length(), 'bytes': self._segment_bytes(BASE_SEGMENT)}],
+                'deleted': [],
+                'retired': url_index.length() - url_index.live_count(),
+                'files': files,
+            }
+            write_segments(self.index_dir, self.state)
+            write_generation(self.index_dir)
+        for segment in previous:
+            if segment['name'] != BASE_SEGMENT:
+                self._remove_segment(segment['name'])
+
+    def changes(self, json_dir):
+        """Returns the (path, [size, mtime_ns]) of every JSON document under
+        json_dir that is new or changed since it was indexed, and the paths
+        of indexed documents that are gone."""
+        files = self.state['files']
+        changed = []
+        seen = set()
+        for filepath, stat in walk_json_files(os.path.abspath(json_dir)):
+            seen.add(filepath)
+            entry = files.get(filepath)
+            if entry is None or entry[0] != stat.st_size or entry[1] != stat.st_mtime_ns:
+                changed.append((filepath, [stat.st_size, stat.st_mtime_ns]))
+        removed = [filepath for filepath in files if filepath not in seen]
+        return changed, removed
+
+    def doc_id(self, filepath):
+        """Doc ID of an indexed JSON document, or 0."""
+        entry = self.state['files'].get(filepath)
+        return entry[2] if entry else 0
+
+    def is_deleted(self, doc_id):
+        """Whether doc_id is deleted and still held by a segment."""
+        deleted = self.state['deleted']
+        i = bisect_left(deleted, doc_id)
+        return i < len(deleted) and deleted[i] == doc_id
+
+    def new_segment(self):
+        """Name of a segment to write; the name is taken once it is added."""
+        with self.lock:
+            name = f"segment_{self.state['next_segment']:06d}"
+            self.state['next_segment'] += 1
+        if os.path.exists(self.segment_dir(name)):
+            # left by an update that did not finish
+            shutil.rmtree(self.segment_dir(name))
+        return name
+
+    def add_segment(self, name, first_doc, last_doc, deleted, files, removed, skipped=()):
+        """Records segment name, holding doc IDs first_doc to last_doc, the
+        deleted doc IDs, the {path: [size, mtime_ns, doc ID]} of the
+        documents it indexed, the paths of removed documents and the doc
+        IDs in its range that it did not index after all, then starts
+        merging in the background."""
+        with self.lock:
+            if last_doc >= first_doc:
+                self.state['segments'].append({'name': name, 'first_doc': first_doc, 'last_doc': last_doc,
+                                               'docs': last_doc - first_doc + 1,
+                                               'bytes': self._segment_bytes(name)})
+            newly_deleted = set(deleted) - set(self.state['deleted'])
+            self.state['deleted'] = sorted(set(self.state['deleted']) | newly_deleted)
+            self.state['retired'] += len(newly_deleted) + len(skipped)
+            self.state['files'].update(files)
+            for filepath in removed:
+                self.state['files'].pop(filepath, None)
+            write_segments(self.index_dir, self.state)
+            write_generation(self.index_dir)
+        if last_doc < first_doc:
+            self._remove_segment(name)
+        self.start_merging()
+
+    def _segment_bytes(self, name):
+        directory = self.segment_dir(name)
+        return sum(shard['bytes'] for shard in read_index_manifest(directory) or [])
+
+    def _tier(self, segment, deleted):
+        """Size tier of a segment by its documents, deleted ones left out."""
+        docs = segment['docs'] - int(np.count_nonzero((deleted >= segment['first_doc'])
+                                                        & (deleted <= segment['last_doc'])))
+        tier = 0
+        while docs >= FLOOR_DOCS * self.merge_factor ** (tier + 1):
+            tier += 1
+        return tier
+
+    def _plan_merge(self, force=False):
+        """The adjacent segments to merge next, smallest tier first, or
+        None. With force, every segment while there are several or any
+        deleted documents."""
+        segments = self.state['segments']
+        if force:
+            return list(segments) if len(segments) > 1 or self.state['deleted'] else None
+        deleted = np.array(self.state['deleted'], dtype=np.int64)
+        tiers = [self._tier(segment, deleted) for segment in segments]
+        best = None
+        for start in range(len(segments) - self.merge_factor + 1):
+            window = tiers[start:start + self.merge_factor]
+            if min(window) == max(window) and (best is None or window[0] < tiers[best]):
+                best = start
+        return list(segments[best:best + self.merge_factor]) if best is not None else None
+
+    def merge(self, force=False):
+        """Runs the merges the policy picks until there are none left; with
+        force, first merges every segment into one. Returns the number of
+        merges. Not to be called while a background merge runs."""
+        merges = 0
+        while True:
+            with self.lock:
+                plan = self._plan_merge(force and merges == 0)
+            if plan is None:
+                return merges
+            self._merge(plan)
+            merges += 1
+
+    def start_merging(self):
+        """Runs merge() on a background thread, unless one is running; it
+        then plans again once done. The thread is not a daemon, so the
+        process finishes the merges before it exits."""
+        with self.lock:
+            self.merge_requested = True
+            if self.merger is None:
+                self.merger = Thread(target=self._merge_in_background)
+                self.merger.start()
+
+    def _merge_in_background(self):
+        while True:
+            with self.lock:
+                if not self.merge_requested or self.merge_error is not None:
+                    self.merger = None
+                    return
+                self.merge_requested = False
+            try:
+                self.merge()
+            except Exception as e:
+                # raised again by wait_for_merges
+                logger.error(f"Segment merge failed: {e}")
+                self.merge_error = e
+
+    def wait_for_merges(self):
+        """Blocks until the background merges are done; raises the error
+        of a failed one."""
+        merger = self.merger
+        if merger is not None:
+            merger.join()
+        if self.merge_error is not None:
+            raise self.merge_error
+
+    def _merge(self, segments):
+        """Merges consecutive segments into a new one without their deleted
+        documents and swaps it in for them."""
+        start = time.perf_counter()
+        first_doc, last_doc = segments[0]['first_doc'], segments[-1]['last_doc']
+        with self.lock:
+            deleted = [doc_id for doc_id in self.state['deleted'] if first_doc <= doc_id <= last_doc]
+        name = self.new_segment()
+        os.makedirs(self.segment_dir(name))
+        try:
+            manifest = self._write_merged(segments, np.array(deleted, dtype=np.int64), self.segment_dir(name))
+            write_index_manifest(self.segment_dir(name), manifest)
+        except BaseException:
+            # nothing refers to the segment yet
+            self._remove_segment(name)
+            raise
+
+        merged = {'name': name, 'first_doc': first_doc, 'last_doc': last_doc,
+                  'docs': sum(segment['docs'] for segment in segments) - len(deleted),
+                  'bytes': sum(shard['bytes'] for shard in manifest)}
+        names = [segment['name'] for segment in segments]
+        with self.lock:
+            current = [segment['name'] for segment in self.state['segments']]
+            at = current.index(names[0])
+            self.state['segments'][at:at + len(names)] = [merged]
+            # documents deleted while merging are still in the merged segment
+            dropped = set(deleted)
+            self.state['deleted'] = [doc_id for doc_id in self.state['deleted'] if doc_id not in dropped]
+            write_segments(self.index_dir, self.state)
+            write_generation(self.index_dir)
+        # readers still mapping the old files keep them until they reopen
+        for old in names:
+            self._remove_segment(old)
+        logger.info(f"Merged {len(names)} segments ({merged['docs']} documents, {len(deleted)} deleted "
+                    f"dropped) into {name}, {merged['bytes'] / 1024 / 1024:.2f} MB in "
+                    f"{time.perf_counter() - start:.2f} s")
+
+    def _write_merged(self, segments, deleted, output_dir):
+        """Streams the terms of segments, in term order per bucket, into
+        shards of about shard_mb in output_dir. The postings of a term held
+        by one segment and by none of the deleted documents are copied as
+        they are. Returns the shard list of the index manifest."""
+        lexicons = [Lexicon(self.segment_dir(segment['name'])) for segment in segments]
+        with_deleted = [bool(np.any((deleted >= segment['first_doc']) & (deleted <= segment['last_doc'])))
+                        for segment in segments]
+        shard_bytes = max(1, int(self.shard_mb * 1024 * 1024))
+        manifest = []
+        try:
+            for bucket in BUCKET_KEYS:
+                streams = [_segment_terms(i, lexicon.shards[bucket][1])
+                           for i, lexicon in enumerate(lexicons) if bucket in lexicon.shards]
+                writer = None
+                shards = 0
+                for term, group in groupby(heapq.merge(*streams, key=itemgetter(0)), key=itemgetter(0)):
+                    term = term.decode('utf-8')
+                    parts = [(i, reader, entry) for _, i, reader, entry in group]
+                    lists = []
+                    removed = False
+                    if len(parts) > 1 or with_deleted[parts[0][0]]:
+                        for i, reader, entry in parts:
+                            postings = decode_postings(reader.postings_at(entry))
+                            if with_deleted[i]:
+                                keep = ~np.isin(postings.doc_ids, deleted)
+                                removed |= not keep.all()
+                                postings = select_postings(postings, keep)
+                            if len(postings):
+                                lists.append(postings)
+                        if not lists:
+                            continue
+                    if len(parts) == 1 and not removed:
+                        _, reader, entry = parts[0]
+                        payload = reader.postings_at(entry)
+                        impact_payload = reader.impacts_at(entry) if self.impact_ordered else b''
+                        if impact_payload is None:
+                            impact_payload = encode_impact_postings(lists[0] if lists else decode_postings(payload))
+                        doc_freq, max_weight, coll_freq = entry.doc_freq, entry.max_weight, entry.coll_freq
+                    else:
+                        postings = lists[0] if len(lists) == 1 else concat_postings(lists)
+                        payload = encode_postings(postings)
+                        impact_payload = encode_impact_postings(postings) if self.impact_ordered else b''
+                        doc_freq, max_weight = len(postings), max_term_weight(postings)
+                        coll_freq = int(postings.freqs.sum())
+
+                    if writer is None:
+                        # the first shard of a bucket is named after it
+                        key = f"{bucket}.{shards}" if shards else bucket
+                        shards += 1
+                        writer = BucketWriter(output_dir, key, self.impact_ordered)
+                        manifest.append({'key': key, 'bucket': bucket, 'first_term': term, 'terms': 0, 'bytes': 0})
+                    writer.add_term(term, doc_freq, payload, max_weight, coll_freq, impact_payload)
+                    manifest[-1]['terms'] += 1
+                    if writer.offset >= shard_bytes:
+                        writer.close()
+                        manifest[-1]['bytes'] = shard_files_size(output_dir, manifest[-1]['key'])
+                        writer = None
+                if writer is not None:
+                    writer.close()
+                    manifest[-1]['bytes'] = shard_files_size(output_dir, manifest[-1]['key'])
+        finally:
+            for lexicon in lexicons:
+                lexicon.close()
+        return manifest
+
+    def _remove_segment(self, name):
+        if name != BASE_SEGMENT:
+            shutil.rmtree(self.segment_dir(name), ignore_errors=True)
+            return
+        # the base segment shares index_dir with the segment state; its
+        # shards are in the directory of the full build
+        files_dir = index_files_dir(self.index_dir)
+        if os.path.normpath(files_dir) == os.path.normpath(self.index_dir):
+            for shard in read_index_manifest(self.index_dir) or []:
+                remove_shard_files(self.index_dir, shard['key'])
+        else:
+            shutil.rmtree(files_dir, ignore_errors=True)
+        if os.path.exists(index_manifest_filename(self.index_dir)):
+            os.remove(index_manifest_filename(self.index_dir))
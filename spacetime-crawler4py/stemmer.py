@@ -1,12 +1,30 @@
 # run the following to enable nltk
 # pip install nltk
 from nltk.stem import SnowballStemmer
+from itertools import islice
+import os
+
+# pip install orjson
+import orjson
+
+STEM_TABLE_VERSION = 1
+# tokens kept in the stem table, about 150 bytes of memory each
+DEFAULT_MAX_ENTRIES = 1_000_000
 
 
 class Stemmer:
-    def __init__(self) -> None:
+    """
+    Snowball stemmer with a table of the stem of every token seen, so each
+    distinct token is stemmed once. The table holds at most max_entries
+    tokens; past that, new tokens are stemmed on every call. save() and
+    load() keep the table between runs, and worker processes forked after
+    load() share it.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES) -> None:
         self.stemmer = SnowballStemmer("english")
         self.cache = {}  # improve performance for already stemmed words
+        self.max_entries = max_entries
         self.exceptions = self._load_exceptions()
 
     def _load_exceptions(self):
@@ -29,12 +47,54 @@ class Stemmer:
     def stem(self, token):
         if (token in self.cache):
             return self.cache[token]
+        return self._stem(token)
 
+    def _stem(self, token):
         if token.lower() in self.exceptions:
             results = self.exceptions[token.lower()]
+        else:
+            results = self.stemmer.stem(token)
+        if len(self.cache) < self.max_entries:
             self.cache[token] = results
-            return results
+        return results
+
+    def stem_all(self, tokens):
+        """Returns {token: stem} of distinct tokens, stemming only those not
+        in the table yet."""
+        cache = self.cache
+        stems = {}
+        for token in tokens:
+            stem = cache.get(token)
+            stems[token] = stem if stem is not None else self._stem(token)
+        return stems
+
+    def entries_after(self, count):
+        """Table entries added after the first count, e.g. by a worker
+        process, for update() in the parent."""
+        return dict(islice(self.cache.items(), count, None))
+
+    def update(self, entries):
+        for token, stem in entries.items():
+            if len(self.cache) >= self.max_entries:
+                break
+            self.cache.setdefault(token, stem)
+
+    def load(self, table_file):
+        """Adds the entries saved in table_file, if it exists."""
+        if not table_file or not os.path.exists(table_file):
+            return
+        try:
+            with open(table_file, 'rb') as f:
+                data = orjson.loads(f.read())
+        except (OSError, orjson.JSONDecodeError):
+            return
+        if data.get('version') == STEM_TABLE_VERSION:
+            self.update(data['entries'])
 
-        stemmed_word = self.stemmer.stem(token)
-        self.cache[token] = stemmed_word
-        return stemmed_word
+    def save(self, table_file):
+        if not table_file:
+            return
+        temp_file = f"{table_file}.tmp"
+        with open(temp_file, 'wb') as f:
+            f.write(orjson.dumps({'version': STEM_TABLE_VERSION, 'entries': self.cache}))
+        os.replace(temp_file, table_file)
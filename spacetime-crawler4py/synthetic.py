@@ -0,0 +1,48 @@
+"""
+Synthetic index data for benchmark.py and the tests, so both can run
+without the DEV corpus.
+"""
+import os
+import random
+import string
+
+from binary_index import BUCKET_KEYS, BucketWriter, write_url_file
+from postings import Posting, encode_impact_postings, encode_postings, from_postings_dict, max_term_weight
+
+
+def synthetic_postings(num_docs, num_terms, seed=0):
+    """Zipf-like vocabulary: term i appears in about num_docs / (i + 1) docs."""
+    rng = random.Random(seed)
+    index = {}
+    for i in range(num_terms):
+        df = max(1, int(num_docs / (i + 1)))
+        doc_postings = {}
+        for doc_id in rng.sample(range(1, num_docs + 1), df):
+            posting = Posting()
+            posting.add_entry(min(1 + int(rng.expovariate(0.5)), 200),
+                              ['important'] if rng.random() < 0.1 else [])
+            doc_postings[doc_id] = posting
+        index[f"term{i}"] = doc_postings
+    return index
+
+
+def write_synthetic_index(directory, num_docs, num_terms, seed=0, impact_ordered=False):
+    """Writes main_index/ and url_id_index.bin for synthetic_postings under
+    directory. Returns the vocabulary, most frequent term first."""
+    # words that stem to themselves, spread over the letter buckets
+    vocabulary = [f"{string.ascii_lowercase[i % 26]}w{i}" for i in range(num_terms)]
+    by_bucket = {}
+    for word, doc_postings in zip(vocabulary, synthetic_postings(num_docs, num_terms, seed).values()):
+        by_bucket.setdefault(word[0], []).append((word, from_postings_dict(doc_postings)))
+
+    index_dir = os.path.join(directory, 'main_index')
+    os.makedirs(index_dir)
+    for bucket_key in BUCKET_KEYS:
+        with BucketWriter(index_dir, bucket_key, impact_ordered) as writer:
+            for word, postings in sorted(by_bucket.get(bucket_key, [])):
+                impact_payload = encode_impact_postings(postings) if impact_ordered else b''
+                writer.add_term(word, len(postings), encode_postings(postings), max_term_weight(postings),
+                                int(postings.freqs.sum()), impact_payload)
+    write_url_file(os.path.join(directory, 'url_id_index.bin'),
+                   [f"https://www.ics.uci.edu/page{i}" for i in range(1, num_docs + 1)])
+    return vocabulary
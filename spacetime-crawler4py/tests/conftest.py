@@ -0,0 +1,122 @@
+import configparser
+import json
+import logging
+import os
+import random
+import string
+import subprocess
+import sys
+
+import pytest
+
+# the modules live in the directory above and import each other by name
+SOURCE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SOURCE_DIR)
+
+from synthetic import write_synthetic_index
+
+
+@pytest.fixture(autouse=True)
+def logs_in_tmp_path(tmp_path, monkeypatch):
+    """Points the log files of the loggers from utils.get_logger at
+    tmp_path/Logs, so tests leave the Logs/ of the source tree alone."""
+    logs_dir = tmp_path / 'Logs'
+    logs_dir.mkdir()
+    opened = []
+    for logger in list(logging.Logger.manager.loggerDict.values()):
+        if not isinstance(logger, logging.Logger):
+            continue
+        handlers = []
+        for handler in logger.handlers:
+            if isinstance(handler, logging.FileHandler):
+                replacement = logging.FileHandler(logs_dir / os.path.basename(handler.baseFilename), delay=True)
+                replacement.setLevel(handler.level)
+                replacement.setFormatter(handler.formatter)
+                opened.append(replacement)
+                handler = replacement
+            handlers.append(handler)
+        monkeypatch.setattr(logger, 'handlers', handlers)
+    yield logs_dir
+    for handler in opened:
+        handler.close()
+
+
+def synthetic_words(count, seed=0):
+    """Lowercase words of 4 to 9 letters, most frequent first."""
+    rng = random.Random(seed)
+    return [''.join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 9))) for _ in range(count)]
+
+
+def synthetic_page(rng, words, length=300):
+    """Html of a page over words, Zipf-distributed, long enough to be indexed."""
+    weights = [1 / (rank + 1) for rank in range(len(words))]
+    body = ' '.join(rng.choices(words, weights, k=length))
+    title = ' '.join(rng.choices(words, weights, k=4))
+    return (f"<html><head><title>{title}</title></head><body><h1>{title}</h1><p>{body}</p>"
+            f"<strong>{rng.choice(words)}</strong></body></html>")
+
+
+def write_page(json_dir, name, url, html_content):
+    path = os.path.join(json_dir, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'url': url, 'content': html_content, 'encoding': 'utf-8'}, f)
+    return path
+
+
+def write_corpus(json_dir, num_pages, seed=0):
+    """num_pages synthetic JSON documents in json_dir/d<i % 4>/<i>.json.
+    Returns their paths."""
+    rng = random.Random(seed)
+    words = synthetic_words(400, seed)
+    return [write_page(json_dir, os.path.join(f"d{i % 4}", f"{i}.json"), f"https://www.ics.uci.edu/page{i}",
+                       synthetic_page(rng, words))
+            for i in range(num_pages)]
+
+
+@pytest.fixture(scope='module')
+def synthetic_index(tmp_path_factory):
+    """(directory, vocabulary) of a synthetic index of 3000 documents,
+    written with impact-ordered postings too."""
+    directory = str(tmp_path_factory.mktemp('index'))
+    return directory, write_synthetic_index(directory, 3000, 2000, impact_ordered=True)
+
+
+def synthetic_queries(vocabulary, count, seed=0):
+    """A common word plus one to three rarer ones."""
+    rng = random.Random(seed)
+    return [' '.join([rng.choice(vocabulary[:50])] + rng.sample(vocabulary[:1000], rng.randint(1, 3)))
+            for _ in range(count)]
+
+
+def run_launch(work_dir, json_dir, incremental=False, settings=None, setup=''):
+    """
+    Runs launch.main over json_dir in a fresh interpreter with work_dir as
+    its working directory, where it writes the index: launch keeps the url
+    index and the indexer in module globals, so every build needs its own
+    process. settings are {(section, key): value} overrides of config.ini,
+    and setup is Python run before the build.
+    """
+    config = configparser.ConfigParser()
+    config.optionxform = str
+    config.read(os.path.join(SOURCE_DIR, 'config.ini'))
+    config['LOCAL PROPERTIES']['INGESTMODE'] = 'processes'
+    config['LOCAL PROPERTIES']['PROCESSCOUNT'] = '2'
+    for (section, key), value in (settings or {}).items():
+        config[section][key] = str(value)
+    with open(os.path.join(work_dir, 'config.ini'), 'w') as f:
+        config.write(f)
+
+    script = f"{setup}\nimport launch\nlaunch.main('config.ini', True, {str(json_dir)!r}, {incremental!r})\n"
+    env = dict(os.environ, PYTHONPATH=SOURCE_DIR)
+    subprocess.run([sys.executable, '-c', script], cwd=work_dir, env=env, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def open_query(work_dir, **options):
+    """A Query over the index in work_dir, text scores only and no result
+    cache unless options say otherwise."""
+    from query import Query
+    options.setdefault('cache_size', 0)
+    return Query(url_id_filename=os.path.join(work_dir, 'url_id_index.bin'),
+                 index_dir=os.path.join(work_dir, 'main_index'), **options)
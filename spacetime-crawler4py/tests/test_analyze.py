@@ -0,0 +1,49 @@
+import random
+import threading
+
+import analyze
+import tokenizer
+from analyze import CorpusStats
+
+
+def random_pages(count, seed=0):
+    rng = random.Random(seed)
+    pages = []
+    for i in range(count):
+        words = [f"w{int(rng.paretovariate(0.8))}" for _ in range(100)] + [f"new{i}"]
+        pages.append((f"https://www.ics.uci.edu/page{i % (count // 2)}", tokenizer.compute_word_frequencies(words)))
+    return pages
+
+
+def test_corpus_stats_match_union_freq():
+    pages = random_pages(200)
+    stats = CorpusStats()
+    word_freq = {}
+    for url, freq in pages:
+        stats.add_page(url, freq)
+        word_freq = tokenizer.union_freq(word_freq, freq)
+    assert stats.word_freq == word_freq
+    assert stats.unique_pages == {url for url, _ in pages}
+
+
+def test_stats_shards_combine_to_the_whole_corpus(monkeypatch):
+    monkeypatch.setattr(analyze, '_stats_shards', [])
+    monkeypatch.setattr(analyze, '_thread_state', threading.local())
+    pages = random_pages(200, seed=1)
+
+    def count(part):
+        for url, freq in part:
+            analyze.stats_shard().add_page(url, freq)
+
+    threads = [threading.Thread(target=count, args=(pages[i::4],)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    expected = CorpusStats()
+    for url, freq in pages:
+        expected.add_page(url, freq)
+    total = analyze.corpus_stats()
+    assert len(analyze._stats_shards) == 4
+    assert total.word_freq == expected.word_freq and total.unique_pages == expected.unique_pages
@@ -0,0 +1,77 @@
+import contextlib
+import io
+import os
+import random
+import string
+
+import pytest
+
+import index
+from binary_index import Lexicon, read_index_manifest
+from index import BatchIndexer
+
+
+@pytest.mark.parametrize('shard_mb', [1 << 20, 0.01])
+def test_every_term_found_through_the_shard_map(tmp_path, monkeypatch, shard_mb):
+    # sample the runs often enough to split these small buckets
+    monkeypatch.setattr(index, 'RUN_SAMPLE_BYTES', 1024)
+    rng = random.Random(5)
+    # most terms in a few buckets, as with English first letters
+    vocabulary = sorted({rng.choice('sssccp' + string.ascii_lowercase) +
+                         ''.join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 9))) for _ in range(3000)})
+    documents = [set(rng.sample(vocabulary, 40)) for _ in range(2000)]
+    indexer = BatchIndexer(output_dir=str(tmp_path / 'main_index'), temp_dir=str(tmp_path / 'temp'))
+    for doc_id, tokens in enumerate(documents, 1):
+        for token in tokens:
+            indexer.add_document(doc_id, token, 1, 0)
+        if doc_id % 500 == 0:
+            indexer.save_batch_to_disk()
+    indexer.save_batch_to_disk()
+    with contextlib.redirect_stdout(io.StringIO()):
+        indexer.merge_all_buckets(workers=1, shard_mb=shard_mb)
+
+    shards = read_index_manifest(indexer.output_dir)
+    buckets = {shard['bucket'] for shard in shards}
+    if shard_mb < 1:
+        # small shards split the large buckets into term ranges
+        assert len(shards) > len(buckets)
+    doc_freqs = {}
+    for tokens in documents:
+        for token in tokens:
+            doc_freqs[token] = doc_freqs.get(token, 0) + 1
+    lexicon = Lexicon(indexer.output_dir)
+    assert {term: lexicon.lookup(term).doc_freq for term in doc_freqs} == doc_freqs
+    assert lexicon.lookup('zzzzzzzzzzz') is None and lexicon.lookup('a') is None
+    lexicon.close()
+    assert not os.path.exists(tmp_path / 'temp') or not os.listdir(tmp_path / 'temp')
+
+
+def build(output_dir, temp_dir, documents):
+    indexer = BatchIndexer(output_dir=str(output_dir), temp_dir=str(temp_dir))
+    for doc_id, tokens in enumerate(documents, 1):
+        for token in tokens:
+            indexer.add_document(doc_id, token, 1, 0)
+    indexer.save_batch_to_disk()
+    with contextlib.redirect_stdout(io.StringIO()):
+        indexer.merge_all_buckets(workers=1)
+
+
+def test_lexicon_keeps_reading_a_replaced_build(tmp_path):
+    rng = random.Random(6)
+    vocabulary = [''.join(rng.choices(string.ascii_lowercase, k=6)) for _ in range(500)]
+    documents = [rng.sample(vocabulary, 50) for _ in range(300)]
+    build(tmp_path / 'main_index', tmp_path / 'temp', documents)
+    old = Lexicon(str(tmp_path / 'main_index'))
+    term = documents[0][0]
+    expected = old.postings(term).doc_ids.tolist()
+
+    # a smaller rebuild into the same directory must not touch the mapped files
+    build(tmp_path / 'main_index', tmp_path / 'temp', documents[:2])
+    assert old.postings(term).doc_ids.tolist() == expected
+    old.close()
+    new = Lexicon(str(tmp_path / 'main_index'))
+    assert new.postings(term).doc_ids.tolist() == [doc_id for doc_id in (1, 2) if term in documents[doc_id - 1]]
+    new.close()
+    # only the current build is left
+    builds = [name for name in os.listdir(tmp_path / 'main_index') if name.startswith(index.BUILD_PREFIX)]
+    assert len(builds) == 1
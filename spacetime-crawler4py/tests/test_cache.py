@@ -0,0 +1,60 @@
+import random
+
+import pytest
+
+from cache import EVICTION_POLICIES, PostingsCache
+
+
+class Value:
+    def __init__(self, nbytes):
+        self.nbytes = nbytes
+
+
+@pytest.mark.parametrize('policy', sorted(EVICTION_POLICIES))
+def test_postings_cache_stays_within_budget(policy):
+    rng = random.Random(0)
+    cache = PostingsCache(budget_bytes=1000, policy=policy)
+    values = {}
+    for _ in range(2000):
+        key = f"term{int(rng.paretovariate(1.0))}"
+        value = cache.get(key)
+        if value is None:
+            value = values.setdefault(key, Value(rng.randint(1, 300)))
+            cache.put(key, value)
+        else:
+            assert value is values[key]
+        stats = cache.stats()
+        assert stats['bytes'] == sum(size for size, _ in cache.entries.values()) <= 1000
+    assert stats['hits'] and stats['evictions']
+
+
+def test_postings_cache_rejects_oversized_values():
+    cache = PostingsCache(budget_bytes=100)
+    cache.put('small', Value(60))
+    cache.put('huge', Value(101))
+    assert cache.get('small') is not None and cache.get('huge') is None
+    assert cache.stats()['rejected'] == 1
+
+
+def test_lfu_keeps_frequent_keys_through_a_scan():
+    cache = PostingsCache(budget_bytes=300, policy='lfu')
+    cache.put('popular', Value(100))
+    for _ in range(5):
+        cache.get('popular')
+    for i in range(10):
+        cache.put(f"scan{i}", Value(100))
+    assert cache.get('popular') is not None
+
+
+def test_lru_evicts_least_recently_used():
+    cache = PostingsCache(budget_bytes=300, policy='lru')
+    for key in 'abc':
+        cache.put(key, Value(100))
+    cache.get('a')
+    cache.put('d', Value(100))
+    assert cache.get('b') is None and cache.get('a') is not None
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        PostingsCache(policy='fifo')
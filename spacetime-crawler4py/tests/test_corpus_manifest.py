@@ -0,0 +1,42 @@
+import json
+
+import corpus_manifest
+from corpus_manifest import indexed_url, read_url
+
+
+def write(tmp_path, text):
+    path = tmp_path / 'page.json'
+    path.write_text(text, encoding='utf-8')
+    return str(path)
+
+
+def test_read_url_of_document(tmp_path):
+    path = write(tmp_path, json.dumps({'url': 'https://www.ics.uci.edu/a', 'content': '<html></html>'}))
+    assert read_url(path) == 'https://www.ics.uci.edu/a'
+
+
+def test_read_url_skips_nested_url_keys(tmp_path):
+    document = {'meta': {'url': 'https://nested.example/'}, 'links': [{'url': 'https://listed.example/'}],
+                'url': 'https://www.ics.uci.edu/top', 'content': ''}
+    assert read_url(write(tmp_path, json.dumps(document))) == 'https://www.ics.uci.edu/top'
+
+
+def test_read_url_skips_url_inside_strings(tmp_path):
+    document = {'note': 'a "url": "https://fake.example/" in text', 'url': 'https://www.ics.uci.edu/real'}
+    assert read_url(write(tmp_path, json.dumps(document))) == 'https://www.ics.uci.edu/real'
+
+
+def test_read_url_after_head(tmp_path, monkeypatch):
+    monkeypatch.setattr(corpus_manifest, 'HEAD_BYTES', 64)
+    document = {'content': 'x' * 200, 'url': 'https://www.ics.uci.edu/late'}
+    assert read_url(write(tmp_path, json.dumps(document))) == 'https://www.ics.uci.edu/late'
+
+
+def test_read_url_missing(tmp_path):
+    assert read_url(write(tmp_path, json.dumps({'meta': {'url': 'https://nested.example/'}}))) is None
+
+
+def test_indexed_url(tmp_path):
+    path = write(tmp_path, json.dumps({'url': 'https://www.ics.uci.edu/a#part', 'content': ''}))
+    assert indexed_url(path) == 'https://www.ics.uci.edu/a'
+    assert indexed_url(write(tmp_path, '{"url": ')) is None
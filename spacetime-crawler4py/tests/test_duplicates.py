@@ -0,0 +1,75 @@
+import os
+import random
+import subprocess
+import sys
+
+from conftest import SOURCE_DIR, open_query, run_launch, synthetic_page, synthetic_words, write_corpus, write_page
+from duplicates import DuplicateDetector, simhash, token_hashes
+
+WORDS = synthetic_words(300)
+
+
+def page_tokens(rng, count=200):
+    return {word: 1 for word in rng.sample(WORDS, count)}
+
+
+def test_token_hashes_match_across_processes():
+    tokens = WORDS[:50]
+    script = ("from duplicates import token_hashes\n"
+              f"print(' '.join(map(str, token_hashes({tokens!r}).tolist())))")
+    output = subprocess.run([sys.executable, '-c', script], cwd=SOURCE_DIR, capture_output=True, text=True,
+                            check=True).stdout
+    assert output.split() == [str(value) for value in token_hashes(tokens).tolist()]
+
+
+def test_exact_and_near_duplicates():
+    rng = random.Random(1)
+    detector = DuplicateDetector(max_distance=3)
+    freq = page_tokens(rng)
+    assert detector.check('a', 'text of a', freq) is None
+    assert detector.check('b', 'text of a', {'other': 1}) == 'a'
+
+    near = dict(freq)
+    near.pop(next(iter(near)))
+    assert bin(simhash(freq) ^ simhash(near)).count('1') <= 3
+    assert detector.check('c', 'text of c', near) == 'a'
+    assert detector.check('d', 'text of d', page_tokens(rng)) is None
+    assert [(url, original) for url, original, _ in detector.found()] == [('b', 'a'), ('c', 'a')]
+
+
+def test_detection_off():
+    detector = DuplicateDetector(max_distance=-1)
+    freq = page_tokens(random.Random(2))
+    assert detector.check('a', 'same', freq) is None
+    assert detector.check('b', 'same', freq) is None
+
+
+def test_duplicates_found_across_chunks(tmp_path):
+    json_dir = tmp_path / 'json'
+    paths = write_corpus(str(json_dir), 40)
+    # copies of pages of the first chunks, under other urls
+    rng = random.Random(3)
+    for i, path in enumerate(paths[:5]):
+        with open(path, encoding='utf-8') as f:
+            content = f.read()
+        copy = content.replace(f'page{i}"', f'copy{i}"')
+        with open(os.path.join(json_dir, 'd3', f'z{i}.json'), 'w', encoding='utf-8') as f:
+            f.write(copy)
+    write_page(str(json_dir), os.path.join('d3', 'zunique.json'), 'https://www.ics.uci.edu/unique',
+               synthetic_page(rng, synthetic_words(400, 9)))
+
+    run_launch(str(tmp_path), str(json_dir), setup='import ingest\ningest.CHUNK_SIZE = 10')
+
+    with open(tmp_path / 'duplicates.txt', encoding='utf-8') as report:
+        found = [line.split('\t')[:2] for line in report.read().splitlines()]
+    assert len(found) == 5
+    assert {url.replace('copy', 'page') for pair in found for url in pair} == {
+        f'https://www.ics.uci.edu/page{i}' for i in range(5)}
+
+    # the copies are not indexed and do not count as documents
+    query = open_query(str(tmp_path))
+    assert query.total_docs == 41
+    # one of each pair of copies matches words of the first vocabulary
+    results = query.query_batch([' '.join(WORDS[20:25])], k=100)[0]
+    assert len(results) == 40
+    assert not {url for url, _ in found} & {url for url, _ in results}
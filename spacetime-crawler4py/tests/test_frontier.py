@@ -0,0 +1,39 @@
+import os
+from types import SimpleNamespace
+
+from conftest import write_corpus
+from crawler import frontier as frontier_module
+from crawler.frontier import Frontier
+from utils import normalize
+
+
+def drain(frontier):
+    urls = set()
+    while (url := frontier.get_tbd_url()) is not None:
+        urls.add(url)
+    return urls
+
+
+def test_frontier_resumes_from_checkpoint_and_log(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(frontier_module, 'CHECKPOINT_EVERY', 7)
+    paths = write_corpus(tmp_path / 'corpus', 30)
+    config = SimpleNamespace(json_dir=str(tmp_path / 'corpus'), save_file=str(tmp_path / 'frontier.shelve'),
+                             manifest_file=str(tmp_path / 'manifest.json'))
+
+    frontier = Frontier(config, restart=True)
+    assert drain(frontier) == {normalize(path) for path in paths}
+    for path in paths[:20]:
+        frontier.mark_url_complete(path)
+    # a crash: changes since the last checkpoint are only in the log,
+    # whose last line was cut short
+    assert frontier.dirty
+    frontier.log.write('["cut short')
+    frontier.log.close()
+    frontier.save.close()
+
+    resumed = Frontier(config, restart=False)
+    assert drain(resumed) == {normalize(path) for path in paths[20:]}
+    assert not os.path.exists(resumed.log_file) or os.path.getsize(resumed.log_file) == 0
+    resumed.close()
+    assert not os.path.exists(resumed.log_file)
@@ -0,0 +1,87 @@
+import contextlib
+import io
+import random
+import string
+
+import pytest
+
+import index
+from binary_index import Lexicon
+from index import BatchIndexer
+
+
+def random_documents(count, seed=0):
+    rng = random.Random(seed)
+    vocabulary = [''.join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 8))) for _ in range(2000)]
+    return [{token: rng.randint(1, 5) for token in rng.sample(vocabulary, 60)} for _ in range(count)]
+
+
+def build(directory, documents, batch_every=None, batch_mb=index.DEFAULT_BATCH_MB, **merge_options):
+    """Indexes documents ({token: frequency}, doc IDs from 1) into
+    directory/main_index, saving a batch every batch_every documents."""
+    indexer = BatchIndexer(output_dir=str(directory / 'main_index'), temp_dir=str(directory / 'temp'),
+                           batch_mb=batch_mb)
+    for doc_id, freq in enumerate(documents, 1):
+        for token, count in freq.items():
+            indexer.add_document(doc_id, token, count, ['important'] if count == 5 else [], list(range(count)))
+        if batch_every and doc_id % batch_every == 0:
+            indexer.save_batch_to_disk()
+    indexer.save_batch_to_disk()
+    with contextlib.redirect_stdout(io.StringIO()):
+        indexer.merge_all_buckets(**merge_options)
+    return indexer
+
+
+def lexicon_contents(directory):
+    """{term: (doc freq, coll freq, max weight, doc IDs, freqs, fields,
+    positions, impact-ordered payload)} of the index in directory/main_index."""
+    lexicon = Lexicon(str(directory / 'main_index'))
+    contents = {}
+    for _, readers in lexicon.shards.values():
+        for reader in readers:
+            for term, entry in reader.items():
+                postings = lexicon.postings(term, entry)
+                contents[term] = (entry.doc_freq, entry.coll_freq, entry.max_weight, postings.doc_ids.tolist(),
+                                  postings.freqs.tolist(), postings.fields.tolist(),
+                                  [postings.positions(i).tolist() for i in range(len(postings))],
+                                  bytes(lexicon.read_impacts(term, entry) or b''))
+    lexicon.close()
+    return contents
+
+
+def test_parallel_sharded_merge_matches_one_process(tmp_path, monkeypatch):
+    # sample the runs often enough to split the buckets into shards
+    monkeypatch.setattr(index, 'RUN_SAMPLE_BYTES', 1024)
+    documents = random_documents(1500)
+    options = {'impact_ordered': True, 'shard_mb': 0.02}
+    (tmp_path / 'serial').mkdir()
+    (tmp_path / 'parallel').mkdir()
+    serial = build(tmp_path / 'serial', documents, batch_every=400, workers=1, **options)
+    parallel = build(tmp_path / 'parallel', documents, batch_every=400, workers=4, **options)
+
+    shards = parallel.get_final_stats()
+    assert len(shards) > len(index.BUCKET_KEYS) and shards == serial.get_final_stats()
+    assert lexicon_contents(tmp_path / 'parallel') == lexicon_contents(tmp_path / 'serial')
+
+
+def test_batches_flushed_by_memory_budget_merge_like_one_batch(tmp_path):
+    documents = random_documents(600, seed=1)
+    (tmp_path / 'flushed').mkdir()
+    (tmp_path / 'unflushed').mkdir()
+    flushed = build(tmp_path / 'flushed', documents, batch_mb=0.5, workers=1)
+    unflushed = build(tmp_path / 'unflushed', documents, workers=1)
+
+    stats = flushed.flush_stats()
+    assert stats['batches'] > 1 and unflushed.flush_stats()['batches'] == 1
+    # every batch was flushed at the budget, only the last one below it
+    assert all(flush['estimated_bytes'] >= flushed.batch_budget_bytes for flush in flushed.flushes[:-1])
+    assert lexicon_contents(tmp_path / 'flushed') == lexicon_contents(tmp_path / 'unflushed')
+
+
+def test_batch_writer_error_reaches_the_caller(tmp_path, monkeypatch):
+    def fail(self, *batch):
+        raise OSError('disk full')
+
+    monkeypatch.setattr(BatchIndexer, '_write_batch', fail)
+    with pytest.raises(OSError, match='disk full'):
+        build(tmp_path, random_documents(200, seed=2), batch_mb=0.2, workers=1)
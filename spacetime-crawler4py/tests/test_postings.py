@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+
+from postings import (IMPORTANT, SKIP_BLOCK, SKIP_MIN_DOCS, PostingsList, decode_postings, decode_varints,
+                      encode_postings, encode_varints, near_doc_ids, phrase_doc_ids, probe_postings)
+
+
+def random_postings(rng, count, max_gap=50):
+    doc_ids = np.cumsum(rng.integers(1, max_gap, count))
+    freqs = rng.integers(1, 300, count)
+    fields = np.where(rng.random(count) < 0.1, IMPORTANT, 0)
+    return PostingsList(doc_ids, freqs, fields)
+
+
+@pytest.mark.parametrize('values', [[], [0], [127, 128, 16383, 16384], list(range(0, 200, 3)),
+                                    [2 ** 63 - 1, 1, 2 ** 35] * 30])
+def test_varints_round_trip(values):
+    assert decode_varints(encode_varints(values)).tolist() == values
+
+
+@pytest.mark.parametrize('count', [1, 63, 64, SKIP_MIN_DOCS - 1, SKIP_MIN_DOCS, 5000])
+def test_postings_round_trip(count):
+    rng = np.random.default_rng(count)
+    postings = random_postings(rng, count)
+    decoded = decode_postings(encode_postings(postings))
+    assert decoded.doc_ids.tolist() == postings.doc_ids.tolist()
+    assert decoded.freqs.tolist() == postings.freqs.tolist()
+    assert decoded.fields.tolist() == postings.fields.tolist()
+    assert not decoded.has_positions
+
+
+def test_large_doc_ids_round_trip():
+    postings = PostingsList(np.array([1, 2 ** 31, 2 ** 40]), np.array([1, 2, 3]), np.array([0, IMPORTANT, 0]))
+    assert decode_postings(encode_postings(postings)).doc_ids.tolist() == [1, 2 ** 31, 2 ** 40]
+
+
+def positional_postings(documents):
+    """{term: decoded PostingsList with positions} of token lists, by doc ID from 1."""
+    occurrences = {}
+    for doc_id, tokens in enumerate(documents, 1):
+        for position, token in enumerate(tokens):
+            occurrences.setdefault(token, {}).setdefault(doc_id, []).append(position)
+    lists = {}
+    for term, by_doc in occurrences.items():
+        doc_ids = sorted(by_doc)
+        postings = PostingsList(np.array(doc_ids), np.array([len(by_doc[d]) for d in doc_ids]),
+                                np.zeros(len(doc_ids), dtype=np.int64),
+                                np.array([p for d in doc_ids for p in by_doc[d]]))
+        lists[term] = decode_postings(encode_postings(postings))
+    return lists
+
+
+@pytest.fixture
+def documents():
+    rng = np.random.default_rng(4)
+    return [rng.choice(list('abcdef'), rng.integers(1, 40)).tolist() for _ in range(300)]
+
+
+def test_positions_round_trip(documents):
+    for term, postings in positional_postings(documents).items():
+        for i, doc_id in enumerate(postings.doc_ids.tolist()):
+            tokens = documents[doc_id - 1]
+            assert postings.positions(i).tolist() == [p for p, token in enumerate(tokens) if token == term]
+
+
+def test_phrase_and_near_doc_ids(documents):
+    lists = positional_postings(documents)
+    phrase = ['a', 'b', 'c']
+    expected = [doc_id for doc_id, tokens in enumerate(documents, 1)
+                if any(tokens[i:i + 3] == phrase for i in range(len(tokens)))]
+    assert phrase_doc_ids([lists[term] for term in phrase]).tolist() == expected
+
+    expected = [doc_id for doc_id, tokens in enumerate(documents, 1)
+                if any(abs(i - j) <= 2 for i, x in enumerate(tokens) if x == 'd'
+                       for j, y in enumerate(tokens) if y == 'e')]
+    assert near_doc_ids(lists['d'], lists['e'], 2).tolist() == expected
+
+
+@pytest.mark.parametrize('count', [100, SKIP_MIN_DOCS, 20000])
+def test_probe_postings_matches_full_decode(count):
+    rng = np.random.default_rng(count)
+    postings = random_postings(rng, count)
+    data = encode_postings(postings)
+    probes = np.unique(rng.integers(1, int(postings.doc_ids[-1]) + 100, 40))
+    present, freqs, fields, decoded = probe_postings(data, probes)
+    expected = decode_postings(data).find(probes)
+    assert present.tolist() == expected[0].tolist()
+    assert freqs.tolist() == expected[1].tolist() and fields.tolist() == expected[2].tolist()
+    if count >= SKIP_MIN_DOCS:
+        # only the blocks that can hold a probe are decoded
+        assert decoded <= min(count, len(probes) * SKIP_BLOCK)
@@ -0,0 +1,193 @@
+import json
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import query
+from binary_index import write_generation, write_static_scores
+from conftest import open_query, run_launch, synthetic_queries, synthetic_words, write_corpus
+from query import Query
+from synthetic import write_synthetic_index
+
+
+@pytest.fixture
+def engine(synthetic_index):
+    directory, _ = synthetic_index
+    engine = open_query(directory)
+    yield engine
+    engine.lexicon.close()
+    engine.url_mapping.close()
+
+
+def assert_same_ranking(results, expected):
+    """Same scores, and the same pages above the k-th score; pages tied
+    with the k-th one may be any of them."""
+    assert [score for _, score in results] == pytest.approx([score for _, score in expected])
+    if expected:
+        cutoff = expected[-1][1] + 1e-9
+        assert {url for url, score in results if score > cutoff} == {url for url, score in expected
+                                                                     if score > cutoff}
+
+
+def test_top_k_matches_exhaustive_scoring(engine, synthetic_index):
+    _, vocabulary = synthetic_index
+    pruned = 0
+    for q in synthetic_queries(vocabulary, 200):
+        exhaustive = engine.query(q, exhaustive=True)
+        scored = engine.last_query_stats['postings_scored']
+        assert_same_ranking(engine.query(q), exhaustive)
+        pruned += engine.last_query_stats['postings_scored'] < scored
+    # MaxScore must actually skip postings on these queries
+    assert pruned
+
+
+def test_impact_ordered_matches_exhaustive_scoring(engine, synthetic_index, monkeypatch):
+    _, vocabulary = synthetic_index
+    rng = random.Random(1)
+    calls = []
+    score_impact_ordered = Query._score_impact_ordered
+
+    def counted(self, *args):
+        calls.append(args)
+        return score_impact_ordered(self, *args)
+
+    monkeypatch.setattr(Query, '_score_impact_ordered', counted)
+    queries = [' '.join(rng.sample(vocabulary[:100], words)) for words in (1, 2) for _ in range(50)]
+    for q in queries:
+        assert_same_ranking(engine.query(q), engine.query(q, exhaustive=True))
+    assert len(calls) == len(queries)
+
+
+def test_result_cache_invalidated_by_new_generation(tmp_path):
+    vocabulary = write_synthetic_index(str(tmp_path), 500, 300)
+    engine = open_query(str(tmp_path), cache_size=16)
+    q = f"{vocabulary[3]} {vocabulary[40]}"
+    results = engine.query(q)
+    # the same words in another order and case share the entry
+    assert engine.query(f"{vocabulary[40].upper()} {vocabulary[3]}") == results
+    assert engine.result_cache.stats()['hits'] == 1
+
+    write_generation(str(tmp_path / 'main_index'))
+    assert engine.query(q) == results
+    stats = engine.result_cache.stats()
+    assert (stats['hits'], stats['misses'], stats['entries']) == (1, 2, 1)
+    engine.lexicon.close()
+    engine.url_mapping.close()
+
+
+
+@pytest.mark.parametrize('k', [5, 20])
+def test_query_batch_matches_exhaustive_scoring(engine, synthetic_index, k):
+    _, vocabulary = synthetic_index
+    queries = synthetic_queries(vocabulary, 100, seed=2) + ['', 'unknownword']
+    for results, q in zip(engine.query_batch(queries, k), queries):
+        assert_same_ranking(results, engine._rank(*engine._parse(q), exhaustive=True, k=k))
+
+
+def test_concurrent_queries_across_reopens(tmp_path):
+    vocabulary = write_synthetic_index(str(tmp_path), 1000, 500)
+    engine = open_query(str(tmp_path), cache_size=32)
+    queries = synthetic_queries(vocabulary, 60, seed=3)
+    expected = [engine.query(q, exhaustive=True) for q in queries]
+
+    def run(i):
+        return engine.query(queries[i % len(queries)], exhaustive=True)
+
+    with ThreadPoolExecutor(8) as pool:
+        running = pool.map(run, range(600))
+        # merges publishing new generations reopen the index under the queries
+        for _ in range(10):
+            write_generation(str(tmp_path / 'main_index'))
+            time.sleep(0.005)
+        results = list(running)
+    assert results == [expected[i % len(queries)] for i in range(600)]
+    engine.lexicon.close()
+    engine.url_mapping.close()
+
+
+def test_query_open_during_a_rebuild(tmp_path):
+    words = synthetic_words(400)
+    queries = [*words[5:40:5], ' '.join(words[10:13])]
+    write_corpus(str(tmp_path / 'large'), 120)
+    write_corpus(str(tmp_path / 'small'), 3)
+    work_dir = tmp_path / 'work'
+    work_dir.mkdir()
+    run_launch(str(work_dir), str(tmp_path / 'large'))
+    engine = open_query(str(work_dir))
+    before = engine.query_batch(queries, k=1000)
+
+    def postings_sizes(lexicon):
+        return {term: len(lexicon.postings(term)) for _, readers in lexicon.shards.values()
+                for reader in readers for term, _ in reader.items()}
+
+    sizes = postings_sizes(engine.lexicon)
+    # a smaller build into the same directory, as with a server running
+    run_launch(str(work_dir), str(tmp_path / 'small'))
+    # the index still open reads the previous build until it reopens
+    assert postings_sizes(engine.lexicon) == sizes
+    results = engine.query_batch(queries, k=1000)
+    fresh = open_query(str(work_dir))
+    assert results == fresh.query_batch(queries, k=1000) != before
+    assert {url for page in results for url, _ in page} <= {f"https://www.ics.uci.edu/page{i}" for i in range(3)}
+    for query_engine in (engine, fresh):
+        query_engine.lexicon.close()
+        query_engine.url_mapping.close()
+
+
+def test_static_scores_match_page_ranks_by_url(tmp_path):
+    vocabulary = write_synthetic_index(str(tmp_path), 500, 300)
+    rng = random.Random(4)
+    ranks = [rng.random() * 3 for _ in range(500)]
+    urls = [f"https://www.ics.uci.edu/page{i}" for i in range(1, 501)]
+    page_rank_file = tmp_path / 'page_rank.json'
+    page_rank_file.write_text(json.dumps(dict(zip(urls, ranks))))
+    # the file written for fewer documents than the index holds
+    write_static_scores(str(tmp_path / 'static_scores.bin'), ranks[:400])
+
+    by_doc = open_query(str(tmp_path), static_scores_filename=str(tmp_path / 'static_scores.bin'))
+    by_url = open_query(str(tmp_path), page_rank_filename=str(page_rank_file))
+    assert [by_doc.static_scores.values[doc_id] for doc_id in range(1, 501)] == \
+        pytest.approx(ranks[:400] + [0.0] * 100, abs=1e-6)
+    assert [by_url.static_scores.values[doc_id] for doc_id in range(1, 501)] == pytest.approx(ranks, abs=1e-6)
+
+    text_only = open_query(str(tmp_path))
+    q = f"{vocabulary[5]} {vocabulary[60]}"
+    text_scores = dict(text_only._rank(*text_only._parse(q), exhaustive=True, k=500))
+    for url, score in by_url.query(q, exhaustive=True):
+        assert score == pytest.approx(text_scores[url] + ranks[urls.index(url)], abs=1e-5)
+    for engine in (by_doc, by_url, text_only):
+        engine.lexicon.close()
+        engine.url_mapping.close()
+
+
+def test_shared_engine_ranks_with_static_scores(tmp_path, monkeypatch):
+    write_synthetic_index(str(tmp_path), 100, 50)
+    write_static_scores(str(tmp_path / 'static_scores.bin'), [float(i) for i in range(100)])
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(query, '_engine', None)
+    engine = query.get_query_engine()
+    assert engine is query.get_query_engine()
+    assert engine.static_scores.values[100] == 99.0
+    engine.lexicon.close()
+    engine.url_mapping.close()
+
+
+def test_conjunctive_ranks_pages_with_every_word_first(engine, synthetic_index):
+    _, vocabulary = synthetic_index
+    rng = random.Random(5)
+    fallbacks = 0
+    for _ in range(60):
+        words = [rng.choice(vocabulary[100:1000]), rng.choice(vocabulary[:5])]
+        q = ' '.join(words)
+        ranked = engine._rank(*engine._parse(q), exhaustive=True, k=3000)
+        holding_all = set.intersection(*({engine.url_mapping.get(int(doc_id))
+                                          for doc_id in engine._get_postings(word).doc_ids} for word in words))
+        expected = [(url, score) for url, score in ranked if url in holding_all][:5]
+        # too few pages hold every word: the rest come from the ranking of any
+        expected += [(url, score) for url, score in ranked if url not in holding_all][:5 - len(expected)]
+        assert_same_ranking(engine.query(q, conjunctive=True), expected)
+        fallbacks += len(holding_all) < 5
+    # both cases come up
+    assert 0 < fallbacks < 60
@@ -0,0 +1,159 @@
+import json
+import os
+import random
+
+import pytest
+
+from conftest import open_query, run_launch, synthetic_page, synthetic_words, write_corpus, write_page
+from index import URLIndex
+from segments import SegmentSet, read_segments
+
+WORDS = synthetic_words(400)
+QUERIES = [*WORDS[5:40:5], ' '.join(WORDS[10:13]), ' '.join(WORDS[50:54]), ' '.join(WORDS[100:102])]
+NO_DUPLICATES = {('INDEX', 'DUPLICATEBITS'): -1}
+
+
+def mutate(paths, json_dir):
+    """Removes, changes and adds pages, and turns one into a file that is
+    not indexed; returns the path of that one."""
+    rng = random.Random(7)
+    for path in paths[:3]:
+        os.remove(path)
+    for path in paths[3:6]:
+        with open(path, encoding='utf-8') as f:
+            document = json.load(f)
+        document['content'] = synthetic_page(rng, WORDS)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(document, f)
+    for i in range(3):
+        write_page(json_dir, os.path.join('d1', f'new{i}.json'), f'https://www.ics.uci.edu/new{i}',
+                   synthetic_page(rng, WORDS))
+    return break_page(paths[6])
+
+
+def break_page(path):
+    """Cuts the content of a page below what is indexed."""
+    with open(path, encoding='utf-8') as f:
+        document = json.load(f)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'url': document['url'], 'content': 'short'}, f)
+    return document
+
+
+def all_results(query):
+    """{url: score} of every page matching each query."""
+    return [{url: round(score, 9) for url, score in results}
+            for results in query.query_batch(QUERIES, k=1000)]
+
+
+def matching(results):
+    """The urls matching each query. Until a merge, document frequencies
+    still count deleted pages, so only a merged index scores like a full
+    build."""
+    return [set(urls) for urls in results]
+
+
+def reference(tmp_path, json_dir):
+    """Results and document count of a full build of json_dir."""
+    work_dir = tmp_path / 'reference'
+    work_dir.mkdir()
+    run_launch(str(work_dir), json_dir, settings=NO_DUPLICATES)
+    query = open_query(str(work_dir))
+    return all_results(query), query.total_docs
+
+
+@pytest.fixture
+def indexed(tmp_path):
+    """A full build of a corpus, then changes to the corpus."""
+    json_dir = str(tmp_path / 'json')
+    paths = write_corpus(json_dir, 80)
+    work_dir = tmp_path / 'work'
+    work_dir.mkdir()
+    return json_dir, paths, work_dir
+
+
+def test_update_matches_full_build(tmp_path, indexed):
+    json_dir, paths, work_dir = indexed
+    run_launch(str(work_dir), json_dir, settings=NO_DUPLICATES)
+    mutate(paths, json_dir)
+    run_launch(str(work_dir), json_dir, incremental=True, settings=NO_DUPLICATES)
+
+    segments = read_segments(str(work_dir / 'main_index'))
+    assert len(segments['segments']) == 2
+    query = open_query(str(work_dir))
+    results, total_docs = reference(tmp_path, json_dir)
+    assert (matching(all_results(query)), query.total_docs) == (matching(results), total_docs)
+    assert total_docs == 80 - 3 + 3 - 1
+
+
+def test_update_merged_before_it_returns(tmp_path, indexed):
+    json_dir, paths, work_dir = indexed
+    settings = {**NO_DUPLICATES, ('INDEX', 'MERGEFACTOR'): 2}
+    run_launch(str(work_dir), json_dir, settings=settings)
+    mutate(paths, json_dir)
+    run_launch(str(work_dir), json_dir, incremental=True, settings=settings)
+
+    index_dir = work_dir / 'main_index'
+    segments = read_segments(str(index_dir))
+    assert len(segments['segments']) == 1 and not segments['deleted']
+    merged = segments['segments'][0]['name']
+    assert sorted(name for name in os.listdir(index_dir) if name.startswith('segment_')) == [merged]
+    query = open_query(str(work_dir))
+    assert (all_results(query), query.total_docs) == reference(tmp_path, json_dir)
+
+
+def test_failed_merge_raises_and_leaves_index(tmp_path, indexed, monkeypatch, logs_in_tmp_path):
+    json_dir, paths, work_dir = indexed
+    run_launch(str(work_dir), json_dir, settings=NO_DUPLICATES)
+    mutate(paths, json_dir)
+    run_launch(str(work_dir), json_dir, incremental=True, settings=NO_DUPLICATES)
+    index_dir = str(work_dir / 'main_index')
+    before = read_segments(index_dir), sorted(os.listdir(index_dir))
+
+    def fail(*args):
+        raise OSError('disk full')
+
+    monkeypatch.setattr(SegmentSet, '_write_merged', fail)
+    segments = SegmentSet(index_dir, merge_factor=2)
+    segments.start_merging()
+    with pytest.raises(OSError, match='disk full'):
+        segments.wait_for_merges()
+    assert (read_segments(index_dir), sorted(os.listdir(index_dir))) == before
+    assert 'Segment merge failed: disk full' in (logs_in_tmp_path / 'SEGMENTS.log').read_text()
+
+
+def test_page_that_stops_and_resumes_being_indexed(tmp_path, indexed):
+    json_dir, paths, work_dir = indexed
+    run_launch(str(work_dir), json_dir, settings=NO_DUPLICATES)
+    document = break_page(paths[10])
+    run_launch(str(work_dir), json_dir, incremental=True, settings=NO_DUPLICATES)
+    query = open_query(str(work_dir))
+    assert query.total_docs == 79
+    assert document['url'] not in {url for results in all_results(query) for url in results}
+
+    with open(paths[10], 'w', encoding='utf-8') as f:
+        json.dump(document, f)
+    run_launch(str(work_dir), json_dir, incremental=True, settings=NO_DUPLICATES)
+    query = open_query(str(work_dir))
+    results, total_docs = reference(tmp_path, json_dir)
+    assert (matching(all_results(query)), query.total_docs) == (matching(results), total_docs)
+    assert total_docs == 80
+
+
+def test_page_moved_to_another_url(tmp_path, indexed):
+    json_dir, paths, work_dir = indexed
+    run_launch(str(work_dir), json_dir, settings=NO_DUPLICATES)
+    with open(paths[20], encoding='utf-8') as f:
+        document = json.load(f)
+    old_url, document['url'] = document['url'], 'https://www.ics.uci.edu/moved'
+    with open(paths[20], 'w', encoding='utf-8') as f:
+        json.dump(document, f)
+    run_launch(str(work_dir), json_dir, incremental=True, settings=NO_DUPLICATES)
+
+    url_index = URLIndex()
+    url_index.load(str(work_dir / 'url_id_index.bin'))
+    assert old_url not in url_index.ids and 'https://www.ics.uci.edu/moved' in url_index.ids
+    assert url_index.live_count() == 80
+    query = open_query(str(work_dir))
+    results, total_docs = reference(tmp_path, json_dir)
+    assert (matching(all_results(query)), query.total_docs) == (matching(results), total_docs)
@@ -0,0 +1,69 @@
+import random
+import re
+import string
+
+import pytest
+from nltk.stem import SnowballStemmer
+
+import tokenizer
+from stemmer import Stemmer
+
+
+def per_token_frequencies(text):
+    """compute_text_frequencies as it was before the stem table: every
+    token occurrence stemmed by Snowball (or the exceptions)."""
+    snowball = SnowballStemmer("english")
+    exceptions = Stemmer().exceptions
+    positions = {}
+    tokens = re.findall(r'\b[a-z0-9]{3,}\b', text.lower())
+    for position, token in enumerate(tokens):
+        word = exceptions.get(token) or snowball.stem(token)
+        positions.setdefault(word, []).append(position)
+    return len(tokens), {word: len(p) for word, p in positions.items()}, positions
+
+
+@pytest.fixture
+def texts():
+    rng = random.Random(6)
+    roots = [''.join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 8))) for _ in range(300)]
+    words = [root + suffix for root in roots for suffix in ('', 's', 'ing', 'ed', 'ation', 'ly')]
+    words += ['University', 'instances', 'categorical', 'a1b2', 'x', 'Databases']
+    return [' '.join(rng.choices(words, k=400)) + ' 2024, e-mail; UCI.' for _ in range(30)]
+
+
+@pytest.fixture
+def fresh_stemmer(monkeypatch):
+    def install(stemmer):
+        monkeypatch.setattr(tokenizer, 'stemmer', stemmer)
+        return stemmer
+    return install
+
+
+def test_stem_table_matches_per_token_stemming(texts, tmp_path, fresh_stemmer):
+    expected = [per_token_frequencies(text) for text in texts]
+    cold = fresh_stemmer(Stemmer())
+    assert [tokenizer.compute_text_frequencies(text) for text in texts] == expected
+
+    table_file = str(tmp_path / 'stem_table.json')
+    cold.save(table_file)
+    warm = fresh_stemmer(Stemmer())
+    warm.load(table_file)
+    assert len(warm.cache) == len(cold.cache)
+    assert [tokenizer.compute_text_frequencies(text) for text in texts] == expected
+
+
+def test_stem_table_is_bounded(texts, fresh_stemmer):
+    bounded = fresh_stemmer(Stemmer(max_entries=50))
+    expected = [per_token_frequencies(text) for text in texts]
+    assert [tokenizer.compute_text_frequencies(text) for text in texts] == expected
+    assert len(bounded.cache) == 50
+    bounded.update({'extra': 'extra'})
+    assert len(bounded.cache) == 50
+
+
+def test_entries_after_for_worker_tables():
+    stemmer = Stemmer()
+    stemmer.stem_all(['running', 'jumps'])
+    known = len(stemmer.cache)
+    stemmer.stem_all(['running', 'walked'])
+    assert stemmer.entries_after(known) == {'walked': 'walk'}
@@ -0,0 +1,44 @@
+import os
+import sys
+
+import pytest
+
+import query
+from conftest import SOURCE_DIR, open_query
+
+pytest.importorskip('flask')
+sys.path.insert(0, os.path.join(SOURCE_DIR, 'interface'))
+from web_interface import app  # noqa: E402
+
+
+@pytest.fixture
+def client(synthetic_index, monkeypatch):
+    directory, _ = synthetic_index
+    engine = open_query(directory)
+    monkeypatch.setattr(query, '_engine', engine)
+    yield app.test_client()
+    engine.lexicon.close()
+    engine.url_mapping.close()
+
+
+def test_api_search(client, synthetic_index):
+    _, vocabulary = synthetic_index
+    q = f"{vocabulary[2]} {vocabulary[30]}"
+    reply = client.get('/api/search', query_string={'q': q})
+    assert reply.status_code == 200
+    results = [(r['url'], r['score']) for r in reply.get_json()['results']]
+    assert results == query._engine.query(q)
+
+
+def test_api_search_conjunctive(client, synthetic_index):
+    _, vocabulary = synthetic_index
+    q = f"{vocabulary[2]} {vocabulary[30]}"
+    reply = client.get('/api/search', query_string={'q': q, 'mode': 'AND'})
+    results = [(r['url'], r['score']) for r in reply.get_json()['results']]
+    assert results == query._engine.query(q, conjunctive=True)
+
+
+def test_api_search_without_query(client):
+    reply = client.get('/api/search', query_string={'q': '  '})
+    assert reply.status_code == 400
+    assert 'error' in reply.get_json()
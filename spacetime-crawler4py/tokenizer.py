@@ -1,5 +1,10 @@
+import re
+from collections import Counter
+
 from stemmer import Stemmer
 
+# 3+ character alphanumeric sequences of lowercased text
+TOKEN_PATTERN = re.compile(r'\b[a-z0-9]{3,}\b')
 
 stemmer = Stemmer()
 
@@ -9,12 +14,14 @@ def compute_text_frequencies(text):
     Description: Streamlines the computation from text to frequency dictionary
 
     Input: The string to convert into a frequency dictionary
-    Output: The resulting dictionary
+    Output: The number of tokens, the frequency dictionary and the dictionary
+    of token positions (indexes into the token list) for each unique token
     """
     tokens = tokenize(text)
     if tokens is not None:
-        freq = compute_word_frequencies(tokens)
-        return len(tokens), freq
+        positions = compute_word_positions(tokens)
+        freq = {word: len(word_positions) for word, word_positions in positions.items()}
+        return len(tokens), freq, positions
     else:
         print('Please resolve the error and try again.')
         return None
@@ -27,10 +34,7 @@ def tokenize(content):
     Input: The string to tokenize
     Output: A list of tokens
     """
-    import re
-    # Extract 3+ character alphanumeric sequences
-    tokens = re.findall(r'\b[a-z0-9]{3,}\b', content.lower())
-    return tokens
+    return TOKEN_PATTERN.findall(content.lower())
 
 def tokenize_and_stem(content):
     """
@@ -40,7 +44,8 @@ def tokenize_and_stem(content):
     Output: A list of stemmed tokens
     """
     tokens = tokenize(content)
-    return [stemmer.stem(token) for token in tokens]
+    stems = stemmer.stem_all(set(tokens))
+    return [stems[token] for token in tokens]
 
 
 def compute_word_frequencies(tokens):
@@ -51,15 +56,39 @@ def compute_word_frequencies(tokens):
     Input: A list of tokens
     Output: The dictionary of frequency counts for each unique token
     """
+    # count the tokens as they are, then stem each distinct one once
+    counts = Counter(tokens)
     freq = {}
-    for token in tokens:
-        word = stemmer.stem(token)
-        if word not in freq:
-            freq[word] = 0
-        freq[word] += 1
+    for token, word in stemmer.stem_all(counts).items():
+        freq[word] = freq.get(word, 0) + counts[token]
     return freq
 
 
+def compute_word_positions(tokens):
+    """
+    Description: Turns list of tokens into a dictionary of the positions at
+    which each unique (stemmed) token occurs.
+
+    Input: A list of tokens
+    Output: The dictionary of ascending position lists for each unique token
+    """
+    # group the positions by token as it is, then stem each distinct one once
+    token_positions = {}
+    for position, token in enumerate(tokens):
+        if token in token_positions:
+            token_positions[token].append(position)
+        else:
+            token_positions[token] = [position]
+    positions = {}
+    for token, word in stemmer.stem_all(token_positions).items():
+        if word in positions:
+            # another form of a word seen earlier
+            positions[word] = sorted(positions[word] + token_positions[token])
+        else:
+            positions[word] = token_positions[token]
+    return positions
+
+
 def union_freq(freq1, freq2):
     """
     Description: Combines two dictionaries of frequency counts into one
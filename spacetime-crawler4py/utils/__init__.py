@@ -8,7 +8,8 @@ def get_logger(name, filename=None):
     logger.setLevel(logging.INFO)
     if not os.path.exists("Logs"):
         os.makedirs("Logs")
-    fh = logging.FileHandler(f"Logs/{filename if filename else name}.log")
+    # the file is only opened once something is logged, not on import
+    fh = logging.FileHandler(f"Logs/{filename if filename else name}.log", delay=True)
     fh.setLevel(logging.DEBUG)
     ch = logging.StreamHandler()
     ch.setLevel(logging.INFO)
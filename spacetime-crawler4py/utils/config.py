@@ -7,9 +7,20 @@ class Config(object):
         
         # Thread count
         self.threads_count = config.getint("LOCAL PROPERTIES", "THREADCOUNT", fallback=16)
+
+        # "threads" runs the crawler, "processes" indexes on a process pool (see ingest.py)
+        self.ingest_mode = config.get("LOCAL PROPERTIES", "INGESTMODE", fallback="threads")
+        self.processes_count = config.getint("LOCAL PROPERTIES", "PROCESSCOUNT", fallback=0)
         
         # Save file for progress
         self.save_file = config.get("LOCAL PROPERTIES", "SAVE", fallback="frontier.shelve")
+
+        # Cached path/size/mtime/url of every corpus file (empty to disable)
+        self.manifest_file = config.get("LOCAL PROPERTIES", "MANIFEST", fallback="corpus_manifest.json")
+
+        # Stem of every token seen, and the most tokens it holds in memory
+        self.stem_table_file = config.get("LOCAL PROPERTIES", "STEMTABLE", fallback="stem_table.json")
+        self.stem_table_entries = config.getint("LOCAL PROPERTIES", "STEMTABLEENTRIES", fallback=1000000)
         
         # Get JSON directory from config or will be set via command line
         self.json_dir = config.get("CRAWLER", "JSON_DIR", fallback="./json_files")
@@ -17,6 +28,27 @@ class Config(object):
         # Time delay between processing files
         self.time_delay = config.getfloat("CRAWLER", "POLITENESS", fallback=0.0)
 
+        # HTML parser backend used by document.process_document
+        self.html_parser = config.get("CRAWLER", "HTMLPARSER", fallback="html.parser")
+
+        # Parallelism and memory budget of the final bucket merge
+        self.merge_workers = config.getint("INDEX", "MERGEWORKERS", fallback=0)
+        self.merge_memory_mb = config.getint("INDEX", "MERGEMEMORY", fallback=512)
+        # Memory budget of the batch being filled before it is flushed
+        self.batch_mb = config.getfloat("INDEX", "BATCHMB", fallback=256)
+        # Target size of a merged shard
+        self.shard_mb = config.getfloat("INDEX", "SHARDMB", fallback=64)
+        # Bits apart for two pages to be near duplicates (-1 to index every page)
+        self.duplicate_bits = config.getint("INDEX", "DUPLICATEBITS", fallback=3)
+        # Adjacent segments of one size tier merged after incremental updates
+        self.merge_factor = config.getint("INDEX", "MERGEFACTOR", fallback=4)
+
+        # Also write postings in impact order, for early termination of short queries
+        self.impact_ordered = config.getboolean("INDEX", "IMPACTORDERED", fallback=False)
+
+        # Rank only indexed pages instead of every page seen in a link
+        self.page_rank_indexed_only = config.getboolean("INDEX", "PAGERANKINDEXEDONLY", fallback=False)
+
     def set_json_dir(self, json_dir):
         """Set JSON directory from command line argument"""
         self.json_dir = json_dir
\ No newline at end of file